@@ -0,0 +1,278 @@
+import os
+import threading
+import time
+from datetime import date
+from utils.storage import db
+from utils.billing import visit_day
+from utils.local_cache import get_cached_patient_index, get_cached_patients
+from utils.patients import ordered_records
+
+# Practice-wide reports over every visit. Visits are read once into a
+# columnar pandas DataFrame; every report after that is a vectorized
+# group-by over the columns instead of a loop over the patients tree.
+#
+# Visits come from a snapshot written by backup.py (e.g. last night's,
+# named by PEARLTRACK_ANALYTICS_SNAPSHOT) or else from the local cache,
+# never from a download of the whole patients tree. The cache only holds
+# patients opened on this workstation, so a report built from it says
+# how many patients it covers, and the dashboard asks before exporting one.
+ANALYTICS_SNAPSHOT_ENV = "PEARLTRACK_ANALYTICS_SNAPSHOT"
+
+# Seconds a loaded visits frame is reused before the patients are read again
+ANALYTICS_CACHE_TTL = 600
+
+# Age bands for visit counts, as [start, end) years
+AGE_BANDS = [0, 13, 18, 30, 45, 60, 200]
+AGE_BAND_LABELS = ['0-12', '13-17', '18-29', '30-44', '45-59', '60+']
+
+# Visit fields copied into the frame: text columns, then amounts
+TEXT_COLUMNS = ['gender', 'diagnosis', 'treatment']
+MONEY_COLUMNS = {'amount_charged': 'charged', 'amount_paid': 'paid', 'balance': 'balance'}
+
+_visits = None  # (loaded_at, source, DataFrame)
+_visits_lock = threading.Lock()
+
+
+def _pandas():
+    """pandas (and numpy) are only needed here, so they are imported on first use."""
+    try:
+        import pandas as pd
+    except ImportError:
+        raise ImportError("Analytics reports need pandas and numpy: pip install pandas") from None
+    return pd
+
+
+def visit_columns(patients):
+    """Flattens a patients tree into {column: list}, one entry per visit."""
+    columns = {name: [] for name in ['patient', 'visit_id', 'day', 'age'] + TEXT_COLUMNS}
+    columns.update({column: [] for column in MONEY_COLUMNS.values()})
+    for name, data in (patients or {}).items():
+        records = (data or {}).get('records') or {}
+        if isinstance(records, list):
+            records = {str(i): record for i, record in enumerate(records)}
+        for key, record in records.items():
+            if not record:
+                continue
+            columns['patient'].append(name)
+            columns['visit_id'].append(key)
+            columns['day'].append(visit_day(key))
+            columns['age'].append(record.get('age'))
+            for field in TEXT_COLUMNS:
+                columns[field].append(record.get(field))
+            for field, column in MONEY_COLUMNS.items():
+                columns[column].append(record.get(field))
+    return columns
+
+
+def snapshot_visit_columns(path):
+    """Reads the visits table of a backup.py snapshot into {column: list}.
+
+    Returns (columns, complete); complete is False for a snapshot cut short.
+    """
+    from utils.backup import read_snapshot
+
+    columns = {name: [] for name in ['patient', 'visit_id', 'day', 'age'] + TEXT_COLUMNS}
+    columns.update({column: [] for column in MONEY_COLUMNS.values()})
+    complete = False
+    try:
+        for line in read_snapshot(path):
+            if line.get('end'):
+                complete = True
+            elif line['table'] == 'visits':
+                batch = line['columns']
+                count = len(batch['visit_id'])
+                columns['patient'].extend(batch['patient'])
+                columns['visit_id'].extend(batch['visit_id'])
+                columns['day'].extend(visit_day(key) for key in batch['visit_id'])
+                for field in ['age'] + TEXT_COLUMNS:
+                    columns[field].extend(batch.get(field) or [None] * count)
+                for field, column in MONEY_COLUMNS.items():
+                    columns[column].extend(batch.get(field) or [None] * count)
+    except EOFError:
+        pass  # cut short inside a batch; the batches before it are kept
+    return columns, complete
+
+
+def cache_coverage(patients):
+    """(patients cached with every visit, patients in the cached index)."""
+    index = get_cached_patient_index()
+    complete = sum(1 for name, summary in index.items()
+                   if len(ordered_records((patients.get(name) or {}).get('records')))
+                   >= ((summary or {}).get('visits') or 0))
+    return complete, len(index)
+
+
+def visits_frame(columns):
+    """Builds the typed visits DataFrame from {column: list}."""
+    pd = _pandas()
+    visits = pd.DataFrame(columns)
+
+    # Visits are dated by their push-ID timestamp in local time, the same
+    # day billing.visit_day gives them; converted list records have none
+    visits['date'] = pd.to_datetime(visits.pop('day'), format='%Y-%m-%d')
+    visits['age'] = pd.to_numeric(visits['age'], errors='coerce')
+    for column in MONEY_COLUMNS.values():
+        visits[column] = pd.to_numeric(visits[column], errors='coerce').fillna(0.0)
+
+    visits['gender'] = visits['gender'].fillna('').astype(str).str.strip().str.title()
+    for column in TEXT_COLUMNS[1:]:
+        visits[column] = visits[column].fillna('').astype(str).str.strip()
+    for column, missing in [('gender', 'Unknown'), ('diagnosis', 'Unspecified'), ('treatment', 'Unspecified')]:
+        visits[column] = visits[column].mask(visits[column] == '', missing).astype('category')
+    return visits
+
+
+def load_visits(patients=None, source=None):
+    """Reads every visit into a DataFrame.
+
+    patients is a patients tree ({name: {'records': ...}}). Otherwise
+    source is a snapshot path, 'cache', or 'firebase' (downloads the whole
+    tree); by default the snapshot named by PEARLTRACK_ANALYTICS_SNAPSHOT
+    is read, or the local cache when none is set. The frame's attrs hold
+    'source', 'partial' (True when not every visit was available) and
+    'coverage' (what was missing, in words).
+    """
+    partial = False
+    coverage = 'complete'
+    if patients is not None:
+        source = 'patients'
+        columns = visit_columns(patients)
+    else:
+        source = source or os.environ.get(ANALYTICS_SNAPSHOT_ENV) or 'cache'
+        if source == 'firebase':
+            columns = visit_columns(db.reference('patients').get() or {})
+        elif source == 'cache':
+            patients = get_cached_patients()
+            complete, total = cache_coverage(patients)
+            partial = complete < total
+            if partial:
+                coverage = f"only the {complete} of {total} patients fully cached on this workstation"
+            columns = visit_columns(patients)
+        else:
+            columns, complete = snapshot_visit_columns(source)
+            partial = not complete
+            if partial:
+                coverage = "the snapshot was cut short"
+    visits = visits_frame(columns)
+    visits.attrs.update(source=source, partial=partial, coverage=coverage)
+    return visits
+
+
+def get_visits(source=None, max_age=ANALYTICS_CACHE_TTL):
+    """The visits DataFrame for source (see load_visits), loaded at most once every max_age seconds."""
+    global _visits
+    source = source or os.environ.get(ANALYTICS_SNAPSHOT_ENV) or 'cache'
+    with _visits_lock:
+        if _visits is None or _visits[1] != source or time.monotonic() - _visits[0] > max_age:
+            _visits = (time.monotonic(), source, load_visits(source=source))
+        return _visits[2]
+
+
+def visits_in_month(visits, month):
+    """The visits dated in month ('YYYY-MM')."""
+    pd = _pandas()
+    start = pd.Timestamp(f"{month}-01")
+    end = start + pd.offsets.MonthBegin(1)
+    return visits[(visits['date'] >= start) & (visits['date'] < end)]
+
+
+def revenue_by(visits, column):
+    """Visits, charged, paid and outstanding per value of column, highest revenue first."""
+    grouped = visits.groupby(column, observed=True).agg(
+        visits=('charged', 'size'),
+        charged=('charged', 'sum'),
+        paid=('paid', 'sum'),
+        balance=('balance', 'sum'),
+    )
+    return grouped.sort_values('charged', ascending=False)
+
+
+def top_balances(visits, limit=20):
+    """Patients with the largest outstanding balance."""
+    grouped = visits.groupby('patient').agg(
+        visits=('balance', 'size'),
+        charged=('charged', 'sum'),
+        paid=('paid', 'sum'),
+        balance=('balance', 'sum'),
+    )
+    return grouped[grouped['balance'] > 0].nlargest(limit, 'balance')
+
+
+def visits_by_gender_and_age(visits):
+    """Visit counts with a row per gender and a column per age band."""
+    pd = _pandas()
+    bands = pd.cut(visits['age'], AGE_BANDS, right=False, labels=AGE_BAND_LABELS)
+    bands = bands.cat.add_categories('Unknown').fillna('Unknown').rename('age_band')
+    return visits.groupby([visits['gender'], bands], observed=False).size().unstack(fill_value=0)
+
+
+def data_source(visits):
+    """What the figures were computed from, and whether they cover the whole practice."""
+    pd = _pandas()
+    partial = visits.attrs.get('partial', False)
+    return pd.DataFrame({'value': [
+        visits.attrs.get('source', 'unknown'),
+        f"PARTIAL: {visits.attrs.get('coverage')}" if partial else 'complete',
+        visits['patient'].nunique(),
+        len(visits),
+    ]}, index=pd.Index(['source', 'coverage', 'patients', 'visits'], name='field'))
+
+
+def monthly_report(visits, month=None):
+    """The standard monthly report as {title: DataFrame}; month defaults to the current one."""
+    month = month or date.today().strftime('%Y-%m')
+    in_month = visits_in_month(visits, month)
+    return {
+        "Data source": data_source(visits),
+        f"Revenue by diagnosis, {month}": revenue_by(in_month, 'diagnosis'),
+        f"Revenue by treatment, {month}": revenue_by(in_month, 'treatment'),
+        f"Visits by gender and age band, {month}": visits_by_gender_and_age(in_month),
+        "Top outstanding balances": top_balances(visits),
+    }
+
+
+def _slug(title):
+    return ''.join(char if char.isalnum() else '_' for char in title.lower()).strip('_')
+
+
+def _cell(value):
+    if isinstance(value, float):
+        return f"{value:,.2f}"
+    return str(value)
+
+
+def export_report_csv(report, directory):
+    """Writes each table of a report to its own CSV file; returns the paths."""
+    os.makedirs(directory, exist_ok=True)
+    paths = []
+    for title, table in report.items():
+        path = os.path.join(directory, f"{_slug(title)}.csv")
+        table.to_csv(path)
+        paths.append(path)
+    return paths
+
+
+def export_report_pdf(report, file_path):
+    """Writes a report as one PDF with a table per section."""
+    from utils.export_pdf import render_tables_pdf
+
+    sections = []
+    for title, table in report.items():
+        header = [str(table.index.name or '')] + [str(column) for column in table.columns]
+        rows = [[_cell(index)] + [_cell(value) for value in values]
+                for index, values in zip(table.index, table.itertuples(index=False))]
+        sections.append((title, header, rows))
+    return render_tables_pdf(sections, file_path)
+
+
+def export_monthly_report(directory, month=None, visits=None):
+    """Builds the monthly report and writes it as CSV files plus one PDF; returns the paths.
+
+    visits defaults to get_visits(); check its attrs['partial'] first to
+    warn about a report that does not cover the whole practice.
+    """
+    month = month or date.today().strftime('%Y-%m')
+    report = monthly_report(get_visits() if visits is None else visits, month)
+    paths = export_report_csv(report, directory)
+    paths.append(export_report_pdf(report, os.path.join(directory, f"report_{month}.pdf")))
+    return paths
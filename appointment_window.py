@@ -0,0 +1,102 @@
+from bisect import bisect_left, insort
+
+
+class AppointmentWindow:
+    """The slice of the schedule loaded so far, ordered by (date, id).
+
+    The window starts at a day (today on the Appointments screen). Pages
+    after it are appended as the user scrolls, and pages before it are
+    prepended when the user asks for earlier appointments. The window
+    remembers how far it reaches both ways so live changes outside it can
+    be ignored, and keeps the appointment ID of every row so a listbox
+    index maps straight back to the appointment it shows.
+    """
+
+    def __init__(self, start_date=None):
+        self.reset(start_date)
+
+    def reset(self, start_date=None):
+        self._keys = []          # sorted (date, id)
+        self._rows = {}          # id -> (id, name, contact, reason, date, time)
+        self.next_cursor = None
+        self.loading = False
+        self.started = False
+        self.start_date = start_date    # first day loaded; None once it reaches the oldest appointment
+        self.earlier_cursor = None
+        self.earlier_loading = False
+
+    @property
+    def earlier_exhausted(self):
+        """True once nothing before the window is left to load."""
+        return self.start_date is None
+
+    @property
+    def exhausted(self):
+        """True once the last page has been loaded."""
+        return self.started and self.next_cursor is None
+
+    def __len__(self):
+        return len(self._keys)
+
+    def add_page(self, rows, next_cursor):
+        self.started = True
+        for row in rows:
+            self._insert(row)
+        self.next_cursor = next_cursor
+
+    def add_earlier_page(self, rows, earlier_cursor):
+        """Adds a page from before the window; earlier_cursor is None once the oldest was loaded."""
+        for row in rows:
+            self._insert(row)
+        self.earlier_cursor = earlier_cursor
+        self.start_date = earlier_cursor[0] if earlier_cursor else None
+
+    def covers(self, day):
+        """True if appointments on this day belong inside the loaded window."""
+        if self.start_date is not None and day < self.start_date:
+            return False
+        if self.exhausted:
+            return True
+        return bool(self._keys) and day <= self._keys[-1][0]
+
+    def _insert(self, row):
+        id_, date_ = row[0], row[4]
+        if id_ in self._rows:
+            self._remove(id_)
+        self._rows[id_] = row
+        insort(self._keys, (date_, id_))
+
+    def _remove(self, id_):
+        row = self._rows.pop(id_, None)
+        if row is None:
+            return None
+        i = bisect_left(self._keys, (row[4], id_))
+        if i < len(self._keys) and self._keys[i] == (row[4], id_):
+            del self._keys[i]
+        return row
+
+    def put(self, row):
+        """Adds or replaces one appointment row if it falls inside the window."""
+        if self.covers(row[4]):
+            self._insert(row)
+        else:
+            self._remove(row[0])
+
+    def remove(self, id_):
+        """Removes one appointment; returns its row, or None if it was not loaded."""
+        return self._remove(id_)
+
+    def replace_day(self, day, rows):
+        """Replaces everything loaded for one day with a fresh copy of its bucket."""
+        for date_, id_ in [key for key in self._keys if key[0] == day]:
+            self._remove(id_)
+        if self.covers(day):
+            for row in rows:
+                self._insert(row)
+
+    def row_at(self, index):
+        """The appointment row shown at a listbox index."""
+        return self._rows[self._keys[index][1]]
+
+    def rows(self):
+        return [self._rows[id_] for _, id_ in self._keys]
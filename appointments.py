@@ -1,46 +1,235 @@
 from datetime import date
-from firebase_realtime import initialize_firebase  # Import your Firebase initialization
-from firebase_admin import db
+from utils.storage import db, increment
+from utils.push_ids import generate_push_id
+from utils.local_cache import (
+    cache_appointment_page,
+    cache_appointment_stat,
+    cache_appointments,
+    cache_appointments_on,
+    enqueue_write,
+    get_cached_appointment_stat,
+    get_cached_appointments,
+    get_cached_appointments_from,
+    get_cached_appointments_on,
+    overlay_pending,
+)
 
-# Initialize Firebase (call this once at startup)
+# Appointments are also stored per day so a day's schedule is one small
+# read, and counters are maintained so the dashboard never has to count
+# the whole collection.
+APPOINTMENTS_BY_DATE_PATH = 'appointments_by_date'
+APPOINTMENT_STATS_PATH = 'appointment_stats'
+
+def _appointment_paths(appt_id, appt_date):
+    """Every path that one appointment is written under."""
+    return [f'appointments/{appt_id}', f'{APPOINTMENTS_BY_DATE_PATH}/{appt_date}/{appt_id}']
 
 
 def add_appointment(patient_name, contact, reason, appt_date, appt_time):
     """Add a new appointment to Firebase Realtime Database."""
-    ref = db.reference('appointments')
-    new_appointment = ref.push({
+    # The key is generated locally so the write can be queued while offline
+    appt_id = generate_push_id()
+    appointment = {
         'patient_name': patient_name,
         'contact': contact,
         'reason': reason,
         'date': appt_date,
         'time': appt_time
-    })
-    return new_appointment.key  # Returns Firebase-generated ID
+    }
+    updates = {path: appointment for path in _appointment_paths(appt_id, appt_date)}
+    updates[f'{APPOINTMENT_STATS_PATH}/total'] = increment(1)
+    updates[f'{APPOINTMENT_STATS_PATH}/by_date/{appt_date}'] = increment(1)
+    enqueue_write(updates)
+    return appt_id  # Returns Firebase-style ID
 
 def get_todays_appointments():
     """Retrieve today's appointments from Firebase."""
-    today = date.today().isoformat()
-    ref = db.reference('appointments')
-    appointments = ref.order_by_child('date').equal_to(today).get()
+    return get_appointments_on(date.today().isoformat())
+
+def get_appointments_on(day):
+    """Retrieve one day's appointments ({id: appointment}) from its date bucket."""
+    try:
+        bucket_path = f'{APPOINTMENTS_BY_DATE_PATH}/{day}'
+        appointments = overlay_pending(bucket_path, db.reference(bucket_path).get())
+        cache_appointments_on(day, appointments or {})
+    except Exception as e:
+        print(f"Using cached appointments: {e}")
+        appointments = get_cached_appointments_on(day)
+    appointments = {id_: appt for id_, appt in (appointments or {}).items() if appt.get('date') == day}
     return appointments if appointments else {}
 
-def delete_appointment(appt_id):
-    """Delete an appointment from Firebase by its ID."""
-    ref = db.reference('appointments')
-    ref.child(appt_id).delete()
+def get_appointments(start_date=None, end_date=None, limit=50, cursor=None):
+    """Retrieve one page of appointments ordered by date, then ID, from start_date (default today) on.
+
+    Returns (rows, next_cursor): rows in the same shape as
+    get_all_appointments, and a cursor to pass back for the following page
+    (None on the last page). Appointments before today come from
+    get_earlier_appointments. Needs ".indexOn": ["date"] on 'appointments'
+    in the database rules to stay a server-side query.
+    """
+    after = tuple(cursor) if cursor else None
+    low = after[0] if after else start_date or date.today().isoformat()
+    try:
+        # Appointments sharing the cursor's date come back again, so
+        # over-fetch until a full page lies past the cursor
+        fetch = limit + 1
+        while True:
+            query = db.reference('appointments').order_by_child('date')
+            if low:
+                query = query.start_at(low)
+            if end_date:
+                query = query.end_at(end_date)
+            result = query.limit_to_first(fetch).get() or {}
+            items = _page_items(result, after)
+            if len(items) > limit or len(result) < fetch:
+                break
+            fetch *= 2
+        # Cached (minus deletes still queued here) so the list still pages when offline
+        cache_appointment_page(overlay_pending('appointments', dict(result)))
+    except Exception as e:
+        print(f"Using cached appointments: {e}")
+        items = _page_items({id_: appt for id_, appt in get_cached_appointments().items()
+                             if (not low or appt.get('date', '') >= low)
+                             and (not end_date or appt.get('date', '') <= end_date)}, after)
+
+    page = items[:limit]
+    next_cursor = (page[-1][0], page[-1][1]) if len(items) > limit else None
+    return [_appointment_row(id_, appt) for _, id_, appt in page], next_cursor
+
+def get_earlier_appointments(before_date=None, limit=50, cursor=None):
+    """Retrieve the page of appointments just before before_date (default today), going back in time.
+
+    Returns (rows, next_cursor) like get_appointments, rows oldest first;
+    pass next_cursor back for the page before those (None once the oldest
+    appointment is reached).
+    """
+    before = tuple(cursor) if cursor else (before_date or date.today().isoformat(), '')
+    try:
+        fetch = limit + 1
+        while True:
+            query = db.reference('appointments').order_by_child('date').end_at(before[0])
+            result = query.limit_to_last(fetch).get() or {}
+            items = _page_items_before(result, before)
+            if len(items) > limit or len(result) < fetch:
+                break
+            fetch *= 2
+        cache_appointment_page(overlay_pending('appointments', dict(result)))
+    except Exception as e:
+        print(f"Using cached appointments: {e}")
+        items = _page_items_before(get_cached_appointments(), before)
+
+    page = items[-limit:]
+    next_cursor = (page[0][0], page[0][1]) if len(items) > limit else None
+    return [_appointment_row(id_, appt) for _, id_, appt in page], next_cursor
+
+def _page_items_before(appointments, before):
+    return [item for item in _page_items(appointments, None) if (item[0], item[1]) < before]
+
+def _page_items(appointments, after):
+    items = sorted((appt.get('date', ''), id_, appt) for id_, appt in appointments.items() if appt)
+    if after:
+        items = [item for item in items if (item[0], item[1]) > after]
+    return items
+
+def delete_appointment(appt_id, appt_date=None):
+    """Delete an appointment from Firebase by its ID.
+
+    Pass the appointment's date when it is already known to skip looking it up.
+    """
+    if appt_date is None:
+        try:
+            appointment = db.reference(f'appointments/{appt_id}').get()
+        except Exception:
+            appointment = get_cached_appointments().get(appt_id)
+        if not appointment:
+            # Already gone: nothing to count down
+            enqueue_write({f'appointments/{appt_id}': None})
+            return
+        appt_date = appointment.get('date')
+
+    if appt_date is None:
+        # An undated appointment is in no date bucket, but it is in the total.
+        # Only decrement it if the appointment still exists at sync time.
+        enqueue_write({f'appointments/{appt_id}': None, f'{APPOINTMENT_STATS_PATH}/total': increment(-1)},
+                      expect={f'appointments/{appt_id}/patient_name': appointment.get('patient_name')})
+        return
+
+    updates = {path: None for path in _appointment_paths(appt_id, appt_date)}
+    updates[f'{APPOINTMENT_STATS_PATH}/total'] = increment(-1)
+    updates[f'{APPOINTMENT_STATS_PATH}/by_date/{appt_date}'] = increment(-1)
+    # Only decrement the counters if the appointment still exists at sync time
+    enqueue_write(updates, expect={f'appointments/{appt_id}/date': appt_date})
+
+def count_appointments():
+    """Total number of appointments, from the maintained counter."""
+    try:
+        total = overlay_pending(f'{APPOINTMENT_STATS_PATH}/total',
+                                db.reference(f'{APPOINTMENT_STATS_PATH}/total').get())
+        cache_appointment_stat('total', total or 0)
+    except Exception as e:
+        print(f"Using cached appointment count: {e}")
+        total = get_cached_appointment_stat('total')
+        if total is None:
+            return len(get_cached_appointments())
+    return total or 0
+
+def count_appointments_by_date(start_date=None, end_date=None):
+    """{date: count} of appointments per day, optionally limited to a date range."""
+    ref = db.reference(f'{APPOINTMENT_STATS_PATH}/by_date').order_by_key()
+    if start_date:
+        ref = ref.start_at(start_date)
+    if end_date:
+        ref = ref.end_at(end_date)
+    counts = overlay_pending(f'{APPOINTMENT_STATS_PATH}/by_date', dict(ref.get() or {})) or {}
+    return {day: count for day, count in counts.items()
+            if count and (not start_date or day >= start_date) and (not end_date or day <= end_date)}
+
+def rebuild_appointment_buckets():
+    """Rebuilds the per-day buckets and counters from 'appointments' (one-off migration)."""
+    appointments = db.reference('appointments').get() or {}
+    by_date = {}
+    for appt_id, appt in appointments.items():
+        if appt and appt.get('date'):
+            by_date.setdefault(appt['date'], {})[appt_id] = appt
+    db.reference(APPOINTMENTS_BY_DATE_PATH).set(by_date)
+    db.reference(APPOINTMENT_STATS_PATH).set({
+        'total': len(appointments),
+        'by_date': {day: len(bucket) for day, bucket in by_date.items()},
+    })
+    return len(appointments)
 
 
 def get_all_appointments():
-    ref = db.reference('appointments')
-    appointments = ref.get()  # Retrieve all appointments
-    if appointments is None:
+    try:
+        ref = db.reference('appointments')
+        appointments = overlay_pending('appointments', ref.get())  # Retrieve all appointments
+        cache_appointments(appointments or {})
+    except Exception as e:
+        cached = get_cached_appointments()
+        if not cached:
+            raise
+        print(f"Using cached appointments: {e}")
+        appointments = cached
+    return appointment_rows(appointments)
+
+def get_cached_appointment_page(start_date=None, limit=50):
+    """The rows of get_appointments' first page, served from the local cache only."""
+    appointments = get_cached_appointments_from(start_date or date.today().isoformat(), limit)
+    return [_appointment_row(id_, appt) for id_, appt in appointments.items()]
+
+def appointment_rows(appointments):
+    """Turns {id: appointment} into the (id, name, contact, reason, date, time) rows used by the UI."""
+    if not appointments:
         return []  # Return an empty list if there are no appointments
     # Unpack the appointments
     return [
-        (id_, appt['patient_name'], appt['contact'], appt['reason'], appt['date'], appt['time'])
-        for id_, appt in appointments.items()
+        _appointment_row(id_, appt)
+        for id_, appt in sorted(appointments.items())  # Firebase key order
     ]
 
+def _appointment_row(id_, appt):
+    return (id_, appt['patient_name'], appt['contact'], appt['reason'], appt['date'], appt['time'])
+
 
 
 
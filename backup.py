@@ -0,0 +1,277 @@
+# backup.py
+#
+# Snapshot export/import for the whole database:
+#
+#     python backup.py export nightly.ptsnap.gz
+#     python backup.py import nightly.ptsnap.gz
+#
+# A snapshot is gzip-compressed JSON lines. The first line is a header
+# describing the tables; every following line is one batch of rows stored
+# column by column ({"table": ..., "columns": {field: [values]}}). Each
+# line is its own gzip member, so a file cut short still reads up to the
+# last complete batch. Both directions keep a small .progress file next
+# to the snapshot and can be resumed with --resume after an interruption.
+import argparse
+import gzip
+import json
+import os
+import sys
+import time
+from utils.storage import db, initialize_storage
+from utils.appointments import APPOINTMENTS_BY_DATE_PATH, APPOINTMENT_STATS_PATH
+from utils.billing import BILLING_DAILY_PATH, BILLING_TOTALS_PATH, add_visit_to_billing, empty_totals
+from utils.patients import PATIENT_INDEX_PATH, summarize_patient
+
+SNAPSHOT_FORMAT = 'pearltrack-snapshot'
+SNAPSHOT_VERSION = 1
+
+# Patients or appointments read per Firebase request while exporting
+EXPORT_PAGE_SIZE = 200
+# Paths per multi-path update() while importing
+IMPORT_BATCH_SIZE = 500
+
+# Collections exported, in order; each becomes one or more tables
+COLLECTIONS = ['patients', 'appointments']
+TABLES = {
+    'patients': {'key': ['name']},
+    'visits': {'key': ['patient', 'visit_id']},
+    'appointments': {'key': ['id']},
+}
+
+
+def _progress_path(path):
+    return f"{path}.progress"
+
+
+def _load_progress(path):
+    try:
+        with open(_progress_path(path)) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def _save_progress(path, state):
+    tmp_path = _progress_path(path) + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(state, f)
+    os.replace(tmp_path, _progress_path(path))
+
+
+def _clear_progress(path):
+    if os.path.exists(_progress_path(path)):
+        os.remove(_progress_path(path))
+
+
+def _write_line(f, record):
+    """Appends one line as its own gzip member."""
+    f.write(gzip.compress(json.dumps(record, separators=(',', ':')).encode('utf-8') + b'\n'))
+
+
+def _read_lines(path):
+    with gzip.open(path, 'rt', encoding='utf-8') as f:
+        for line in f:
+            yield json.loads(line)
+
+
+def read_snapshot(path):
+    """Yields a snapshot's batch lines ({'table': ..., 'columns': ...}), then its end line
+    ({'end': True, ...}) if the file is complete."""
+    lines = _read_lines(path)
+    header = next(lines, None)
+    if not header or header.get('format') != SNAPSHOT_FORMAT:
+        raise ValueError(f"{path} is not a PearlTrack snapshot")
+    if header.get('version', 0) > SNAPSHOT_VERSION:
+        raise ValueError(f"{path} was written by a newer version (format {header['version']})")
+    for line in lines:
+        yield line
+        if line.get('end'):
+            return
+
+
+def to_columns(rows):
+    """[{field: value}] -> {field: [value per row]}, over every field any row has."""
+    fields = sorted({field for row in rows for field in row})
+    return {field: [row.get(field) for row in rows] for field in fields}
+
+
+def from_columns(columns):
+    """{field: [values]} -> [{field: value}], leaving out empty (None) cells."""
+    fields = list(columns)
+    count = len(columns[fields[0]]) if fields else 0
+    return [{field: columns[field][i] for field in fields if columns[field][i] is not None}
+            for i in range(count)]
+
+
+def _pages(collection, page_size, after=None):
+    """Yields one collection as lists of (key, value), a page at a time in key order.
+
+    Only one page is ever held in memory, instead of the whole collection.
+    """
+    while True:
+        query = db.reference(collection).order_by_key()
+        if after is not None:
+            query = query.start_at(after)
+        page = query.limit_to_first(page_size + (after is not None)).get() or {}
+        items = [(key, value) for key, value in page.items() if key != after]
+        if not items:
+            return
+        yield items
+        if len(items) < page_size:
+            return
+        after = items[-1][0]
+
+
+def _batches(collection, items):
+    """Snapshot lines for one page of a collection."""
+    if collection == 'patients':
+        patients, visits = [], []
+        for name, data in items:
+            data = data or {}
+            patients.append(dict({field: value for field, value in data.items() if field != 'records'},
+                                 name=name))
+            records = data.get('records') or {}
+            if isinstance(records, list):
+                records = {str(i): record for i, record in enumerate(records)}
+            visits.extend(dict(record, patient=name, visit_id=visit_id)
+                          for visit_id, record in records.items() if record)
+        yield {'table': 'patients', 'columns': to_columns(patients)}
+        if visits:
+            yield {'table': 'visits', 'columns': to_columns(visits)}
+    else:
+        yield {'table': 'appointments',
+               'columns': to_columns([dict(appt or {}, id=appt_id) for appt_id, appt in items])}
+
+
+def export_snapshot(path, page_size=EXPORT_PAGE_SIZE, resume=False, progress=print):
+    """Streams patients and appointments from Firebase into a snapshot file.
+
+    With resume, an interrupted export carries on after the last page it
+    finished. Returns {table: rows written}.
+    """
+    state = _load_progress(path) if resume else None
+    if state is None:
+        state = {'offset': 0, 'collection': COLLECTIONS[0], 'after': None,
+                 'counts': {table: 0 for table in TABLES}}
+    counts = state['counts']
+
+    with open(path, 'r+b' if state['offset'] else 'wb') as f:
+        # Drop anything written after the last page that was recorded as done
+        f.truncate(state['offset'])
+        f.seek(state['offset'])
+        if not state['offset']:
+            _write_line(f, {'format': SNAPSHOT_FORMAT, 'version': SNAPSHOT_VERSION,
+                            'created_at': time.strftime('%Y-%m-%dT%H:%M:%S'), 'tables': TABLES})
+
+        for collection in COLLECTIONS[COLLECTIONS.index(state['collection']):]:
+            after = state['after'] if collection == state['collection'] else None
+            for items in _pages(collection, page_size, after):
+                for batch in _batches(collection, items):
+                    _write_line(f, batch)
+                    counts[batch['table']] += len(next(iter(batch['columns'].values()), []))
+                f.flush()
+                state = {'offset': f.tell(), 'collection': collection, 'after': items[-1][0], 'counts': counts}
+                _save_progress(path, state)
+                progress(f"Exported {counts['patients']} patients, {counts['visits']} visits, "
+                         f"{counts['appointments']} appointments")
+
+        _write_line(f, {'end': True, 'counts': counts})
+    _clear_progress(path)
+    return counts
+
+
+def _update_in_batches(updates, batch_size):
+    items = list(updates.items())
+    for start in range(0, len(items), batch_size):
+        db.reference().update(dict(items[start:start + batch_size]))
+
+
+def import_snapshot(path, batch_size=IMPORT_BATCH_SIZE, resume=False, progress=print):
+    """Writes a snapshot back to Firebase in batched multi-path updates.
+
+    The patient index, appointment buckets and counters and the billing
+    totals are rebuilt from the snapshot as it is read, so no rebuild_*
+    pass is needed afterwards. Counters are written as absolute values,
+    so restore into an empty database. With resume, batches already
+    written by an interrupted import are skipped.
+    """
+    state = _load_progress(path) if resume else None
+    done = state['batches'] if state else 0
+
+    appointment_counts = {}
+    appointment_total = 0
+    billing_totals, billing_daily = empty_totals(), {}
+
+    batch_number = 0
+    for line in read_snapshot(path):
+        if line.get('end'):
+            break
+        rows = from_columns(line['columns'])
+        updates = {}
+        if line['table'] == 'patients':
+            for row in rows:
+                name = row.pop('name')
+                for field, value in row.items():
+                    updates[f'patients/{name}/{field}'] = value
+                updates[f'patients/{name}/name'] = name
+                updates[f'{PATIENT_INDEX_PATH}/{name}'] = summarize_patient(name, None)
+        elif line['table'] == 'visits':
+            by_patient = {}
+            for row in rows:
+                name, visit_id = row.pop('patient'), row.pop('visit_id')
+                by_patient.setdefault(name, {})[visit_id] = row
+                add_visit_to_billing(billing_totals, billing_daily, visit_id, row)
+            for name, records in by_patient.items():
+                for visit_id, record in records.items():
+                    updates[f'patients/{name}/records/{visit_id}'] = record
+                # Every visit of a patient is in the same batch, so this summary is complete
+                updates[f'{PATIENT_INDEX_PATH}/{name}'] = summarize_patient(name, records)
+        elif line['table'] == 'appointments':
+            for row in rows:
+                appt_id = row.pop('id')
+                updates[f'appointments/{appt_id}'] = row
+                appointment_total += 1
+                if row.get('date'):
+                    updates[f"{APPOINTMENTS_BY_DATE_PATH}/{row['date']}/{appt_id}"] = row
+                    appointment_counts[row['date']] = appointment_counts.get(row['date'], 0) + 1
+
+        batch_number += 1
+        if batch_number <= done:
+            continue  # written before the import was interrupted
+        _update_in_batches(updates, batch_size)
+        _save_progress(path, {'batches': batch_number})
+        progress(f"Imported batch {batch_number} ({line['table']}, {len(rows)} rows)")
+
+    db.reference().update({
+        APPOINTMENT_STATS_PATH: {'total': appointment_total, 'by_date': appointment_counts or None},
+        BILLING_TOTALS_PATH: billing_totals,
+        BILLING_DAILY_PATH: billing_daily or None,
+    })
+    _clear_progress(path)
+    return batch_number
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Export or restore a PearlTrack database snapshot.")
+    parser.add_argument('command', choices=['export', 'import'])
+    parser.add_argument('path', help="snapshot file, e.g. nightly.ptsnap.gz")
+    parser.add_argument('--resume', action='store_true', help="continue an interrupted export or import")
+    parser.add_argument('--page-size', type=int, default=EXPORT_PAGE_SIZE,
+                        help="records read per request when exporting")
+    parser.add_argument('--batch-size', type=int, default=IMPORT_BATCH_SIZE,
+                        help="paths per update() when importing")
+    args = parser.parse_args(argv)
+
+    initialize_storage()
+
+    if args.command == 'export':
+        counts = export_snapshot(args.path, page_size=args.page_size, resume=args.resume)
+        print(f"Snapshot written to {args.path}: {counts}")
+    else:
+        batches = import_snapshot(args.path, batch_size=args.batch_size, resume=args.resume)
+        print(f"Restored {batches} batches from {args.path}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,8 @@
+# Benchmarks for the data layer and the dashboard's hot paths.
+#
+#     python -m utils.benchmarks --patients 2000 --save-baseline
+#     python -m utils.benchmarks --patients 2000
+#
+# A synthetic practice (clinic.py) is loaded into a local storage backend,
+# the scenarios (scenarios.py) are timed, and the results are compared
+# with a saved baseline (runner.py) so regressions show up.
@@ -0,0 +1,15 @@
+import os
+import sys
+import tempfile
+
+# The benchmark must not touch the workstation's real offline cache; this has
+# to be set before utils.local_cache is imported
+os.environ.setdefault("PEARLTRACK_CACHE_DB", os.path.join(tempfile.mkdtemp(prefix='pearltrack-bench-'), 'cache.db'))
+
+# The app's top-level modules (dashboard) are imported from the package
+# directory, as when main.py runs
+sys.path.insert(1, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.benchmarks.runner import main
+
+sys.exit(main())
@@ -0,0 +1,160 @@
+import random
+from datetime import date, datetime, time, timedelta
+from utils.appointments import rebuild_appointment_buckets
+from utils.billing import rebuild_billing
+from utils.patients import rebuild_patient_index
+from utils.push_ids import generate_push_id
+from utils.storage import db
+
+# A synthetic practice: patients with a long-tailed number of visits (most
+# come a few times, a few come for years) and a daily appointment book
+# covering the same years. The same seed always gives the same practice.
+
+FIRST_NAMES = ['Amina', 'Brian', 'Caroline', 'David', 'Esther', 'Faith', 'George', 'Grace', 'Hassan',
+               'Irene', 'James', 'Joy', 'Kevin', 'Lucy', 'Mercy', 'Moses', 'Njeri', 'Otieno', 'Peter',
+               'Rose', 'Samuel', 'Sharon', 'Tom', 'Wanjiru', 'Zawadi']
+LAST_NAMES = ['Achieng', 'Barasa', 'Chebet', 'Kamau', 'Kariuki', 'Kiprono', 'Mutua', 'Mwangi', 'Njoroge',
+              'Ochieng', 'Odhiambo', 'Omondi', 'Onyango', 'Otieno', 'Wafula', 'Wambui', 'Wanjiku']
+
+# (diagnosis, treatment, typical charge)
+PROCEDURES = [
+    ('Dental caries', 'Composite filling', 3500),
+    ('Irreversible pulpitis', 'Root canal treatment', 12000),
+    ('Chronic gingivitis', 'Scaling and polishing', 2500),
+    ('Impacted third molar', 'Surgical extraction', 8000),
+    ('Fractured crown', 'Porcelain crown', 18000),
+    ('Malocclusion', 'Orthodontic review', 4000),
+    ('Dentine hypersensitivity', 'Desensitizing treatment', 1500),
+    ('Periapical abscess', 'Incision and drainage', 5000),
+    ('Missing teeth', 'Partial denture', 15000),
+    ('Routine check-up', 'Examination', 1000),
+]
+COMPLAINTS = ['Toothache', 'Bleeding gums', 'Sensitivity to cold', 'Swelling', 'Broken tooth',
+              'Bad breath', 'Loose tooth', 'Check-up']
+MEDICATIONS = ['Amoxicillin 500mg', 'Ibuprofen 400mg', 'Paracetamol 1g', 'Metronidazole 400mg',
+               'Chlorhexidine mouthwash', '']
+APPOINTMENT_TIMES = [f'{hour:02}:{minute:02}' for hour in range(8, 17) for minute in (0, 30)]
+
+
+class ClinicSpec:
+    """How big the synthetic practice is."""
+
+    def __init__(self, patients=1000, visits_mean=4, max_visits=300, heavy_visits=1000,
+                 years=3, appointments_per_day=12, seed=0, end_date=None):
+        self.patients = patients
+        self.visits_mean = visits_mean          # mean of the long-tailed visits-per-patient distribution
+        self.max_visits = max_visits            # cap for ordinary patients
+        self.heavy_visits = heavy_visits        # one long-standing patient with this many visits (0 for none)
+        self.years = years                      # span of visit and appointment dates, ending at end_date
+        self.appointments_per_day = appointments_per_day
+        self.seed = seed
+        self.end_date = end_date                # last day of visits ('YYYY-MM-DD'); today when None
+
+    def as_dict(self):
+        return dict(vars(self))
+
+
+def _patient_names(rng, count):
+    names = []
+    seen = set()
+    for _ in range(count):
+        name = f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}"
+        if name in seen:
+            name = f"{name} {len(names)}"
+        seen.add(name)
+        names.append(name)
+    return names
+
+
+def _visit(rng, age, gender, contact, next_of_kin):
+    diagnosis, treatment, charge = rng.choice(PROCEDURES)
+    charged = round(charge * rng.uniform(0.8, 1.3), -1)
+    paid = charged if rng.random() < 0.7 else round(charged * rng.choice([0, 0.25, 0.5, 0.75]), -1)
+    return {
+        'age': str(age),
+        'gender': gender,
+        'contact': contact,
+        'next_of_kin': next_of_kin,
+        'chief_complain': rng.choice(COMPLAINTS),
+        'hpc': f"{rng.randint(1, 14)} days",
+        'pdh': rng.choice(['Regular attender', 'Irregular attender', 'First visit']),
+        'pmh': rng.choice(['Nil', 'Hypertension', 'Diabetes', 'Asthma']),
+        'diagnosis': diagnosis,
+        'treatment': treatment,
+        'management': f"{treatment}; review in {rng.choice([1, 2, 4, 6])} weeks",
+        'amount_charged': charged,
+        'amount_paid': paid,
+        'balance': charged - paid,
+        'medication': rng.choice(MEDICATIONS),
+    }
+
+
+def _visit_count(rng, spec):
+    # Exponential, so most patients have a handful of visits and a few have many
+    return min(spec.max_visits, 1 + int(rng.expovariate(1 / max(spec.visits_mean - 1, 0.1))))
+
+
+def generate_clinic(spec):
+    """Builds {'patients': ..., 'appointments': ...} in the stored layout.
+
+    Visit and appointment keys are push IDs timestamped across the
+    spec.years years up to spec.end_date, so visits sort and date the way
+    real ones do. The same spec (seed and end date) gives the same keys.
+    """
+    rng = random.Random(spec.seed)
+    last_day = date.fromisoformat(spec.end_date) if spec.end_date else date.today()
+    end = datetime.combine(last_day, time(17, 0))
+    start = end - timedelta(days=365 * spec.years)
+    span_ms = int((end - start).total_seconds() * 1000)
+    start_ms = int(start.timestamp() * 1000)
+
+    patients = {}
+    for i, name in enumerate(_patient_names(rng, spec.patients)):
+        count = spec.heavy_visits if i == 0 and spec.heavy_visits else _visit_count(rng, spec)
+        age, gender = rng.randint(3, 85), rng.choice(['Male', 'Female'])
+        contact, next_of_kin = f"07{rng.randint(10000000, 99999999)}", rng.choice(FIRST_NAMES)
+        times = sorted(start_ms + rng.randrange(span_ms) for _ in range(count))
+        patients[name] = {
+            'name': name,
+            'records': {generate_push_id(ms, rng): _visit(rng, age, gender, contact, next_of_kin) for ms in times},
+        }
+
+    names = list(patients)
+    appointments = {}
+    day = start.date()
+    while day <= end.date() + timedelta(days=30):
+        if day.weekday() < 6:
+            count = rng.randint(0, 2 * spec.appointments_per_day)
+            if day == last_day:
+                count = max(count, spec.appointments_per_day)  # the end date's list (today's by default) is never empty
+            booked_ms = int(datetime.combine(day - timedelta(days=rng.randint(0, 21)), time(9)).timestamp() * 1000)
+            for _ in range(count):
+                appointments[generate_push_id(booked_ms + rng.randrange(8 * 3600 * 1000), rng)] = {
+                    'patient_name': rng.choice(names),
+                    'contact': f"07{rng.randint(10000000, 99999999)}",
+                    'reason': rng.choice(COMPLAINTS),
+                    'date': day.isoformat(),
+                    'time': rng.choice(APPOINTMENT_TIMES),
+                }
+        day += timedelta(days=1)
+    return {'patients': patients, 'appointments': appointments}
+
+
+def clinic_stats(clinic):
+    visits = [len(data['records']) for data in clinic['patients'].values()]
+    return {
+        'patients': len(visits),
+        'visits': sum(visits),
+        'max_visits': max(visits, default=0),
+        'appointments': len(clinic['appointments']),
+    }
+
+
+def load_clinic(clinic):
+    """Writes a generated practice to the current storage backend and builds the derived data
+    (patient index, appointment buckets and counters, billing totals)."""
+    db.reference().update({'patients': clinic['patients'], 'appointments': clinic['appointments']})
+    rebuild_patient_index()
+    rebuild_appointment_buckets()
+    rebuild_billing()
+    return clinic_stats(clinic)
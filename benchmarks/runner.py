@@ -0,0 +1,220 @@
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+import tracemalloc
+
+# Latencies are reported as percentiles over the timed calls; memory is the
+# tracemalloc peak of one extra call made after the timed ones (tracing
+# slows Python down, so it is kept out of the timings).
+
+DEFAULT_RUNS = 50
+DEFAULT_BASELINE = 'benchmark_baseline.json'
+
+# A scenario regresses when its p50 or p90, or its memory peak, grows by
+# more than the tolerance and by more than the noise floor
+DEFAULT_TOLERANCE = 0.25
+NOISE_FLOOR_MS = 0.5
+NOISE_FLOOR_KIB = 64
+
+PERCENTILES = [50, 90, 99]
+
+# The app's own modules live here; failing to import one of them is a bug,
+# not a missing optional dependency
+PACKAGE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def percentile(sorted_values, q):
+    """Linear-interpolated percentile q (0-100) of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    position = (len(sorted_values) - 1) * q / 100
+    low = int(position)
+    high = min(low + 1, len(sorted_values) - 1)
+    return sorted_values[low] + (sorted_values[high] - sorted_values[low]) * (position - low)
+
+
+def measure(calls):
+    """Times each call, then traces one more for its memory peak."""
+    timings = []
+    for call in calls:
+        started = time.perf_counter()
+        call()
+        timings.append((time.perf_counter() - started) * 1000)
+    timings.sort()
+
+    tracemalloc.start()
+    try:
+        calls[-1]()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    result = {'runs': len(timings), 'mean_ms': sum(timings) / len(timings), 'max_ms': timings[-1]}
+    for q in PERCENTILES:
+        result[f'p{q}_ms'] = percentile(timings, q)
+    result['peak_kib'] = peak / 1024
+    return result
+
+
+def _is_app_module(name):
+    top = (name or '').split('.')[0]
+    return top == 'utils' or os.path.exists(os.path.join(PACKAGE_DIR, f"{top}.py"))
+
+
+def run_scenarios(practice, scenarios, runs=DEFAULT_RUNS, only=None, progress=print):
+    """Runs every scenario (or those whose name contains one of only) and returns {name: result}."""
+    results = {}
+    for scenario in scenarios:
+        if only and not any(part in scenario.name for part in only):
+            continue
+        count = min(runs, scenario.max_runs or runs)
+        try:
+            calls = scenario.prepare(practice, count)
+        except ImportError as e:
+            if _is_app_module(e.name):
+                raise
+            progress(f"skipped {scenario.name}: {e}")
+            continue
+        # The data layer reports writes and fallbacks with print(); keep them out of the report
+        with contextlib.redirect_stdout(io.StringIO()):
+            results[scenario.name] = measure(calls)
+        progress(format_row(scenario.name, results[scenario.name]))
+    return results
+
+
+def load_results(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def save_results(path, results):
+    with open(path, 'w') as f:
+        json.dump(results, f, indent=2, sort_keys=True)
+
+
+def compare(results, baseline, tolerance=DEFAULT_TOLERANCE):
+    """Returns [(scenario, metric, baseline value, current value)] for every regression."""
+    regressions = []
+    for name, current in results['scenarios'].items():
+        before = baseline['scenarios'].get(name)
+        if not before:
+            continue
+        for metric in ['p50_ms', 'p90_ms']:
+            if (current[metric] > before[metric] * (1 + tolerance)
+                    and current[metric] - before[metric] > NOISE_FLOOR_MS):
+                regressions.append((name, metric, before[metric], current[metric]))
+        if (current['peak_kib'] > before['peak_kib'] * (1 + tolerance)
+                and current['peak_kib'] - before['peak_kib'] > NOISE_FLOOR_KIB):
+            regressions.append((name, 'peak_kib', before['peak_kib'], current['peak_kib']))
+    return regressions
+
+
+def over_budget(results, scenarios):
+    """Returns [(scenario, budget, p50)] for every scenario slower than its own time budget."""
+    return [(scenario.name, scenario.budget_ms, results[scenario.name]['p50_ms'])
+            for scenario in scenarios
+            if scenario.budget_ms is not None and scenario.name in results
+            and results[scenario.name]['p50_ms'] > scenario.budget_ms]
+
+
+def format_row(name, result):
+    return (f"{name:<38} {result['runs']:>5} {result['p50_ms']:>10.2f} {result['p90_ms']:>10.2f} "
+            f"{result['p99_ms']:>10.2f} {result['max_ms']:>10.2f} {result['peak_kib']:>11.0f}")
+
+
+def format_header():
+    return (f"{'scenario':<38} {'runs':>5} {'p50 ms':>10} {'p90 ms':>10} "
+            f"{'p99 ms':>10} {'max ms':>10} {'peak KiB':>11}")
+
+
+def main(argv=None):
+    from utils.benchmarks.clinic import ClinicSpec, generate_clinic, load_clinic
+    from utils.benchmarks.scenarios import SCENARIOS, Practice
+    from utils.storage import use_backend
+
+    defaults = ClinicSpec()
+    parser = argparse.ArgumentParser(description="Time PearlTrack's data layer against a synthetic practice.")
+    parser.add_argument('--patients', type=int, default=defaults.patients)
+    parser.add_argument('--visits-mean', type=float, default=defaults.visits_mean,
+                        help="mean visits per patient (long-tailed)")
+    parser.add_argument('--heavy-visits', type=int, default=defaults.heavy_visits,
+                        help="visits of the one long-standing patient (0 for none)")
+    parser.add_argument('--years', type=int, default=defaults.years)
+    parser.add_argument('--appointments-per-day', type=int, default=defaults.appointments_per_day)
+    parser.add_argument('--seed', type=int, default=defaults.seed)
+    parser.add_argument('--end-date', help="last day of the practice's history, YYYY-MM-DD (default: today)")
+    parser.add_argument('--runs', type=int, default=DEFAULT_RUNS, help="timed calls per scenario")
+    parser.add_argument('--storage', default='memory',
+                        help="storage backend to load the practice into: memory or sqlite:<file>")
+    parser.add_argument('--only', action='append', help="run only scenarios whose name contains this")
+    parser.add_argument('--output', help="write the results as JSON to this file")
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE, help="baseline results to compare with")
+    parser.add_argument('--save-baseline', action='store_true', help="store these results as the baseline")
+    parser.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE,
+                        help="allowed slowdown before a scenario counts as a regression (0.25 = 25%%)")
+    args = parser.parse_args(argv)
+
+    spec = ClinicSpec(patients=args.patients, visits_mean=args.visits_mean, heavy_visits=args.heavy_visits,
+                      years=args.years, appointments_per_day=args.appointments_per_day, seed=args.seed,
+                      end_date=args.end_date)
+    use_backend(args.storage)
+
+    with tempfile.TemporaryDirectory(prefix='pearltrack-bench-') as work_dir:
+        started = time.perf_counter()
+        clinic = generate_clinic(spec)
+        stats = load_clinic(clinic)
+        print(f"Loaded {stats['patients']} patients, {stats['visits']} visits "
+              f"(most {stats['max_visits']}), {stats['appointments']} appointments "
+              f"in {time.perf_counter() - started:.1f}s")
+
+        practice = Practice(clinic, work_dir, seed=args.seed)
+        del clinic
+        print(format_header())
+        scenario_results = run_scenarios(practice, SCENARIOS, runs=args.runs, only=args.only)
+
+    results = {
+        'meta': {
+            'spec': spec.as_dict(),
+            'stats': stats,
+            'storage': args.storage,
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'created_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        },
+        'scenarios': scenario_results,
+    }
+    if args.output:
+        save_results(args.output, results)
+
+    status = 0
+    for name, budget, p50 in over_budget(scenario_results, SCENARIOS):
+        print(f"OVER BUDGET {name} p50_ms: {p50:.2f} > {budget:.2f}")
+        status = 1
+
+    baseline = load_results(args.baseline)
+    if baseline and not args.save_baseline:
+        if baseline['meta']['spec'] != results['meta']['spec']:
+            print(f"Note: {args.baseline} was recorded with a different practice size")
+        regressions = compare(results, baseline, args.tolerance)
+        for name, metric, before, after in regressions:
+            print(f"REGRESSION {name} {metric}: {before:.2f} -> {after:.2f}")
+        if not regressions:
+            print(f"No regressions against {args.baseline}")
+        status = 1 if regressions else status
+    if args.save_baseline:
+        save_results(args.baseline, results)
+        print(f"Baseline saved to {args.baseline}")
+    return status
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,215 @@
+import os
+import random
+from utils.appointments import get_all_appointments, get_appointments, get_todays_appointments
+from utils.patients import add_patient_visit, get_all_patients, get_patient_index, load_patient
+from utils.search_index import PatientSearchIndex
+
+# Each scenario prepares a list of calls from the loaded practice; the
+# runner times every call separately. Arguments are chosen up front so
+# picking them is not part of the timing.
+
+
+class Scenario:
+    def __init__(self, name, prepare, max_runs=None, budget_ms=None):
+        self.name = name
+        self.prepare = prepare      # prepare(practice, runs) -> [zero-argument calls]
+        self.max_runs = max_runs    # for scenarios too slow to repeat many times
+        self.budget_ms = budget_ms  # p50 above this fails the run, baseline or not
+
+
+class Practice:
+    """What the scenarios need to know about the loaded practice."""
+
+    def __init__(self, clinic, work_dir, seed=0):
+        self.names = list(clinic['patients'])
+        self.visit_counts = {name: len(data['records']) for name, data in clinic['patients'].items()}
+        self.heaviest = max(self.names, key=self.visit_counts.get)
+        self.work_dir = work_dir
+        self.rng = random.Random(seed)
+
+    def sample_names(self, runs):
+        return [self.rng.choice(self.names) for _ in range(runs)]
+
+
+def _calls(fn, args_list):
+    return [lambda args=args: fn(*args) for args in args_list]
+
+
+def _same_call(fn, *args):
+    return lambda practice, runs: _calls(fn, [args] * runs)
+
+
+def _load_patients(practice, runs):
+    return _calls(load_patient, [(name,) for name in practice.sample_names(runs)])
+
+
+def _load_heaviest(practice, runs):
+    return _calls(load_patient, [(practice.heaviest,)] * runs)
+
+
+def _add_visits(practice, runs):
+    rng = practice.rng
+    args = []
+    for name in practice.sample_names(runs):
+        charged = rng.choice([1000, 2500, 3500, 8000])
+        paid = rng.choice([0, charged // 2, charged])
+        args.append((name, '34', 'Female', '0712345678', 'Kin', 'Toothache', '3 days', 'Regular',
+                     'Nil', 'Dental caries', 'Composite filling', 'Review in 2 weeks',
+                     charged, 'Ibuprofen 400mg', paid, charged - paid))
+    return _calls(add_patient_visit, args)
+
+
+def _export_pdf(names):
+    # export_patient_to_pdf minus the save dialog: same load and render path
+    from utils.export_pdf import export_patient_history
+
+    def prepare(practice, runs):
+        chosen = names(practice, runs)
+        return _calls(export_patient_history,
+                      [(name, os.path.join(practice.work_dir, f"export_{i}.pdf")) for i, name in enumerate(chosen)])
+    return prepare
+
+
+def _render_pdf(visits):
+    # Only the layout and drawing: the records are built up front
+    def prepare(practice, runs):
+        from utils.benchmarks.clinic import _visit
+        from utils.export_pdf import render_patient_pdf
+
+        data = {'name': practice.heaviest,
+                'records': [_visit(practice.rng, 40, 'Female', '0712345678', 'Kin') for _ in range(visits)]}
+        return _calls(render_patient_pdf,
+                      [(data, os.path.join(practice.work_dir, f"render_{i}.pdf")) for i in range(runs)])
+    return prepare
+
+
+def _search_terms(practice, runs):
+    """Keystroke sequences: every prefix of a name, part of a surname, then cleared."""
+    terms = []
+    while len(terms) < runs:
+        name = practice.rng.choice(practice.names)
+        terms.extend(name[:end] for end in range(1, len(name) + 1))
+        terms.append(name.split()[-1][:3].lower())
+        terms.append('')
+    return terms[:runs]
+
+
+def _search(practice, runs):
+    index = PatientSearchIndex(practice.names)
+    return _calls(index.search, [(term,) for term in _search_terms(practice, runs)])
+
+
+def _build_search_index(practice, runs):
+    return _calls(PatientSearchIndex, [(practice.names,)] * runs)
+
+
+def _render_history(names):
+    def prepare(practice, runs):
+        view = history_view()
+        chosen = names(practice, runs)
+        # Patients are loaded up front; only the rendering is timed
+        loaded = {name: load_patient(name) for name in set(chosen)}
+        return _calls(view.render, [(name, loaded[name]) for name in chosen])
+    return prepare
+
+
+class _TextBuffer:
+    """Stands in for the history Text widget when there is no display."""
+
+    def __init__(self):
+        self.parts = []
+
+    def insert(self, index, text, *tags):
+        self.parts.append(text)
+
+    def delete(self, first, last=None):
+        self.parts = []
+
+    def tag_ranges(self, tag):
+        return ()
+
+
+class _AfterQueue:
+    """Stands in for root.after(): callbacks run when the view drains them."""
+
+    def __init__(self):
+        self.pending = {}
+        self.next_id = 0
+
+    def after(self, ms, callback, *args):
+        self.next_id += 1
+        self.pending[self.next_id] = (callback, args)
+        return self.next_id
+
+    def after_cancel(self, after_id):
+        self.pending.pop(after_id, None)
+
+    def update(self):
+        for after_id in list(self.pending):
+            callback, args = self.pending.pop(after_id)
+            callback(*args)
+
+
+def history_view():
+    """The dashboard's history pane on its own, rendering into a hidden Tk window
+    when there is a display and into a text buffer otherwise."""
+    # Imported the way main.py imports it (the package directory is on sys.path)
+    from dashboard import HISTORY_PAGE_SIZE, ModernPearlTrack
+
+    class HistoryView:
+        render_patient_history = ModernPearlTrack.render_patient_history
+        render_history_chunk = ModernPearlTrack.render_history_chunk
+        cancel_history_render = ModernPearlTrack.cancel_history_render
+
+        def __init__(self):
+            try:
+                import tkinter as tk
+                self.root = tk.Tk()
+                self.root.withdraw()
+                self.history_text = tk.Text(self.root, wrap='word')
+                self.history_text.pack()
+            except Exception:
+                self.root = _AfterQueue()
+                self.history_text = _TextBuffer()
+            self._history_patient = None
+            self._history_records = []
+            self._history_shown = 0
+            self._history_limit = HISTORY_PAGE_SIZE
+            self._history_after_id = None
+
+        def render(self, name, data):
+            """Renders a patient's first page of history, chunks included."""
+            self._history_patient = None
+            self.render_patient_history(name, data)
+            while self._history_after_id is not None:
+                self.root.update()
+
+    return HistoryView()
+
+
+def _random_names(practice, runs):
+    return practice.sample_names(runs)
+
+
+def _heaviest(practice, runs):
+    return [practice.heaviest] * runs
+
+
+SCENARIOS = [
+    Scenario('get_all_patients', _same_call(get_all_patients), max_runs=20),
+    Scenario('get_patient_index', _same_call(get_patient_index)),
+    Scenario('load_patient', _load_patients),
+    Scenario('load_patient (most visits)', _load_heaviest),
+    Scenario('add_patient_visit', _add_visits),
+    Scenario('get_todays_appointments', _same_call(get_todays_appointments)),
+    Scenario('get_appointments (first page)', _same_call(get_appointments)),
+    Scenario('get_all_appointments', _same_call(get_all_appointments), max_runs=20),
+    Scenario('export_patient_to_pdf', _export_pdf(_random_names), max_runs=20),
+    Scenario('export_patient_to_pdf (most visits)', _export_pdf(_heaviest), max_runs=3),
+    # The plain canvas code this layout replaced drew 300 visits in about 0.3 s
+    Scenario('render_patient_pdf (300 visits)', _render_pdf(300), max_runs=10, budget_ms=1000),
+    Scenario('search keystroke', _search),
+    Scenario('search index build', _build_search_index, max_runs=10),
+    Scenario('history render', _render_history(_random_names)),
+    Scenario('history render (most visits)', _render_history(_heaviest)),
+]
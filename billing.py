@@ -0,0 +1,128 @@
+import heapq
+from datetime import datetime
+from utils.storage import db, increment
+from utils.push_ids import push_id_timestamp
+from utils.local_cache import get_cached_patient_index, overlay_pending
+
+# Practice-wide running totals, updated by the same multi-path write that
+# adds a visit, so receivables never need a scan of the visit records.
+# Per-patient totals live in the patient index (total_charged, total_paid,
+# balance); these add the practice totals and one bucket per day.
+BILLING_TOTALS_PATH = 'billing_totals'
+BILLING_DAILY_PATH = 'billing_daily'
+
+# Visits re-keyed from old list records carry their list position, not a
+# time, in the push-ID timestamp; anything this early has no real date
+EARLIEST_VISIT_MS = 24 * 60 * 60 * 1000
+
+def empty_totals():
+    return {'visits': 0, 'charged': 0, 'paid': 0, 'balance': 0}
+
+def visit_billing_updates(day, charged, paid, balance):
+    """Multi-path update entries that add one visit's amounts to the running totals."""
+    amounts = {'visits': 1, 'charged': charged or 0, 'paid': paid or 0, 'balance': balance or 0}
+    updates = {f'{BILLING_TOTALS_PATH}/{key}': increment(value) for key, value in amounts.items()}
+    if day:
+        updates.update({f'{BILLING_DAILY_PATH}/{day}/{key}': increment(value) for key, value in amounts.items()})
+    return updates
+
+def patient_removal_updates(summary):
+    """Multi-path update entries that take a deleted patient's totals out of the practice totals.
+
+    Daily buckets are left alone: they record what was billed and paid on
+    each day, which stays true after the patient is removed.
+    """
+    return {
+        f'{BILLING_TOTALS_PATH}/visits': increment(-(summary.get('visits') or 0)),
+        f'{BILLING_TOTALS_PATH}/charged': increment(-(summary.get('total_charged') or 0)),
+        f'{BILLING_TOTALS_PATH}/paid': increment(-(summary.get('total_paid') or 0)),
+        f'{BILLING_TOTALS_PATH}/balance': increment(-(summary.get('balance') or 0)),
+    }
+
+def totals_from_index(index):
+    """Practice totals summed from patient summaries (used offline and to check the counters)."""
+    totals = empty_totals()
+    for summary in (index or {}).values():
+        totals['visits'] += summary.get('visits') or 0
+        totals['charged'] += summary.get('total_charged') or 0
+        totals['paid'] += summary.get('total_paid') or 0
+        totals['balance'] += summary.get('balance') or 0
+    return totals
+
+def get_billing_totals():
+    """Practice-wide {visits, charged, paid, balance}, from the maintained counters."""
+    try:
+        totals = overlay_pending(BILLING_TOTALS_PATH, db.reference(BILLING_TOTALS_PATH).get())
+    except Exception as e:
+        print(f"Using cached patient index for billing totals: {e}")
+        return totals_from_index(get_cached_patient_index())
+    return dict(empty_totals(), **(totals or {}))
+
+def get_daily_billing(start_date=None, end_date=None):
+    """{day: {visits, charged, paid, balance}} per day, optionally limited to a date range."""
+    ref = db.reference(BILLING_DAILY_PATH).order_by_key()
+    if start_date:
+        ref = ref.start_at(start_date)
+    if end_date:
+        ref = ref.end_at(end_date)
+    days = overlay_pending(BILLING_DAILY_PATH, dict(ref.get() or {})) or {}
+    return {day: dict(empty_totals(), **totals) for day, totals in sorted(days.items())
+            if (not start_date or day >= start_date) and (not end_date or day <= end_date)}
+
+def get_billing_on(day):
+    """One day's {visits, charged, paid, balance}."""
+    return get_daily_billing(day, day).get(day, empty_totals())
+
+def top_receivables(index, limit=None):
+    """Patient summaries with money still owed, largest balance first.
+
+    Works from the patient index (or a live copy of it), so no visit
+    records are read.
+    """
+    owing = [dict(summary, name=name) for name, summary in (index or {}).items()
+             if (summary.get('balance') or 0) > 0]
+    if limit is not None:
+        return heapq.nlargest(limit, owing, key=lambda summary: summary['balance'])
+    return sorted(owing, key=lambda summary: summary['balance'], reverse=True)
+
+def visit_day(visit_key):
+    """The day a push-keyed visit was added (YYYY-MM-DD), or None for legacy keys."""
+    timestamp_ms = push_id_timestamp(visit_key)
+    if timestamp_ms is None or timestamp_ms < EARLIEST_VISIT_MS:
+        return None
+    return datetime.fromtimestamp(timestamp_ms / 1000).date().isoformat()
+
+def add_visit_to_billing(totals, daily, visit_key, record):
+    """Adds one stored visit to in-memory practice totals and {day: totals} buckets."""
+    amounts = {
+        'visits': 1,
+        'charged': record.get('amount_charged') or 0,
+        'paid': record.get('amount_paid') or 0,
+        'balance': record.get('balance') or 0,
+    }
+    buckets = [totals]
+    day = visit_day(visit_key)
+    if day:
+        buckets.append(daily.setdefault(day, empty_totals()))
+    for bucket in buckets:
+        for field, value in amounts.items():
+            bucket[field] += value
+
+def rebuild_billing():
+    """Rebuilds the practice totals and daily buckets from 'patients' (one-off migration).
+
+    Visits are dated by their push-ID timestamp; visits without a real one
+    (converted list records) count towards the totals only.
+    """
+    patients = db.reference('patients').get() or {}
+    totals = empty_totals()
+    daily = {}
+    for data in patients.values():
+        records = (data or {}).get('records') or {}
+        if isinstance(records, list):
+            records = {str(i): record for i, record in enumerate(records)}
+        for key, record in records.items():
+            if record:
+                add_visit_to_billing(totals, daily, key, record)
+    db.reference().update({BILLING_TOTALS_PATH: totals, BILLING_DAILY_PATH: daily or None})
+    return totals
@@ -1,21 +1,125 @@
+import importlib
+import threading
+import time
 import tkinter as tk
-from tkinter import ttk, messagebox, font
-from datetime import date
-from firebase_realtime import initialize_firebase  # Import Firebase initialization
-from firebase_admin import db  # Import Firebase database functions
+from tkinter import ttk, messagebox, font, filedialog
+from datetime import date, timedelta
 from utils.appointments import (
     add_appointment,
     get_todays_appointments,
-    get_all_appointments,
+    get_appointments,
+    get_appointments_on,
+    get_earlier_appointments,
+    count_appointments,
+    get_cached_appointment_page,
     delete_appointment
 )
 from utils.patients import (
-    get_all_patients,
+    get_patient_names,
+    get_patient_index,
+    get_cached_patient_names,
+    count_patients,
     load_patient,
+    get_loaded_patient,
+    invalidate_patient,
+    load_cached_patient,
     add_patient_visit,
     delete_patient
 )
-from utils.export_pdf import export_patient_to_pdf
+from utils.analytics import export_monthly_report, get_visits
+from utils.billing import get_billing_totals, get_billing_on, get_daily_billing, top_receivables, totals_from_index
+from utils.search_index import PatientSearchIndex
+from utils.listbox_sync import sync_listbox
+from utils.io_worker import IOWorker, TASK_EXPORT, TASK_SUBSCRIBE, TASK_WRITE
+from utils.local_cache import (
+    describe_outbox_entry,
+    discard_outbox_entry,
+    get_cached_appointment_stat,
+    get_cached_patient_index,
+    get_held_back_writes,
+    retry_outbox_entry,
+    start_background_sync,
+    sync_status
+)
+from utils.live_model import LiveCollection, subscribe
+from utils.appointment_window import AppointmentWindow
+from utils.metrics import (
+    disable_log,
+    enable_log,
+    instrumented,
+    log_path,
+    record_error,
+    reset as reset_metrics,
+    slowest_calls,
+    snapshot as metrics_snapshot
+)
+
+# Quiet period after the last keystroke before the patient list is filtered
+SEARCH_DEBOUNCE_MS = 150
+
+# Appointments are fetched a page at a time as the list is scrolled
+APPOINTMENTS_PAGE_SIZE = 100
+# Fetch the next page once the visible part of the list passes this fraction
+APPOINTMENTS_PREFETCH_AT = 0.8
+
+# Days of billing history listed on the receivables screen
+RECEIVABLES_DAYS = 30
+
+# The diagnostics screen is opened with this shortcut and redraws itself this often
+DIAGNOSTICS_SHORTCUT = '<Control-Shift-D>'
+DIAGNOSTICS_REFRESH_MS = 2000
+
+# PDF export (reportlab) is not imported at startup; these modules are
+# imported on a background thread this long after the first paint instead
+PRELOAD_MODULES = ['utils.export_pdf']
+PRELOAD_DELAY_MS = 1500
+
+# Screens are built once; their data is refreshed on show when older than this
+SCREEN_STALE_AFTER = 60
+
+# Visit history is rendered newest first, a chunk per Tk idle slot, up to a
+# page at a time; older pages load on scroll or via the "show older" link
+HISTORY_CHUNK_SIZE = 10
+HISTORY_PAGE_SIZE = 50
+HISTORY_PREFETCH_AT = 0.9
+
+# Visit fields shown in the history, in display order
+HISTORY_FIELDS = [
+    ('age', "Age: {}"),
+    ('gender', "Gender: {}"),
+    ('contact', "Contact: {}"),
+    ('next_of_kin', "Next of kin: {}"),
+    ('chief_complain', "Chief Complain: {}"),
+    ('hpc', "Hpc: {}"),
+    ('pdh', "Pdh: {}"),
+    ('pmh', "Pmh: {}"),
+    ('diagnosis', "Diagnosis: {}"),
+    ('treatment', "Treatment: {}"),
+    ('management', "Management: {}"),
+    ('amount_charged', "Charged: Ksh{:.2f}"),
+    ('amount_paid', "Paid: Ksh{:.2f}"),
+    ('balance', "Balance: Ksh{:.2f}"),
+    ('medication', "Medication: {}"),
+]
+
+
+def format_visit(record):
+    """Formats one visit for the history view, showing only filled fields"""
+    lines = [template.format(record[field]) for field, template in HISTORY_FIELDS if record.get(field)]
+    lines.append("-" * 30)
+    return "\n".join(lines) + "\n\n"
+
+
+def preload_modules():
+    """Imports PRELOAD_MODULES on a background thread so the first export does not wait for them"""
+    def load():
+        for name in PRELOAD_MODULES:
+            try:
+                importlib.import_module(name)
+            except Exception as e:
+                print(f"Error preloading {name}: {e}")
+
+    threading.Thread(target=load, name="pearltrack-preload", daemon=True).start()
 
 
 class ModernPearlTrack:
@@ -25,9 +129,6 @@ class ModernPearlTrack:
         self.root.geometry("1400x900")
         self.root.configure(bg="#f8fbff")
         self.root.state('zoomed')  # Maximize window
-        
-        # Initialize Firebase
-        initialize_firebase()  # Ensure Firebase is initialized
 
         # Modern dental color scheme
         self.colors = {
@@ -57,8 +158,103 @@ class ModernPearlTrack:
         }
         
         self.setup_styles()
-        self.status_label = None
+        self.search_index = PatientSearchIndex()
+        self.patient_rows = []
+        self._search_after_id = None
+        self._search_generation = 0
+        self._history_task = None
+        self._history_patient = None
+        self._history_records = []  # newest first
+        self._history_shown = 0
+        self._history_limit = HISTORY_PAGE_SIZE
+        self._history_after_id = None
+        self.current_screen = None
+        self.screens = {}
+        self._screen_refreshed = {}
+        self._stale_screens = set()
+        self.current_patient = None
+        self.appointment_rows = []
+        self.export_rows = []
+        self.receivable_rows = []
+
+        # Live copies of Firebase collections, fed by listen() streams. For
+        # appointments only the per-day counters are streamed; a changed
+        # count refetches that day if it is inside the loaded window.
+        self.appointment_counts_model = LiveCollection()
+        self.patient_index_model = LiveCollection()
+        self.appointment_window = AppointmentWindow()
+        self._listeners = []
+        self._painted_from_cache = False
+
+        # All database calls run on this pool; results come back via root.after
+        self.loading_frame = None
+        self.io = IOWorker(self.root, on_busy_change=self.on_io_busy_change)
+
+        # Writes go to the local outbox first and are synced to Firebase from here
+        start_background_sync()
         self.setup_ui()
+        self.start_listeners()
+        self.root.after(PRELOAD_DELAY_MS, preload_modules)
+
+    def start_listeners(self):
+        """Subscribe to appointment and patient index changes made at any workstation"""
+        for collection, handler in [('appointment_stats/by_date', self.on_appointment_counts_event),
+                                    ('patient_index', self.on_patient_index_event)]:
+            # Events arrive on the listener thread; hand them to the Tk thread
+            callback = lambda *event, handler=handler: self.io.post(handler, *event)
+            self.io.submit(subscribe, collection, callback, on_success=self._listeners.append, kind=TASK_SUBSCRIBE,
+                           on_error=lambda e, c=collection: print(f"Error listening to {c}: {e}"))
+
+    def shutdown(self):
+        for registration in self._listeners:
+            registration.close()
+        self._listeners = []
+        self.io.shutdown()
+
+    @instrumented('ui.on_appointment_counts_event')
+    def on_appointment_counts_event(self, event_type, path, data):
+        was_loaded = self.appointment_counts_model.loaded
+        changed = self.appointment_counts_model.apply_event(event_type, path, data)
+        if was_loaded:
+            self.mark_stale('dashboard')
+        if not was_loaded or 'appointments' not in self.screens:
+            return  # First snapshot, or no schedule built to update
+
+        for day in changed:
+            if self.appointment_window.covers(day):
+                self.io.submit(get_appointments_on, day,
+                               on_success=lambda appointments, day=day: self.on_appointment_day_loaded(day, appointments),
+                               on_error=lambda e: print(f"Error refreshing appointments: {e}"))
+
+    def on_appointment_day_loaded(self, day, appointments):
+        rows = [(id_, appt['patient_name'], appt['contact'], appt['reason'], appt['date'], appt['time'])
+                for id_, appt in appointments.items()]
+        self.appointment_window.replace_day(day, rows)
+        self.render_appointments(self.appointment_window.rows())
+
+    @instrumented('ui.on_patient_index_event')
+    def on_patient_index_event(self, event_type, path, data):
+        changed = self.patient_index_model.apply_event(event_type, path, data)
+        if not changed:
+            return
+        for name in changed:
+            # The patient was written elsewhere; drop any copy loaded here
+            invalidate_patient(name)
+            if name in self.patient_index_model.items:
+                self.search_index.add(name)
+            else:
+                self.search_index.remove(name)
+
+        self.mark_stale('dashboard')
+        if 'patients' in self.screens:
+            self.refresh_patient_list()
+            if self.current_patient in changed and self.current_patient in self.patient_index_model.items:
+                self.show_patient_history(self.current_patient)
+        if 'export' in self.screens:
+            self.render_export_list(self.search_index.search(''))
+        if 'receivables' in self.screens:
+            self.render_receivables(self.patient_index_model.items)
+        self.mark_stale('receivables')
 
     def setup_styles(self):
         """Configure modern ttk styles"""
@@ -169,9 +365,22 @@ class ModernPearlTrack:
         subtitle_label = tk.Label(content, text=subtitle, font=self.fonts['small'],
                                 bg=self.colors['card'], fg=self.colors['text_light'])
         subtitle_label.pack(anchor='w')
-        
+
+        # Kept so update_stat_card can fill the card in when its data arrives
+        shadow_frame.parts = {'value': value_label, 'subtitle': subtitle_label,
+                              'icon_frame': icon_frame, 'icon': icon_label}
         return shadow_frame
 
+    def update_stat_card(self, card, value, subtitle, icon_text=None, color=None):
+        """Fill in a statistics card created with placeholder values"""
+        card.parts['value'].configure(text=str(value))
+        card.parts['subtitle'].configure(text=subtitle)
+        if icon_text:
+            card.parts['icon'].configure(text=icon_text)
+        if color:
+            card.parts['icon_frame'].configure(bg=color)
+            card.parts['icon'].configure(bg=color)
+
     def setup_ui(self):
         # Create main scrollable canvas
         self.main_canvas = tk.Canvas(self.root, bg=self.colors['background'], highlightthickness=0)
@@ -287,6 +496,27 @@ class ModernPearlTrack:
                                 bg=self.colors['card'], fg=self.colors['text_light'])
         practice_label.pack(anchor='e')
 
+        # Loading indicator, shown only while database requests are in flight
+        self.loading_frame = tk.Frame(right_frame, bg=self.colors['card'])
+        self.loading_label = tk.Label(self.loading_frame, text="", font=self.fonts['small'],
+                                      bg=self.colors['card'], fg=self.colors['primary_dark'])
+        self.loading_label.pack(side='left')
+        cancel_label = tk.Label(self.loading_frame, text="✖ Cancel", font=self.fonts['small'],
+                                bg=self.colors['card'], fg=self.colors['danger'], cursor='hand2')
+        cancel_label.pack(side='left', padx=(8, 0))
+        cancel_label.bind('<Button-1>', lambda e: self.io.cancel_all())
+
+    def on_io_busy_change(self, pending):
+        """Show or hide the loading indicator as background requests start and finish"""
+        if self.loading_frame is None:
+            return
+        if pending:
+            self.loading_label.config(text=f"⏳ Loading... ({pending})")
+            if not self.loading_frame.winfo_ismapped():
+                self.loading_frame.pack(anchor='e', pady=(4, 0))
+        else:
+            self.loading_frame.pack_forget()
+
     def create_navigation(self, parent):
         """Create modern navigation bar"""
         nav_frame = tk.Frame(parent, bg=self.colors['background'])
@@ -296,6 +526,7 @@ class ModernPearlTrack:
             ("🏠 Dashboard", self.show_dashboard, 'Primary'),
             ("📅 Appointments", self.show_appointments, 'Nav'),
             ("👥 Patient Records", self.show_patients, 'Nav'),
+            ("💰 Receivables", self.show_receivables, 'Nav'),
             ("📊 Export Reports", self.show_export, 'Nav')
         ]
         
@@ -303,19 +534,42 @@ class ModernPearlTrack:
             btn = ttk.Button(nav_frame, text=text, command=command, style=f'{style}.TButton')
             btn.pack(side='left', padx=(0, 15))
 
-    def clear_content(self):
-        for widget in self.content_frame.winfo_children():
-            widget.destroy()
-
-        if self.status_label:
-            self.status_label.destroy()
-            self.status_label = None
+        # Hidden until the diagnostics shortcut is pressed once
+        self.diagnostics_button = ttk.Button(nav_frame, text="🩺 Diagnostics", command=self.show_diagnostics,
+                                             style='Nav.TButton')
+        self.root.bind(DIAGNOSTICS_SHORTCUT, lambda e: self.show_diagnostics())
+
+    @instrumented('ui.show_screen', detail_arg=1)
+    def show_screen(self, name, build, refresh):
+        """Raise a screen, building it the first time and refreshing its data only when stale"""
+        if self.current_screen in self.screens:
+            self.screens[self.current_screen].pack_forget()
+
+        frame = self.screens.get(name)
+        if frame is None:
+            frame = tk.Frame(self.content_frame, bg=self.colors['background'])
+            build(frame)
+            self.screens[name] = frame
+            self._stale_screens.add(name)
+        frame.pack(fill='both', expand=True)
+        self.current_screen = name
+
+        age = time.monotonic() - self._screen_refreshed.get(name, 0)
+        if name in self._stale_screens or age > SCREEN_STALE_AFTER:
+            self._stale_screens.discard(name)
+            self._screen_refreshed[name] = time.monotonic()
+            refresh()
+
+    def mark_stale(self, *names):
+        """Have these screens refresh their data the next time they are shown"""
+        self._stale_screens.update(names)
 
     def show_dashboard(self):
-        self.clear_content()
-        
+        self.show_screen('dashboard', self.build_dashboard, self.refresh_dashboard)
+
+    def build_dashboard(self, parent):
         # Welcome section
-        welcome_content, welcome_shadow = self.create_modern_card(self.content_frame, 
+        welcome_content, welcome_shadow = self.create_modern_card(parent, 
                                                                  "Welcome to PearlTrack Dental Suite")
         welcome_shadow.pack(fill='x', pady=(0, 30))
         
@@ -327,27 +581,38 @@ class ModernPearlTrack:
         welcome_text.pack(pady=25, padx=25)
         
         # Statistics section
-        stats_frame = tk.Frame(self.content_frame, bg=self.colors['background'])
+        stats_frame = tk.Frame(parent, bg=self.colors['background'])
         stats_frame.pack(fill='x', pady=(0, 30))
-        
-        # Get real data
-        total_patients = len(get_all_patients())
-        total_today = len(get_todays_appointments())
-        total_all = len(get_all_appointments())
-        
+
+        # Cards start as placeholders and are filled in as each query returns
         stats_data = [
-            ("Total Patients", total_patients, f"{total_patients} registered", "👥", self.colors['primary']),
-            ("Today's Appointments", total_today, f"{total_today} scheduled today", "📅", self.colors['secondary']),
-            ("All Appointments", total_all, f"{total_all} total appointments", "🕒", self.colors['accent']),
-            ("Active Status", "Online", "System operational", "✅", self.colors['success'])
+            ("Total Patients", "…", "Loading...", "👥", self.colors['primary']),
+            ("Today's Appointments", "…", "Loading...", "📅", self.colors['secondary']),
+            ("All Appointments", "…", "Loading...", "🕒", self.colors['accent']),
+            ("Active Status", "…", "Checking...", "✅", self.colors['success'])
         ]
-        
+        cards = []
         for title, value, subtitle, icon, color in stats_data:
             card = self.create_stat_card(stats_frame, title, value, subtitle, icon, color)
             card.pack(side='left', padx=15)
+            cards.append(card)
+
+        # Shown only while some changes are held back from syncing
+        self.sync_issues_frame = tk.Frame(parent, bg=self.colors['background'])
+        self.sync_issues_label = tk.Label(self.sync_issues_frame, text="", font=self.fonts['body'],
+                                          bg=self.colors['background'], fg=self.colors['danger'])
+        self.sync_issues_label.pack(side='left')
+        ttk.Button(self.sync_issues_frame, text="Review Changes", style='Nav.TButton',
+                   command=self.show_held_back_writes).pack(side='left', padx=(15, 0))
+        self.stats_frame = stats_frame
+
+        # Billing cards, read from the running totals kept by every visit write
+        billing_frame = tk.Frame(parent, bg=self.colors['background'])
+        billing_frame.pack(fill='x', pady=(0, 30))
+        self.billing_cards = self.create_billing_cards(billing_frame)
         
         # Recent activity section
-        activity_content, activity_shadow = self.create_modern_card(self.content_frame, 
+        activity_content, activity_shadow = self.create_modern_card(parent, 
                                                                    "Recent Activity")
         activity_shadow.pack(fill='both', expand=True)
         
@@ -357,10 +622,11 @@ class ModernPearlTrack:
         
         activities = [
             "System started successfully",
-            f"Loaded {total_patients} patient records",
-            f"Found {total_today} appointments for today",
+            "Loading patient records...",
+            "Checking today's appointments...",
             "Ready for patient management"
         ]
+        activity_labels = []
         
         for activity in activities:
             activity_item = tk.Frame(activity_frame, bg=self.colors['primary_light'], height=40)
@@ -370,12 +636,138 @@ class ModernPearlTrack:
             activity_label = tk.Label(activity_item, text=f"• {activity}", font=self.fonts['body'],
                                     bg=self.colors['primary_light'], fg=self.colors['text'])
             activity_label.pack(anchor='w', padx=15, pady=10)
+            activity_labels.append(activity_label)
+
+        self.dashboard_cards = cards
+        self.activity_labels = activity_labels
+
+    @instrumented('ui.refresh_dashboard')
+    def refresh_dashboard(self):
+        patients_card, today_card, all_card, status_card = self.dashboard_cards
+        activity_labels = self.activity_labels
+
+        def on_patients(total_patients):
+            self.update_stat_card(patients_card, total_patients, f"{total_patients} registered")
+            activity_labels[1].configure(text=f"• Loaded {total_patients} patient records")
+
+        def on_today_count(total_today):
+            self.update_stat_card(today_card, total_today, f"{total_today} scheduled today")
+            activity_labels[2].configure(text=f"• Found {total_today} appointments for today")
+
+        def on_today(todays):
+            on_today_count(len(todays))
+
+        def on_all(total_all):
+            self.update_stat_card(all_card, total_all, f"{total_all} total appointments")
+
+        def on_status(status):
+            if status['online']:
+                value, icon, color = "Online", "✅", self.colors['success']
+            else:
+                value, icon, color = "Offline", "⚠", self.colors['danger']
+            subtitle = f"{status['pending']} changes waiting to sync" if status['pending'] else "System operational"
+            if status['conflicts']:
+                subtitle += f", {status['conflicts']} conflicts"
+            if status['failed']:
+                subtitle += f", {status['failed']} failed"
+            self.update_stat_card(status_card, value, subtitle, icon, color)
+
+            held = status['conflicts'] + status['failed']
+            if held:
+                self.sync_issues_label.configure(text=f"⚠ {held} changes could not be synced")
+                if not self.sync_issues_frame.winfo_manager():
+                    self.sync_issues_frame.pack(fill='x', padx=15, pady=(0, 30), after=self.stats_frame)
+            else:
+                self.sync_issues_frame.pack_forget()
+
+        if not self._painted_from_cache:
+            self._painted_from_cache = True
+            self.paint_dashboard_from_cache(on_patients, on_today_count, on_all)
+
+        # The queries run side by side on the I/O pool, so the cards are
+        # complete after the slowest one rather than the sum of all four
+        if self.patient_index_model.loaded:
+            on_patients(len(self.patient_index_model.items))
+        else:
+            self.io.submit(count_patients, on_success=on_patients,
+                           on_error=lambda e: print(f"Error counting patients: {e}"))
+        self.io.submit(get_todays_appointments, on_success=on_today,
+                       on_error=lambda e: print(f"Error loading today's appointments: {e}"))
+        self.io.submit(count_appointments, on_success=on_all,
+                       on_error=lambda e: print(f"Error counting appointments: {e}"))
+        self.io.submit(sync_status, on_success=on_status,
+                       on_error=lambda e: print(f"Error reading sync status: {e}"))
+        self.load_billing_cards(self.billing_cards)
+
+    def paint_dashboard_from_cache(self, on_patients, on_today_count, on_all):
+        """Fills the cards from the local cache on first show, so the window opens with the
+        figures from the last session instead of placeholders; the live queries replace them.
+        Appointment cards come from the cached counters and stay blank if none are cached."""
+        try:
+            index = get_cached_patient_index()
+            total_appointments = get_cached_appointment_stat('total')
+            counts_by_date = get_cached_appointment_stat('by_date')
+        except Exception as e:
+            print(f"Error reading the local cache: {e}")
+            return
+        if total_appointments is not None:
+            on_all(total_appointments)
+        if counts_by_date is not None:
+            on_today_count(counts_by_date.get(date.today().isoformat()) or 0)
+        if not index:
+            return  # First run: nothing cached yet
+        on_patients(len(index))
+        totals = totals_from_index(index)
+        outstanding_card, _, collected_card = self.billing_cards
+        self.update_stat_card(outstanding_card, f"{totals['balance']:,.0f}",
+                              f"Ksh owed over {totals['visits']} visits")
+        self.update_stat_card(collected_card, f"{totals['paid']:,.0f}",
+                              f"Ksh of Ksh{totals['charged']:,.0f} billed")
+
+    def create_billing_cards(self, parent):
+        """Outstanding, billed-today and collected cards, as placeholders until loaded"""
+        billing_data = [
+            ("Outstanding Balance", "…", "Loading...", "💰", self.colors['danger']),
+            ("Billed Today", "…", "Loading...", "🧾", self.colors['secondary']),
+            ("Total Collected", "…", "Loading...", "💵", self.colors['success'])
+        ]
+        cards = []
+        for title, value, subtitle, icon, color in billing_data:
+            card = self.create_stat_card(parent, title, value, subtitle, icon, color)
+            card.pack(side='left', padx=15)
+            cards.append(card)
+        return cards
+
+    def load_billing_cards(self, cards):
+        outstanding_card, today_card, collected_card = cards
+
+        def on_totals(totals):
+            self.update_stat_card(outstanding_card, f"{totals['balance']:,.0f}",
+                                  f"Ksh owed over {totals['visits']} visits")
+            self.update_stat_card(collected_card, f"{totals['paid']:,.0f}",
+                                  f"Ksh of Ksh{totals['charged']:,.0f} billed")
+
+        def on_today(day):
+            self.update_stat_card(today_card, f"{day['charged']:,.0f}",
+                                  f"Ksh over {day['visits']} visits, Ksh{day['paid']:,.0f} paid")
+
+        self.io.submit(get_billing_totals, on_success=on_totals,
+                       on_error=lambda e: print(f"Error reading billing totals: {e}"))
+        self.io.submit(get_billing_on, date.today().isoformat(), on_success=on_today,
+                       on_error=lambda e: print(f"Error reading today's billing: {e}"))
 
     def show_appointments(self):
-        self.clear_content()
-        
+        self.show_screen('appointments', self.build_appointments, self.refresh_appointments)
+
+    def refresh_appointments(self):
+        # Once loaded, the schedule is kept current by the day counters listener
+        if self.appointment_counts_model.loaded and self.appointment_window.started:
+            return
+        self.load_appointments()
+
+    def build_appointments(self, parent):
         # Page title
-        title_frame = tk.Frame(self.content_frame, bg=self.colors['background'])
+        title_frame = tk.Frame(parent, bg=self.colors['background'])
         title_frame.pack(fill='x', pady=(0, 20))
         
         title_label = tk.Label(title_frame, text="📅 Appointment Management", font=self.fonts['title'],
@@ -388,7 +780,7 @@ class ModernPearlTrack:
         subtitle_label.pack(anchor='w', pady=(5, 0))
         
         # Main container
-        main_container = tk.Frame(self.content_frame, bg=self.colors['background'])
+        main_container = tk.Frame(parent, bg=self.colors['background'])
         main_container.pack(fill='both', expand=True)
         
         # Left side - Add appointment form
@@ -439,7 +831,13 @@ class ModernPearlTrack:
         scrollbar = tk.Scrollbar(list_frame)
         scrollbar.pack(side='right', fill='y')
         
-        self.appointments_listbox = tk.Listbox(list_frame, yscrollcommand=scrollbar.set,
+        def on_list_scroll(first, last):
+            scrollbar.set(first, last)
+            # Fetch the next page before the user reaches the end of the list
+            if float(last) >= APPOINTMENTS_PREFETCH_AT:
+                self.load_more_appointments()
+
+        self.appointments_listbox = tk.Listbox(list_frame, yscrollcommand=on_list_scroll,
                                              font=self.fonts['body'], relief='flat',
                                              selectbackground=self.colors['primary_light'],
                                              highlightthickness=1, 
@@ -453,9 +851,14 @@ class ModernPearlTrack:
         
         ttk.Button(button_frame, text="🗑 Delete Selected", style='Danger.TButton',
                   command=self.delete_appointment_clicked).pack(side='right')
-        self.load_appointments()
+        # The list starts at today; past appointments are loaded on request
+        self.earlier_appointments_button = ttk.Button(button_frame, text="⬆ Earlier Appointments",
+                                                      style='Secondary.TButton',
+                                                      command=self.load_earlier_appointments)
+        self.earlier_appointments_button.pack(side='left')
 
 
+    @instrumented('ui.add_appointment_clicked')
     def add_appointment_clicked(self):
         try:
              
@@ -470,57 +873,134 @@ class ModernPearlTrack:
               messagebox.showerror("Error", "Please fill in all fields")
               return
 
-            # Save to database
-            add_appointment(name, contact, reason, date_str, time_str)
+            # Save to database in the background
+            self.io.submit(add_appointment, name, contact, reason, date_str, time_str, kind=TASK_WRITE,
+                           on_success=lambda appt_id: self.on_appointment_added(appt_id, {
+                               'patient_name': name, 'contact': contact, 'reason': reason,
+                               'date': date_str, 'time': time_str}),
+                           on_error=lambda e: messagebox.showerror("Error", f"Failed to add appointment:\n{e}"))
 
-            # Refresh the list
-            self.load_appointments()
+        except Exception as e:
+            messagebox.showerror("Error", f"Failed to add appointment:\n{e}")
 
-            # Clear form
-            for field in self.appointment_entries.values():
-               field.delete(0, 'end')
+    def on_appointment_added(self, appointment_id, appointment):
+        # Show the new row right away if it falls inside the loaded window
+        self.appointment_window.put((appointment_id, appointment['patient_name'], appointment['contact'],
+                                     appointment['reason'], appointment['date'], appointment['time']))
+        self.render_appointments(self.appointment_window.rows())
+        self.mark_stale('dashboard')
 
-            # Reset default date
-            self.appointment_entries["Date (YYYY-MM-DD)"].insert(0, date.today().isoformat())
+        # Clear form
+        for field in self.appointment_entries.values():
+           field.delete(0, 'end')
 
-            messagebox.showinfo("Success", "Appointment added successfully!")
+        # Reset default date
+        self.appointment_entries["Date (YYYY-MM-DD)"].insert(0, date.today().isoformat())
 
-        except Exception as e:
-            messagebox.showerror("Error", f"Failed to add appointment:\n{e}")
+        messagebox.showinfo("Success", "Appointment added successfully!")
 
 
+    @instrumented('ui.delete_appointment_clicked')
     def delete_appointment_clicked(self):
         selection = self.appointments_listbox.curselection()
-        if selection:
-            try:
-                index = selection[0]
-                appointments = get_all_appointments()
-                if index < len(appointments):
-                    appointment_id = appointments[index][0]
-                    delete_appointment(appointment_id)
-                    self.load_appointments()
-                    messagebox.showinfo("Success", "Appointment deleted successfully!")
-            except Exception as e:
+        if selection and not self.appointment_window.started:
+            # Still showing the cached rows painted before the first page arrived
+            messagebox.showinfo("Please Wait", "Appointments are still loading, please try again in a moment")
+        elif selection:
+            # The listbox shows the window's rows in order, and the window
+            # keeps each row's ID and date, so the delete targets exactly the
+            # appointment on screen without a lookup
+            row = self.appointment_window.row_at(selection[0])
+            id_, name, contact, reason, date_, time_ = row
+
+            # Drop the row right away; put it back if the delete fails
+            self.appointment_window.remove(id_)
+            self.appointments_listbox.delete(selection[0])
+            del self.appointment_rows[selection[0]]
+            self.mark_stale('dashboard')
+
+            def on_error(e):
+                self.appointment_window.put(row)
+                self.render_appointments(self.appointment_window.rows())
                 messagebox.showerror("Error", f"Failed to delete appointment: {str(e)}")
+
+            self.io.submit(delete_appointment, id_, date_, kind=TASK_WRITE, on_error=on_error,
+                           on_success=lambda _: messagebox.showinfo("Success", "Appointment deleted successfully!"))
         else:
             messagebox.showwarning("Warning", "Please select an appointment to delete")
 
+    @instrumented('ui.load_appointments')
     def load_appointments(self):
-        self.appointments_listbox.delete(0, 'end')
-        try:
-            appointments = get_all_appointments()
-            for appointment in appointments:
-                id_, name, contact, reason, date_, time_ = appointment
-                display_text = f"{date_} {time_} - {name} ({reason} {contact})"
-                self.appointments_listbox.insert('end', display_text)
-        except Exception as e:
+        self.appointment_rows = []
+        today = date.today().isoformat()
+        self.appointment_window.reset(today)
+        self.earlier_appointments_button.state(['!disabled'])
+
+        # Paint the first page straight away from the local cache, then
+        # replace it with the first page from Firebase
+        self.render_appointments(get_cached_appointment_page(today, APPOINTMENTS_PAGE_SIZE))
+        self.load_more_appointments()
+
+    @instrumented('ui.load_more_appointments')
+    def load_more_appointments(self):
+        window = self.appointment_window
+        if window.loading or window.exhausted:
+            return
+        window.loading = True
+
+        def on_page(page):
+            rows, next_cursor = page
+            window.loading = False
+            window.add_page(rows, next_cursor)
+            self.render_appointments(window.rows())
+
+        def on_error(e):
+            window.loading = False
             print(f"Error loading appointments: {e}")
 
+        self.io.submit(get_appointments, limit=APPOINTMENTS_PAGE_SIZE, cursor=window.next_cursor,
+                       on_success=on_page, on_error=on_error)
+
+    @instrumented('ui.load_earlier_appointments')
+    def load_earlier_appointments(self):
+        """Prepend the page of appointments just before the ones loaded"""
+        window = self.appointment_window
+        if window.earlier_loading or window.earlier_exhausted:
+            return
+        window.earlier_loading = True
+
+        def on_page(page):
+            rows, earlier_cursor = page
+            window.earlier_loading = False
+            window.add_earlier_page(rows, earlier_cursor)
+            self.render_appointments(window.rows())
+            self.appointments_listbox.see(0)
+            if window.earlier_exhausted:
+                self.earlier_appointments_button.state(['disabled'])
+
+        def on_error(e):
+            window.earlier_loading = False
+            print(f"Error loading earlier appointments: {e}")
+
+        self.io.submit(get_earlier_appointments, window.start_date, limit=APPOINTMENTS_PAGE_SIZE,
+                       cursor=window.earlier_cursor, on_success=on_page, on_error=on_error)
+
+    @instrumented('ui.render_appointments')
+    def render_appointments(self, appointments):
+        rows = []
+        for appointment in appointments:
+            id_, name, contact, reason, date_, time_ = appointment
+            display_text = f"{date_} {time_} - {name} ({reason} {contact})"
+            rows.append(display_text)
+        # Only rows that changed are touched
+        self.appointment_rows = sync_listbox(self.appointments_listbox, self.appointment_rows, rows)
+
     def show_patients(self):
-        self.clear_content()
-        
+        self.show_screen('patients', self.build_patients, self.load_patients)
+
+    def build_patients(self, parent):
         # Page title
-        title_frame = tk.Frame(self.content_frame, bg=self.colors['background'])
+        title_frame = tk.Frame(parent, bg=self.colors['background'])
         title_frame.pack(fill='x', pady=(0, 20))
         
         title_label = tk.Label(title_frame, text="👥 Patient Records", font=self.fonts['title'],
@@ -533,7 +1013,7 @@ class ModernPearlTrack:
         subtitle_label.pack(anchor='w', pady=(5, 0))
         
         # Main container with three columns
-        main_container = tk.Frame(self.content_frame, bg=self.colors['background'])
+        main_container = tk.Frame(parent, bg=self.colors['background'])
         main_container.pack(fill='both', expand=True)
         
         # Left column - Patient search and list
@@ -569,6 +1049,7 @@ class ModernPearlTrack:
                                         highlightcolor=self.colors['primary'])
         self.patient_listbox.pack(fill='both', expand=True)
         self.patient_listbox.bind('<<ListboxSelect>>', self.on_patient_select)
+        self.patient_rows = []
         scrollbar1.config(command=self.patient_listbox.yview)
         
         # Middle column - Visit history
@@ -578,10 +1059,26 @@ class ModernPearlTrack:
         middle_frame = tk.Frame(middle_content, bg=self.colors['card'])
         middle_frame.pack(fill='both', expand=True, padx=20, pady=20)
         
+        history_scrollbar = tk.Scrollbar(middle_frame)
+        history_scrollbar.pack(side='right', fill='y')
+
+        def on_history_scroll(first, last):
+            history_scrollbar.set(first, last)
+            # Render the next page of older visits as the end comes into view
+            if float(last) >= HISTORY_PREFETCH_AT:
+                self.load_more_history()
+
         self.history_text = tk.Text(middle_frame, font=self.fonts['body'], relief='flat',
                                    wrap='word', highlightthickness=1,
-                                   highlightcolor=self.colors['primary'])
+                                   highlightcolor=self.colors['primary'],
+                                   yscrollcommand=on_history_scroll)
         self.history_text.pack(fill='both', expand=True)
+        history_scrollbar.config(command=self.history_text.yview)
+
+        self.history_text.tag_configure('more', foreground=self.colors['primary'], underline=True)
+        self.history_text.tag_bind('more', '<Button-1>', lambda e: self.load_more_history())
+        self.history_text.tag_bind('more', '<Enter>', lambda e: self.history_text.configure(cursor='hand2'))
+        self.history_text.tag_bind('more', '<Leave>', lambda e: self.history_text.configure(cursor=''))
         
         # Right column - Add visit form
         right_content, right_shadow = self.create_modern_card(main_container, "Add Patient:")
@@ -616,19 +1113,31 @@ class ModernPearlTrack:
         
         ttk.Button(button_frame, text="📄 Export PDF", style='Secondary.TButton',
                   command=self.export_patient_clicked).pack(fill='x', pady=2)
-        
-        self.load_patients()
 
+    @instrumented('ui.on_search_change')
     def on_search_change(self, *args):
-        search_term = self.search_var.get().lower()
-        self.patient_listbox.delete(0, 'end')
-        
+        # Coalesce bursts of keystrokes: only the last one in the quiet period runs
+        self._search_generation += 1
+        if self._search_after_id is not None:
+            self.root.after_cancel(self._search_after_id)
+        self._search_after_id = self.root.after(SEARCH_DEBOUNCE_MS, self._run_search,
+                                                self._search_generation)
+
+    def _run_search(self, generation):
+        self._search_after_id = None
+        if generation != self._search_generation:
+            return  # A newer keystroke superseded this query
+        self.refresh_patient_list()
+
+    @instrumented('ui.refresh_patient_list')
+    def refresh_patient_list(self):
+        """Filters the patient list by the current search term, touching only changed rows."""
         try:
-            all_patients = get_all_patients()
-            filtered_patients = [p for p in all_patients if search_term in p.lower()]
-            for patient in filtered_patients:
-                self.patient_listbox.insert('end', patient)
+            # Answered from the local index; no Firebase round trip per keystroke
+            results = self.search_index.search(self.search_var.get())
+            self.patient_rows = sync_listbox(self.patient_listbox, self.patient_rows, results)
         except Exception as e:
+            record_error('ui.refresh_patient_list', e, self.search_var.get())
             print(f"Error filtering patients: {e}")
 
     def on_patient_select(self, event):
@@ -637,65 +1146,105 @@ class ModernPearlTrack:
             patient_name = self.patient_listbox.get(selection[0])
             self.show_patient_history(patient_name)
 
+    @instrumented('ui.show_patient_history', detail_arg=1)
     def show_patient_history(self, patient_name):
+        self.current_patient = patient_name
+        # Only the most recently selected patient's history is wanted
+        if self._history_task is not None:
+            self._history_task.cancel()
+        self.cancel_history_render()
+
+        # A copy loaded moments ago (and not written since) is shown as is
+        loaded = get_loaded_patient(patient_name)
+        if loaded is not None:
+            self._history_task = None
+            self.render_patient_history(patient_name, loaded)
+            return
+
+        cached = load_cached_patient(patient_name)
+        if cached is not None:
+            self.render_patient_history(patient_name, cached)
+        else:
+            self.history_text.delete('1.0', 'end')
+            self.history_text.insert('1.0', f"Loading {patient_name}...")
+        self._history_task = self.io.submit(
+            load_patient, patient_name,
+            on_success=lambda data: self.render_patient_history(patient_name, data),
+            on_error=lambda e: self.render_patient_history_error(e))
+
+    def render_patient_history_error(self, e):
+        self.cancel_history_render()
         self.history_text.delete('1.0', 'end')
+        self.history_text.insert('1.0', f"Error loading patient data: {str(e)}")
+
+    def cancel_history_render(self):
+        if self._history_after_id is not None:
+            self.root.after_cancel(self._history_after_id)
+            self._history_after_id = None
+
+    @instrumented('ui.render_patient_history', detail_arg=1)
+    def render_patient_history(self, patient_name, patient_data):
+        self.cancel_history_render()
+        self.history_text.delete('1.0', 'end')
+        self._history_records = []
+        self._history_shown = 0
         try:
-            patient_data = load_patient(patient_name)
             if patient_data and 'records' in patient_data:
-                history = f"Patient: {patient_name}\n{'='*50}\n\n"
-            
-                total_charged = 0
-                total_paid = 0
-            
-                for record in patient_data['records']:
-                # Only display filled fields
-                    if record.get('age'):
-                        history += f"Age: {record['age']}\n"
-                    if record.get('gender'):
-                        history += f"Gender: {record['gender']}\n"
-                    if record.get('contact'):
-                        history += f"Contact: {record['contact']}\n"
-                    if record.get('next_of_kin'):
-                        history += f"Next of kin: {record['next_of_kin']}\n"
-                    if record.get('chief_complain'):
-                        history += f"Chief Complain: {record['chief_complain']}\n"
-                    if record.get('hpc'):
-                        history += f"Hpc: {record['hpc']}\n"
-                    if record.get('pdh'):
-                        history += f"Pdh: {record['pdh']}\n"
-                    if record.get('pmh'):
-                        history += f"Pmh: {record['pmh']}\n"
-                    if record.get('diagnosis'):
-                        history += f"Diagnosis: {record['diagnosis']}\n"
-                    if record.get('treatment'):
-                        history += f"Treatment: {record['treatment']}\n"
-                    if record.get('management'):
-                        history += f"Management: {record['management']}\n"
-                    if record.get('amount_charged'):
-                        history += f"Charged: Ksh{record['amount_charged']:.2f}\n"
-                    if record.get('amount_paid'):
-                        history += f"Paid: Ksh{record['amount_paid']:.2f}\n"
-                    if record.get('balance'):
-                        history += f"Balance: Ksh{record['balance']:.2f}\n"
-                    if record.get('medication'):
-                        history += f"Medication: {record['medication']}\n"
-                    history += "-" * 30 + "\n\n"
-                
-                    total_charged += record.get('amount_charged', 0)
-                    total_paid += record.get('amount_paid', 0)
-            
-                history += f"\nTOTALS:\n"
-                history += f"Total Charged: Ksh{total_charged:.2f}\n"
-                history += f"Total Paid: Ksh{total_paid:.2f}\n"
-                history += f"Outstanding Balance: Ksh{total_charged - total_paid:.2f}\n"
-            
-                self.history_text.insert('1.0', history)
+                records = patient_data['records']
+                total_charged = sum(record.get('amount_charged', 0) for record in records)
+                total_paid = sum(record.get('amount_paid', 0) for record in records)
+
+                # Totals go first so they are visible before the visits are
+                self.history_text.insert('end',
+                    f"Patient: {patient_name}\n{'='*50}\n\n"
+                    f"TOTALS ({len(records)} visits):\n"
+                    f"Total Charged: Ksh{total_charged:.2f}\n"
+                    f"Total Paid: Ksh{total_paid:.2f}\n"
+                    f"Outstanding Balance: Ksh{total_charged - total_paid:.2f}\n\n")
+
+                # Re-rendering the same patient keeps the pages already opened
+                if patient_name != self._history_patient:
+                    self._history_limit = HISTORY_PAGE_SIZE
+                self._history_patient = patient_name
+                self._history_records = records[::-1]  # newest first
+
+                # The first chunk goes in right away; the rest follow in idle slots
+                self.render_history_chunk()
 
         except Exception as e:
-            self.history_text.insert('1.0', f"Error loading patient data: {str(e)}")
-
-  
+            self.history_text.insert('end', f"Error loading patient data: {str(e)}")
 
+    @instrumented('ui.render_history_chunk')
+    def render_history_chunk(self):
+        self._history_after_id = None
+        records = self._history_records
+        end = min(self._history_shown + HISTORY_CHUNK_SIZE, self._history_limit, len(records))
+        try:
+            text = ''.join(format_visit(record) for record in records[self._history_shown:end])
+        except Exception as e:
+            self.history_text.insert('end', f"Error loading patient data: {str(e)}")
+            return
+        self.history_text.insert('end', text)
+        self._history_shown = end
+
+        if end >= len(records):
+            return
+        if end < self._history_limit:
+            self._history_after_id = self.root.after(1, self.render_history_chunk)
+        else:
+            self.history_text.insert('end', f"▼ Show older visits ({len(records) - end} more)\n", 'more')
+
+    @instrumented('ui.load_more_history')
+    def load_more_history(self):
+        """Render the next page of older visits, if a page is waiting"""
+        if self._history_after_id is not None or self._history_shown >= len(self._history_records):
+            return
+        if self.history_text.tag_ranges('more'):
+            self.history_text.delete('more.first', 'more.last')
+        self._history_limit = self._history_shown + HISTORY_PAGE_SIZE
+        self.render_history_chunk()
+
+    @instrumented('ui.add_visit_clicked')
     def add_visit_clicked(self):
         try:
         # Retrieve values from entries, allowing for empty fields
@@ -720,71 +1269,178 @@ class ModernPearlTrack:
             balance = charged - paid
         
         # Save the patient visit with potentially empty fields
-            add_patient_visit(name, age, gender, contact, next_of_kin, chief_complain, hpc, pdh, pmh, diagnosis, treatment, management, charged, medicine, paid, balance)
-        
-        # Clear form
-            for entry in self.patient_entries.values():
-                entry.delete(0, 'end')
-        
-        # Reload patient list and refresh history if the same patient is selected
-            self.load_patients()
-            selection = self.patient_listbox.curselection()
-            if selection:
-                selected_patient = self.patient_listbox.get(selection[0])
-                if selected_patient == name:
-                    self.show_patient_history(name)
-        
-            messagebox.showinfo("Success", "Patient visit added successfully!")
+            self.io.submit(add_patient_visit, name, age, gender, contact, next_of_kin, chief_complain, hpc, pdh, pmh,
+                           diagnosis, treatment, management, charged, medicine, paid, balance, kind=TASK_WRITE,
+                           on_success=lambda _: self.on_visit_added(name),
+                           on_error=lambda e: messagebox.showerror("Error", f"Failed to add visit: {str(e)}"))
         
         except ValueError:
             messagebox.showerror("Error", "Please enter valid numbers for amounts")
         except Exception as e:
             messagebox.showerror("Error", f"Failed to add visit: {str(e)}")
 
+    def on_visit_added(self, name):
+        # Clear form
+        for entry in self.patient_entries.values():
+            entry.delete(0, 'end')
+    
+        # Update the search index and refresh history if the same patient is selected
+        if name not in self.search_index:
+            self.search_index.add(name)
+            self.refresh_patient_list()
+        selection = self.patient_listbox.curselection()
+        if selection:
+            selected_patient = self.patient_listbox.get(selection[0])
+            if selected_patient == name:
+                self.show_patient_history(name)
+        self.mark_stale('dashboard')
+    
+        messagebox.showinfo("Success", "Patient visit added successfully!")
+
+    @instrumented('ui.delete_patient_clicked')
     def delete_patient_clicked(self):
         selection = self.patient_listbox.curselection()
         if selection:
             patient_name = self.patient_listbox.get(selection[0])
             if messagebox.askyesno("Confirm Delete", f"Are you sure you want to delete all records for {patient_name}?"):
-                try:
-                    delete_patient(patient_name)
-                    self.load_patients()
+                def on_deleted(_):
+                    self.patient_index_model.remove(patient_name)
+                    self.current_patient = None
+                    self.search_index.remove(patient_name)
+                    self.refresh_patient_list()
+                    self.cancel_history_render()
+                    self._history_records = []
                     self.history_text.delete('1.0', 'end')
+                    self.mark_stale('dashboard', 'export')
                     messagebox.showinfo("Success", "Patient deleted successfully!")
-                except Exception as e:
-                    messagebox.showerror("Error", f"Failed to delete patient: {str(e)}")
+
+                self.io.submit(delete_patient, patient_name, on_success=on_deleted, kind=TASK_WRITE,
+                               on_error=lambda e: messagebox.showerror("Error", f"Failed to delete patient: {str(e)}"))
         else:
             messagebox.showwarning("Warning", "Please select a patient to delete")
 
     def export_patient_clicked(self):
         selection = self.patient_listbox.curselection()
         if selection:
-            patient_name = self.patient_listbox.get(selection[0])
-            try:
-                file_path = export_patient_to_pdf(patient_name)
-                if file_path:
-                    messagebox.showinfo("Success", f"Patient record exported successfully!\nSaved to: {file_path}")
-                else:
-                    messagebox.showerror("Error", "Failed to export patient record")
-            except Exception as e:
-                messagebox.showerror("Error", f"Export failed: {str(e)}")
+            self.export_single_patient(self.patient_listbox.get(selection[0]))
         else:
             messagebox.showwarning("Warning", "Please select a patient to export")
 
+    @instrumented('ui.load_patients')
     def load_patients(self):
-        self.patient_listbox.delete(0, 'end')
-        try:
-            patients = get_all_patients()
-            for patient in patients:
-                self.patient_listbox.insert('end', patient)
-        except Exception as e:
-            print(f"Error loading patients: {e}")
+        self.current_patient = None
+        if self.patient_index_model.loaded:
+            # Search index is kept current by the listener; nothing to fetch
+            self.refresh_patient_list()
+            return
+
+        # Paint straight away from the local cache, then refresh from Firebase
+        self.search_index.build(get_cached_patient_names())
+        self.refresh_patient_list()
+
+        def on_loaded(names):
+            self.search_index.build(names)
+            self.refresh_patient_list()
+
+        self.io.submit(get_patient_names, on_success=on_loaded,
+                       on_error=lambda e: print(f"Error loading patients: {e}"))
+
+    def show_receivables(self):
+        self.show_screen('receivables', self.build_receivables, self.refresh_receivables)
+
+    def build_receivables(self, parent):
+        # Page title
+        title_frame = tk.Frame(parent, bg=self.colors['background'])
+        title_frame.pack(fill='x', pady=(0, 20))
+
+        title_label = tk.Label(title_frame, text="💰 Receivables", font=self.fonts['title'],
+                             bg=self.colors['background'], fg=self.colors['text'])
+        title_label.pack(anchor='w')
+
+        subtitle_label = tk.Label(title_frame, text="Outstanding balances and daily billing across the practice",
+                                font=self.fonts['body'],
+                                bg=self.colors['background'], fg=self.colors['text_light'])
+        subtitle_label.pack(anchor='w', pady=(5, 0))
+
+        # Practice totals
+        cards_frame = tk.Frame(parent, bg=self.colors['background'])
+        cards_frame.pack(fill='x', pady=(0, 30))
+        self.receivable_cards = self.create_billing_cards(cards_frame)
+
+        main_container = tk.Frame(parent, bg=self.colors['background'])
+        main_container.pack(fill='both', expand=True)
+
+        # Left - patients who owe, largest balance first
+        owing_content, owing_shadow = self.create_modern_card(main_container, "Outstanding by Patient")
+        owing_shadow.pack(side='left', fill='both', expand=True, padx=(0, 10))
+
+        owing_frame = tk.Frame(owing_content, bg=self.colors['card'])
+        owing_frame.pack(fill='both', expand=True, padx=25, pady=20)
+
+        owing_scrollbar = tk.Scrollbar(owing_frame)
+        owing_scrollbar.pack(side='right', fill='y')
+
+        self.receivables_listbox = tk.Listbox(owing_frame, yscrollcommand=owing_scrollbar.set,
+                                             font=self.fonts['body'], relief='flat',
+                                             selectbackground=self.colors['primary_light'],
+                                             highlightthickness=1,
+                                             highlightcolor=self.colors['primary'])
+        self.receivables_listbox.pack(fill='both', expand=True)
+        owing_scrollbar.config(command=self.receivables_listbox.yview)
+
+        # Right - billing per day
+        daily_content, daily_shadow = self.create_modern_card(main_container, f"Last {RECEIVABLES_DAYS} Days")
+        daily_shadow.pack(side='right', fill='both', expand=True)
+
+        daily_frame = tk.Frame(daily_content, bg=self.colors['card'])
+        daily_frame.pack(fill='both', expand=True, padx=25, pady=20)
+
+        daily_scrollbar = tk.Scrollbar(daily_frame)
+        daily_scrollbar.pack(side='right', fill='y')
+
+        self.daily_billing_listbox = tk.Listbox(daily_frame, yscrollcommand=daily_scrollbar.set,
+                                               font=self.fonts['body'], relief='flat',
+                                               selectbackground=self.colors['primary_light'],
+                                               highlightthickness=1,
+                                               highlightcolor=self.colors['primary'])
+        self.daily_billing_listbox.pack(fill='both', expand=True)
+        daily_scrollbar.config(command=self.daily_billing_listbox.yview)
+
+    @instrumented('ui.refresh_receivables')
+    def refresh_receivables(self):
+        self.load_billing_cards(self.receivable_cards)
+
+        if self.patient_index_model.loaded:
+            self.render_receivables(self.patient_index_model.items)
+        else:
+            self.io.submit(get_patient_index, on_success=self.render_receivables,
+                           on_error=lambda e: print(f"Error loading receivables: {e}"))
+
+        start = (date.today() - timedelta(days=RECEIVABLES_DAYS - 1)).isoformat()
+        self.io.submit(get_daily_billing, start, on_success=self.render_daily_billing,
+                       on_error=lambda e: print(f"Error loading daily billing: {e}"))
+
+    @instrumented('ui.render_receivables')
+    def render_receivables(self, index):
+        rows = [f"{summary['name']}  —  Ksh{summary['balance']:,.2f}  "
+                f"({summary.get('visits') or 0} visits, last {summary.get('last_visit') or 'n/a'})"
+                for summary in top_receivables(index)]
+        self.receivable_rows = sync_listbox(self.receivables_listbox, self.receivable_rows, rows)
+
+    def render_daily_billing(self, days):
+        self.daily_billing_listbox.delete(0, 'end')
+        for day in sorted(days, reverse=True):
+            totals = days[day]
+            self.daily_billing_listbox.insert('end', f"{day}  —  billed Ksh{totals['charged']:,.2f}, "
+                                                     f"paid Ksh{totals['paid']:,.2f} ({totals['visits']} visits)")
 
     def show_export(self):
-        self.clear_content()
-        
+        self.show_screen('export', self.build_export, self.refresh_export)
+
+    def build_export(self, parent):
+        from utils.export_pdf import EXPORT_FILES, EXPORT_MERGED, EXPORT_ZIP
         # Page title
-        title_frame = tk.Frame(self.content_frame, bg=self.colors['background'])
+        title_frame = tk.Frame(parent, bg=self.colors['background'])
         title_frame.pack(fill='x', pady=(0, 20))
         
         title_label = tk.Label(title_frame, text="📊 Export Patient Records", font=self.fonts['title'],
@@ -797,19 +1453,20 @@ class ModernPearlTrack:
         subtitle_label.pack(anchor='w', pady=(5, 0))
         
         # Center the export card
-        center_frame = tk.Frame(self.content_frame, bg=self.colors['background'])
+        center_frame = tk.Frame(parent, bg=self.colors['background'])
         center_frame.pack(expand=True, fill='both')
         
         export_content, export_shadow = self.create_modern_card(center_frame, "Export Patient Record")
         export_shadow.pack(expand=True, pady=50)
-        export_shadow.configure(width=600, height=500)
+        export_shadow.configure(width=600, height=600)
         
         export_frame = tk.Frame(export_content, bg=self.colors['card'])
         export_frame.pack(fill='both', expand=True, padx=30, pady=30)
         
         # Instructions
         instruction_label = tk.Label(export_frame, 
-                                    text="Select a patient from the list below to export their complete record as a PDF.",
+                                    text="Select one or more patients (Ctrl/Shift-click) to export their complete records as PDFs, "
+                                         "or export every patient at once.",
                                     font=self.fonts['body'], bg=self.colors['card'], fg=self.colors['text_light'],
                                     wraplength=500, justify='center')
         instruction_label.pack(pady=(0, 20))
@@ -819,45 +1476,392 @@ class ModernPearlTrack:
         scrollbar.pack(side='right', fill='y')
         
         self.export_listbox = tk.Listbox(export_frame, yscrollcommand=scrollbar.set,
-                                       font=self.fonts['body'], relief='flat',
+                                       font=self.fonts['body'], relief='flat', selectmode='extended',
                                        selectbackground=self.colors['primary_light'],
                                        highlightthickness=1, 
                                        highlightcolor=self.colors['primary'])
         self.export_listbox.pack(fill='both', expand=True, pady=(0, 20))
         scrollbar.config(command=self.export_listbox.yview)
         
-        # Export button
-        ttk.Button(export_frame, text="📄 Export Selected Patient", style='Primary.TButton',
-                  command=self.export_selected_patient).pack(pady=10)
-        
+        # Batch output format
+        self.export_mode = tk.StringVar(value=EXPORT_FILES)
+        mode_frame = tk.Frame(export_frame, bg=self.colors['card'])
+        mode_frame.pack(pady=(0, 10))
+        for text, value in [("Separate PDFs", EXPORT_FILES), ("One merged PDF", EXPORT_MERGED),
+                            ("Zip archive", EXPORT_ZIP)]:
+            tk.Radiobutton(mode_frame, text=text, value=value, variable=self.export_mode,
+                           font=self.fonts['body'], bg=self.colors['card'], fg=self.colors['text'],
+                           activebackground=self.colors['card']).pack(side='left', padx=8)
+
+        # Export buttons
+        button_frame = tk.Frame(export_frame, bg=self.colors['card'])
+        button_frame.pack(pady=10)
+        ttk.Button(button_frame, text="📄 Export Selected", style='Primary.TButton',
+                  command=self.export_selected_patient).pack(side='left', padx=5)
+        ttk.Button(button_frame, text="🗂 Export All Patients", style='Secondary.TButton',
+                  command=self.export_all_patients).pack(side='left', padx=5)
+        ttk.Button(button_frame, text="📊 Export Summary", style='Secondary.TButton',
+                  command=self.export_summary_clicked).pack(side='left', padx=5)
+        ttk.Button(button_frame, text="📈 Monthly Report", style='Secondary.TButton',
+                  command=self.export_monthly_report_clicked).pack(side='left', padx=5)
+
+        # Batch progress
+        self.export_progress = ttk.Progressbar(export_frame, mode='determinate')
+        self.export_progress_label = tk.Label(export_frame, text="", font=self.fonts['small'],
+                                              bg=self.colors['card'], fg=self.colors['text_light'])
+
+    def refresh_export(self):
         # Load patients
-        try:
-            patients = get_all_patients()
-            for patient in patients:
-                self.export_listbox.insert('end', patient)
-        except Exception as e:
-            print(f"Error loading patients for export: {e}")
+        if self.patient_index_model.loaded:
+            self.render_export_list(self.search_index.search(''))
+            return
+
+        self.render_export_list(get_cached_patient_names())
+        self.io.submit(get_patient_names, on_success=self.render_export_list,
+                       on_error=lambda e: print(f"Error loading patients for export: {e}"))
+
+    def render_export_list(self, patients):
+        self.export_rows = sync_listbox(self.export_listbox, self.export_rows, patients)
 
     def export_selected_patient(self):
         selection = self.export_listbox.curselection()
-        if selection:
-            patient_name = self.export_listbox.get(selection[0])
-            try:
-                file_path = export_patient_to_pdf(patient_name)
-                if file_path:
-                    messagebox.showinfo("Export Successful", 
-                                      f"Patient record for {patient_name} has been exported!\n\nSaved to:\n{file_path}")
-                else:
-                    messagebox.showerror("Export Failed", "Unable to export patient record")
-            except Exception as e:
-                messagebox.showerror("Export Error", f"An error occurred during export:\n{str(e)}")
+        if len(selection) > 1:
+            self.export_batch([self.export_listbox.get(i) for i in selection])
+        elif selection:
+            self.export_single_patient(self.export_listbox.get(selection[0]))
         else:
             messagebox.showwarning("No Selection", "Please select a patient to export")
 
-def launch_dashboard():
-    """Main function to launch the PearlTrack dashboard"""
-    root = tk.Tk()
+    @instrumented('ui.export_single_patient', detail_arg=1)
+    def export_single_patient(self, patient_name):
+        """Export one patient's history, rendering on the I/O pool with progress in the header"""
+        from utils.export_pdf import choose_export_path, export_patient_history
+        file_path = choose_export_path(patient_name, parent=self.root)
+        if not file_path:
+            return  # User cancelled
+
+        def progress(done, total):
+            # Called per visit on the I/O thread; only every 50th reaches the UI
+            if done % 50 == 0 or done == total:
+                text = f"📄 Exporting {patient_name}: {done} of {total} visits"
+                self.io.post(lambda: self.loading_label.config(text=text))
+
+        def on_done(path):
+            if path:
+                messagebox.showinfo("Export Successful",
+                                    f"Patient record for {patient_name} has been exported!\n\nSaved to:\n{path}")
+            else:
+                messagebox.showerror("Export Failed", "Unable to export patient record")
+
+        self.io.submit(export_patient_history, patient_name, file_path, progress=progress,
+                       on_success=on_done, kind=TASK_EXPORT,
+                       on_error=lambda e: messagebox.showerror("Export Error",
+                                                               f"An error occurred during export:\n{str(e)}"))
+
+    def export_summary_clicked(self):
+        """Export one table of every patient's visits and balances, built from the patient index"""
+        from utils.export_pdf import export_patient_summary
+        file_path = filedialog.asksaveasfilename(
+            parent=self.root,
+            title="Export Patient Summary to PDF",
+            defaultextension=".pdf",
+            initialfile=f"patient_summary_{date.today().isoformat()}.pdf",
+            filetypes=[("PDF files", "*.pdf")]
+        )
+        if not file_path:
+            return  # User cancelled
+
+        def on_done(path):
+            if path:
+                messagebox.showinfo("Export Successful", f"Patient summary has been exported!\n\nSaved to:\n{path}")
+            else:
+                messagebox.showwarning("No Patients", "There are no patients to export")
+
+        self.io.submit(export_patient_summary, file_path, on_success=on_done, kind=TASK_EXPORT,
+                       on_error=lambda e: messagebox.showerror("Export Error",
+                                                               f"An error occurred during export:\n{str(e)}"))
+
+    def export_monthly_report_clicked(self):
+        """Export this month's revenue, balance and demographics tables as CSV files and a PDF"""
+        directory = filedialog.askdirectory(title="Choose a folder for the monthly report")
+        if not directory:
+            return  # User cancelled
+        self.load_report_visits(directory)
+
+    def load_report_visits(self, directory, source=None):
+        """Read the visits for the monthly report, then check they cover the whole practice"""
+        self.io.submit(get_visits, source, kind=TASK_EXPORT,
+                       on_success=lambda visits: self.on_report_visits_loaded(directory, visits),
+                       on_error=lambda e: messagebox.showerror("Export Error",
+                                                               f"An error occurred during export:\n{str(e)}"))
+
+    def on_report_visits_loaded(self, directory, visits):
+        if visits.attrs.get('partial'):
+            # The local cache only holds patients opened here; offer a full snapshot instead
+            answer = messagebox.askyesnocancel(
+                "Partial Data",
+                f"The report would cover {visits.attrs.get('coverage')}, not the whole practice.\n\n"
+                "Yes: choose a snapshot (e.g. last night's backup) to report from\n"
+                "No: export anyway, marked PARTIAL\n"
+                "Cancel: do not export",
+                icon='warning', parent=self.root)
+            if answer is None:
+                return
+            if answer:
+                path = filedialog.askopenfilename(parent=self.root, title="Choose a PearlTrack snapshot",
+                                                  filetypes=[("PearlTrack snapshots", "*.ptsnap *.ptsnap.gz"),
+                                                             ("All files", "*.*")])
+                if path:
+                    self.load_report_visits(directory, path)
+                return
+
+        self.io.submit(export_monthly_report, directory, visits=visits, kind=TASK_EXPORT,
+                       on_success=lambda paths: messagebox.showinfo(
+                           "Export Successful", f"Monthly report has been exported!\n\nSaved to:\n{directory}"),
+                       on_error=lambda e: messagebox.showerror("Export Error",
+                                                               f"An error occurred during export:\n{str(e)}"))
+
+    def export_all_patients(self):
+        names = list(self.export_rows)
+        if not names:
+            messagebox.showwarning("No Patients", "There are no patients to export")
+            return
+        self.export_batch(names)
+
+    def export_batch(self, names):
+        """Export several patients into a chosen folder, rendering in background processes"""
+        from utils.export_pdf import export_patients_to_directory
+        directory = filedialog.askdirectory(title="Choose a folder for the exported records")
+        if not directory:
+            return  # User cancelled
+
+        self.export_progress.configure(maximum=len(names), value=0)
+        self.export_progress.pack(fill='x', pady=(10, 0))
+        self.export_progress_label.configure(text=f"Exporting {len(names)} patients...")
+        self.export_progress_label.pack(pady=(5, 0))
+
+        def progress(done, total, name):
+            # Called on the I/O thread; update the widgets on the Tk thread
+            self.io.post(self.on_export_progress, done, total, name)
+
+        def hide_progress():
+            self.export_progress.pack_forget()
+            self.export_progress_label.pack_forget()
+
+        def on_done(files):
+            hide_progress()
+            if files:
+                messagebox.showinfo("Export Successful",
+                                    f"Exported {len(names)} patient records.\n\nSaved to:\n{directory}")
+            else:
+                messagebox.showerror("Export Failed", "None of the selected patients have records to export")
+
+        def on_error(e):
+            hide_progress()
+            messagebox.showerror("Export Error", f"An error occurred during export:\n{str(e)}")
+
+        self.io.submit(export_patients_to_directory, names, directory, output=self.export_mode.get(),
+                       progress=progress, on_success=on_done, on_error=on_error, kind=TASK_EXPORT)
+
+    def on_export_progress(self, done, total, name):
+        self.export_progress.configure(value=done)
+        self.export_progress_label.configure(text=f"Exported {done} of {total} ({name})")
+
+    def show_held_back_writes(self):
+        self.mark_stale('held_back')
+        self.show_screen('held_back', self.build_held_back_writes, self.load_held_back_writes)
+
+    def build_held_back_writes(self, parent):
+        # Page title
+        title_frame = tk.Frame(parent, bg=self.colors['background'])
+        title_frame.pack(fill='x', pady=(0, 20))
+
+        title_label = tk.Label(title_frame, text="⚠ Unsynced Changes", font=self.fonts['title'],
+                             bg=self.colors['background'], fg=self.colors['text'])
+        title_label.pack(anchor='w')
+
+        subtitle_label = tk.Label(title_frame, text="Changes made here that were held back because the record "
+                                                    "changed on the server, or that kept failing. Later changes "
+                                                    "to the same record wait until each one is retried or discarded.",
+                                font=self.fonts['body'],
+                                bg=self.colors['background'], fg=self.colors['text_light'])
+        subtitle_label.pack(anchor='w', pady=(5, 0))
+
+        button_frame = tk.Frame(parent, bg=self.colors['background'])
+        button_frame.pack(fill='x', pady=(0, 20))
+
+        ttk.Button(button_frame, text="↻ Retry", style='Primary.TButton',
+                  command=lambda: self.resolve_held_back_write(retry=True)).pack(side='left', padx=(0, 10))
+        ttk.Button(button_frame, text="🗑 Discard", style='Danger.TButton',
+                  command=lambda: self.resolve_held_back_write(retry=False)).pack(side='left', padx=(0, 10))
+        ttk.Button(button_frame, text="🔄 Refresh", style='Nav.TButton',
+                  command=self.load_held_back_writes).pack(side='left', padx=(0, 10))
+
+        held_content, held_shadow = self.create_modern_card(parent, "Held Back")
+        held_shadow.pack(fill='both', expand=True)
+
+        self.held_back_listbox = tk.Listbox(held_content, font=self.fonts['body'], relief='flat', height=12,
+                                            selectbackground=self.colors['primary_light'],
+                                            highlightthickness=1, highlightcolor=self.colors['primary'])
+        self.held_back_listbox.pack(fill='both', expand=True, padx=25, pady=20)
+        self.held_back_entries = []
+        self.held_back_rows = []
+
+    def load_held_back_writes(self):
+        def on_entries(entries):
+            self.held_back_entries = entries
+            rows = [f"{time.strftime('%Y-%m-%d %H:%M', time.localtime(entry['created_at']))}  "
+                    f"{entry['status'].upper()}  {describe_outbox_entry(entry)}  ({entry['last_error']})"
+                    for entry in entries]
+            self.held_back_rows = sync_listbox(self.held_back_listbox, self.held_back_rows, rows)
+
+        self.io.submit(get_held_back_writes, on_success=on_entries,
+                       on_error=lambda e: print(f"Error reading unsynced changes: {e}"))
+
+    def resolve_held_back_write(self, retry):
+        """Retry the selected change as it is, or discard it and keep the server's data"""
+        selection = self.held_back_listbox.curselection()
+        if not selection:
+            messagebox.showwarning("Warning", "Please select a change first")
+            return
+        entry = self.held_back_entries[selection[0]]
+        if not retry and not messagebox.askyesno("Confirm Discard",
+                                                 f"Discard this change?\n{describe_outbox_entry(entry)}"):
+            return
+
+        def on_done(_):
+            self.mark_stale('dashboard', 'appointments', 'patients', 'receivables')
+            self.load_held_back_writes()
+
+        self.io.submit(retry_outbox_entry if retry else discard_outbox_entry, entry['id'], on_success=on_done,
+                       on_error=lambda e: messagebox.showerror("Error", f"Could not update the change: {e}"),
+                       kind=TASK_WRITE)
+
+    def show_diagnostics(self):
+        if not self.diagnostics_button.winfo_ismapped():
+            self.diagnostics_button.pack(side='left', padx=(0, 15))
+        self.mark_stale('diagnostics')
+        self.show_screen('diagnostics', self.build_diagnostics, self.refresh_diagnostics)
+
+    def build_diagnostics(self, parent):
+        # Page title
+        title_frame = tk.Frame(parent, bg=self.colors['background'])
+        title_frame.pack(fill='x', pady=(0, 20))
+
+        title_label = tk.Label(title_frame, text="🩺 Diagnostics", font=self.fonts['title'],
+                             bg=self.colors['background'], fg=self.colors['text'])
+        title_label.pack(anchor='w')
+
+        subtitle_label = tk.Label(title_frame, text="Timing of database calls, background tasks and screen handlers "
+                                                    "since the app started (percentiles over recent calls)",
+                                font=self.fonts['body'],
+                                bg=self.colors['background'], fg=self.colors['text_light'])
+        subtitle_label.pack(anchor='w', pady=(5, 0))
+
+        button_frame = tk.Frame(parent, bg=self.colors['background'])
+        button_frame.pack(fill='x', pady=(0, 20))
+
+        ttk.Button(button_frame, text="🔄 Refresh", style='Primary.TButton',
+                  command=self.refresh_diagnostics).pack(side='left', padx=(0, 10))
+        ttk.Button(button_frame, text="🗑 Reset", style='Danger.TButton',
+                  command=self.reset_diagnostics).pack(side='left', padx=(0, 10))
+
+        self.metrics_log_var = tk.BooleanVar(value=log_path() is not None)
+        tk.Checkbutton(button_frame, text="Write to log file", variable=self.metrics_log_var,
+                       command=self.toggle_metrics_log, font=self.fonts['body'],
+                       bg=self.colors['background'], fg=self.colors['text']).pack(side='left', padx=(10, 10))
+        self.metrics_log_label = tk.Label(button_frame, text="", font=self.fonts['small'],
+                                          bg=self.colors['background'], fg=self.colors['text_light'])
+        self.metrics_log_label.pack(side='left')
+
+        # Per-operation table
+        operations_content, operations_shadow = self.create_modern_card(parent, "Operations")
+        operations_shadow.pack(fill='both', expand=True, pady=(0, 20))
+
+        columns = [('calls', "Calls", 60), ('errors', "Errors", 60), ('p50', "p50 ms", 80),
+                   ('p90', "p90 ms", 80), ('p99', "p99 ms", 80), ('max', "Max ms", 80),
+                   ('size', "Avg KiB", 80), ('slowest', "Slowest for", 220)]
+        self.operations_tree = ttk.Treeview(operations_content, columns=[c[0] for c in columns], height=14)
+        self.operations_tree.heading('#0', text="Operation")
+        self.operations_tree.column('#0', width=300)
+        for column, heading, width in columns:
+            self.operations_tree.heading(column, text=heading)
+            self.operations_tree.column(column, width=width, anchor='e' if column != 'slowest' else 'w')
+        self.operations_tree.pack(fill='both', expand=True, padx=25, pady=20)
+
+        # Slowest individual calls, with what they were for
+        slowest_content, slowest_shadow = self.create_modern_card(parent, "Slowest Calls")
+        slowest_shadow.pack(fill='both', expand=True)
+
+        self.slowest_listbox = tk.Listbox(slowest_content, font=self.fonts['body'], relief='flat', height=10,
+                                          selectbackground=self.colors['primary_light'],
+                                          highlightthickness=1, highlightcolor=self.colors['primary'])
+        self.slowest_listbox.pack(fill='both', expand=True, padx=25, pady=20)
+        self._diagnostics_after_id = None
+
+    def refresh_diagnostics(self):
+        """Redraw the metrics, and keep doing so while the screen is showing"""
+        if self._diagnostics_after_id is not None:
+            self.root.after_cancel(self._diagnostics_after_id)
+            self._diagnostics_after_id = None
+        if self.current_screen != 'diagnostics':
+            return
+
+        self.operations_tree.delete(*self.operations_tree.get_children())
+        for summary in metrics_snapshot():
+            slowest = summary['slowest'][0] if summary['slowest'] else None
+            size = summary['mean_bytes']
+            self.operations_tree.insert('', 'end', text=summary['name'], values=(
+                summary['count'], summary['errors'],
+                f"{summary['p50_ms']:.1f}", f"{summary['p90_ms']:.1f}", f"{summary['p99_ms']:.1f}",
+                f"{summary['max_ms']:.1f}", f"{size / 1024:.1f}" if size is not None else "",
+                f"{slowest[1]} ({slowest[0]:.0f} ms)" if slowest and slowest[1] is not None else ""))
+
+        self.slowest_listbox.delete(0, 'end')
+        for elapsed_ms, operation, detail, at in slowest_calls():
+            self.slowest_listbox.insert('end', f"{elapsed_ms:8.1f} ms  {operation}"
+                                               f"{f'  [{detail}]' if detail is not None else ''}"
+                                               f"  at {time.strftime('%H:%M:%S', time.localtime(at))}")
+
+        path = log_path()
+        self.metrics_log_label.config(text=f"Logging to {path}" if path else "")
+        self._diagnostics_after_id = self.root.after(DIAGNOSTICS_REFRESH_MS, self.refresh_diagnostics)
+
+    def reset_diagnostics(self):
+        reset_metrics()
+        self.refresh_diagnostics()
+
+    def toggle_metrics_log(self):
+        try:
+            if self.metrics_log_var.get():
+                enable_log()
+            else:
+                disable_log()
+        except OSError as e:
+            self.metrics_log_var.set(False)
+            messagebox.showerror("Error", f"Could not open the metrics log: {e}")
+        self.refresh_diagnostics()
+
+def launch_dashboard(on_ready=None, root=None):
+    """Main function to launch the PearlTrack dashboard
+
+    on_ready(app, close) is called once the main loop is running, e.g. to
+    replay a scripted session; close() shuts the app down. When a root is
+    passed (main.py's, already running behind the splash) the dashboard is
+    built on it and shown, and the caller keeps running the main loop.
+    """
+    own_root = root is None
+    if own_root:
+        root = tk.Tk()
     app = ModernPearlTrack(root)
+    if not own_root:
+        root.deiconify()  # Withdrawn behind the splash until now
+
+    def on_close():
+        app.shutdown()
+        root.destroy()
+
+    root.protocol("WM_DELETE_WINDOW", on_close)
     
     # Center the window
     root.update_idletasks()
@@ -866,8 +1870,12 @@ def launch_dashboard():
     x = (root.winfo_screenwidth() // 2) - (width // 2)
     y = (root.winfo_screenheight() // 2) - (height // 2)
     root.geometry(f'{width}x{height}+{x}+{y}')
-    
-    root.mainloop()
+
+    if on_ready:
+        root.after_idle(on_ready, app, on_close)
+    if own_root:
+        root.mainloop()
+    return app
 
 
 if __name__ == "__main__":
@@ -1,92 +1,186 @@
+import os
+import zipfile
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import date
+from itertools import chain
 from tkinter import Tk, filedialog
-from reportlab.lib.pagesizes import letter
-from reportlab.pdfgen import canvas
-from utils.patients import load_patient, get_all_patients
+from utils.patients import load_patient, get_patient_index, PATIENT_CACHE_TTL
+from utils.report_template import ReportTemplate, COLUMN_COUNT, COLUMN_MONEY, COLUMN_TEXT
+
+# Output modes for batch exports
+EXPORT_FILES = 'files'     # one PDF per patient
+EXPORT_MERGED = 'merged'   # a single PDF with every patient
+EXPORT_ZIP = 'zip'         # one PDF per patient, packed into a zip archive
+
+# The one layout every export uses. It is compiled once per process (the
+# batch export's worker processes each compile it on import) and the
+# compiled report is reused for every document.
+PATIENT_REPORT = ReportTemplate(
+    text_fields=[
+        ('age', 'Age'),
+        ('gender', 'Gender'),
+        ('contact', 'Contact'),
+        ('next_of_kin', 'Next of Kin'),
+        ('chief_complain', 'Chief Complaint'),
+        ('hpc', 'HPC'),
+        ('pdh', 'PDH'),
+        ('pmh', 'PMH'),
+        ('diagnosis', 'Diagnosis'),
+        ('treatment', 'Treatment'),
+        ('management', 'Management'),
+    ],
+    money_fields=[
+        ('amount_charged', 'Amount Charged'),
+        ('amount_paid', 'Amount Paid'),
+        ('balance', 'Balance'),
+    ],
+    trailing_fields=[
+        ('medication', 'Medication'),
+    ],
+    summary_columns=[
+        ('name', 'Patient', COLUMN_TEXT),
+        ('visits', 'Visits', COLUMN_COUNT),
+        ('last_visit', 'Last Visit', COLUMN_TEXT),
+        ('total_charged', 'Charged', COLUMN_MONEY),
+        ('total_paid', 'Paid', COLUMN_MONEY),
+        ('balance', 'Balance', COLUMN_MONEY),
+    ],
+)
+_report = PATIENT_REPORT.compile()
+
+def _safe_filename(name):
+    """Turns a patient name into a file name that is safe on every OS."""
+    safe_name = name.replace(" ", "_")
+    for char in '/\\:*?"<>|':
+        safe_name = safe_name.replace(char, "_")
+    return safe_name
+
+def render_patient_pdf(data, file_path, progress=None):
+    """Writes one patient's history to file_path; no dialogs, safe to run in a worker process."""
+    return _report.render_patient(data, file_path, progress)
+
+def render_patients_pdf(patients, file_path):
+    """Writes several patients into one PDF, each starting on a new page.
+
+    patients may be a generator, so patients are loaded only as they are
+    rendered.
+    """
+    return _report.render_patients(patients, file_path)
+
+def render_tables_pdf(sections, file_path):
+    """Writes titled tables, given as (title, header, rows) with string cells, to file_path."""
+    return _report.render_tables(sections, file_path)
+
+def export_patient_summary(file_path):
+    """Writes a one-row-per-patient summary (visits and balances) to file_path.
+
+    Built from the patient index, so no visit records are downloaded.
+    Returns the path, or False if there are no patients.
+    """
+    index = get_patient_index()
+    if not index:
+        return False
+    summaries = [dict(index[name], name=name) for name in sorted(index, key=str.lower)]
+    return _report.render_summary(summaries, file_path)
+
+def choose_export_path(name, parent=None):
+    """Asks where to save one patient's history; returns the path, or '' if cancelled."""
+    return filedialog.asksaveasfilename(
+        parent=parent,
+        title="Export Patient History to PDF",
+        defaultextension=".pdf",
+        initialfile=f"{_safe_filename(name)}_history.pdf",
+        filetypes=[("PDF files", "*.pdf")]
+    )
+
+def export_patient_history(name, file_path, progress=None):
+    """Loads (or reuses) one patient and writes the history to file_path.
+
+    Returns the path, or False if the patient has no records. Does no UI
+    work, so it can run on a background thread.
+    """
+    # Reuses the copy the history view just loaded instead of fetching it again
+    data = load_patient(name, max_age=PATIENT_CACHE_TTL)
+    if not data or not data.get("records"):
+        return False  # No data to export
+    return render_patient_pdf(data, file_path, progress)
 
 def export_patient_to_pdf(name):
     """Exports a patient's history to a PDF file chosen by the user."""
-    data = load_patient(name)
+    data = load_patient(name, max_age=PATIENT_CACHE_TTL)
     if not data or not data.get("records"):
         return False  # No data to export
 
-    # Suggest a safe default filename
-    safe_name = name.replace(" ", "_")
-    default_filename = f"{safe_name}_history.pdf"
-
     # Ask user where to save the file
     root = Tk()
     root.withdraw()  # Hide the root window
-    file_path = filedialog.asksaveasfilename(
-        title="Export Patient History to PDF",
-        defaultextension=".pdf",
-        initialfile=default_filename,
-        filetypes=[("PDF files", "*.pdf")]
-    )
+    file_path = choose_export_path(name, parent=root)
     root.destroy()
 
     if not file_path:
         return None  # User cancelled
 
     # Create and write PDF
-    c = canvas.Canvas(file_path, pagesize=letter)
-    c.setFont("Helvetica-Bold", 16)
-    c.drawString(50, 750, f"Patient Record: {data['name']}")
-
-    c.setFont("Helvetica", 12)
-    y = 720
-
-    for rec in data["records"]:
-        # Format each field in a new line for better readability
-        c.drawString(50, y, f"Age: {rec.get('age', 'N/A')}")
-        y -= 20
-        c.drawString(50, y, f"Gender: {rec.get('gender', 'N/A')}")
-        y -= 20
-        c.drawString(50, y, f"Contact: {rec.get('contact', 'N/A')}")
-        y -= 20
-        c.drawString(50, y, f"Next of Kin: {rec.get('next_of_kin', 'N/A')}")
-        y -= 20
-        c.drawString(50, y, f"Chief Complaint: {rec.get('chief_complain', 'N/A')}")
-        y -= 20
-        c.drawString(50, y, f"HPC: {rec.get('hpc', 'N/A')}")
-        y -= 20
-        c.drawString(50, y, f"PDH: {rec.get('pdh', 'N/A')}")
-        y -= 20
-        c.drawString(50, y, f"PMH: {rec.get('pmh', 'N/A')}")
-        y -= 20
-        c.drawString(50, y, f"Diagnosis: {rec.get('diagnosis', 'N/A')}")
-        y -= 20
-        c.drawString(50, y, f"Treatment: {rec.get('treatment', 'N/A')}")
-        y -= 20
-        c.drawString(50, y, f"Management: {rec.get('management', 'N/A')}")
-        y -= 20
-        c.drawString(50, y, f"Amount Charged: Ksh{rec.get('amount_charged', 0):.2f}")
-        y -= 20
-        c.drawString(50, y, f"Amount Paid: Ksh{rec.get('amount_paid', 0):.2f}")
-        y -= 20
-        c.drawString(50, y, f"Balance: Ksh{rec.get('balance', 0):.2f}")
-        y -= 20
-        c.drawString(50, y, f"Medication: {rec.get('medication', 'N/A')}")
-        y -= 20
-        c.drawString(50, y, "-" * 50)  # Separator line
-        y -= 10
-
-        # Check if we need to create a new page
-        if y < 50:
-            c.showPage()
-            c.setFont("Helvetica", 12)
-            y = 750
-
-    c.save()
-    return file_path
+    return render_patient_pdf(data, file_path)
+
+def export_patients_to_directory(names, directory, output=EXPORT_FILES, progress=None, max_workers=None):
+    """Exports many patients at once into directory, rendering PDFs in parallel processes.
+
+    Records are fetched here (one patient at a time) while worker processes
+    render the PDFs already fetched. progress(done, total, name) is called
+    after each patient. Patients without records are skipped. Returns the
+    list of files written: one PDF per patient, a single merged PDF, or a
+    zip archive holding the per-patient PDFs.
+    """
+    names = list(names)
+    total = len(names)
+    stamp = date.today().isoformat()
+    os.makedirs(directory, exist_ok=True)
+
+    if output == EXPORT_MERGED:
+        def patients():
+            # Loaded one at a time as the previous patient finishes rendering
+            for done, name in enumerate(names, 1):
+                data = load_patient(name, max_age=PATIENT_CACHE_TTL)
+                if data and data.get("records"):
+                    yield data
+                if progress:
+                    progress(done, total, name)
+
+        remaining = patients()
+        first = next(remaining, None)
+        if first is None:
+            return []
+        return [render_patients_pdf(chain([first], remaining), os.path.join(directory, f"patients_{stamp}.pdf"))]
+
+    written = []
+    with ProcessPoolExecutor(max_workers=max_workers) as pool:
+        futures = {}
+        for name in names:
+            data = load_patient(name, max_age=PATIENT_CACHE_TTL)
+            if not data or not data.get("records"):
+                continue
+            file_path = os.path.join(directory, f"{_safe_filename(name)}_history.pdf")
+            futures[pool.submit(render_patient_pdf, data, file_path)] = name
+
+        done = total - len(futures)  # skipped patients count as done
+        for future in as_completed(futures):
+            written.append(future.result())
+            done += 1
+            if progress:
+                progress(done, total, futures[future])
+
+    if output == EXPORT_ZIP and written:
+        archive_path = os.path.join(directory, f"patients_{stamp}.zip")
+        with zipfile.ZipFile(archive_path, "w", zipfile.ZIP_DEFLATED) as archive:
+            for file_path in written:
+                archive.write(file_path, os.path.basename(file_path))
+        for file_path in written:
+            os.remove(file_path)
+        return [archive_path]
+
+    return sorted(written)
 
 # Example usage (uncomment to use):
 # if __name__ == "__main__":
 #     export_patient_to_pdf("John Doe")
-
-
-
-
-
-
-
-
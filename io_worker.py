@@ -0,0 +1,150 @@
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from utils.metrics import record
+
+# How often the Tk main loop checks for finished work (~60 fps)
+POLL_INTERVAL_MS = 16
+
+# Kinds of task. Reads and exports can be cancelled from the UI; a write
+# (the user's saved visit or appointment) or a listener subscription
+# always runs and reports back.
+TASK_READ = 'read'
+TASK_EXPORT = 'export'
+TASK_WRITE = 'write'
+TASK_SUBSCRIBE = 'subscribe'
+CANCELLABLE_KINDS = {TASK_READ, TASK_EXPORT}
+
+
+class IOTask:
+    """Handle for a submitted background operation."""
+
+    def __init__(self, name='task', detail=None, kind=TASK_READ):
+        self.kind = kind
+        self.name = name      # recorded as 'io.<name>' in the metrics
+        self.detail = detail  # e.g. the patient name the task is for
+        self.future = None
+        self.cancelled = False
+
+    def cancel(self):
+        """Drops the task's result; also stops it if it has not started yet."""
+        self.cancelled = True
+        if self.future is not None:
+            self.future.cancel()
+
+    @property
+    def done(self):
+        return self.future is not None and self.future.done()
+
+
+class IOWorker:
+    """Runs blocking database calls on a thread pool, off the Tk main loop.
+
+    Results are handed back through a thread-safe queue that the Tk loop
+    drains with root.after(), so callbacks always run on the UI thread and
+    may touch widgets freely.
+    """
+
+    def __init__(self, root, max_workers=8, on_busy_change=None):
+        self.root = root
+        self.on_busy_change = on_busy_change
+        self._executor = ThreadPoolExecutor(max_workers=max_workers,
+                                            thread_name_prefix="pearltrack-io")
+        self._results = queue.Queue()
+        self._pending = set()
+        self._lock = threading.Lock()
+        self._after_id = self.root.after(POLL_INTERVAL_MS, self._poll)
+
+    @property
+    def busy(self):
+        return len(self._pending)
+
+    def submit(self, fn, *args, on_success=None, on_error=None, kind=TASK_READ, **kwargs):
+        """Runs fn(*args, **kwargs) in the background.
+
+        on_success(result) or on_error(exception) is then called on the Tk
+        thread unless the task was cancelled in the meantime. kind is one
+        of the TASK_* kinds; only reads and exports are ever cancelled.
+        """
+        detail = args[0] if args and isinstance(args[0], (str, int)) else None
+        task = IOTask(getattr(fn, '__name__', 'task'), detail, kind)
+        submitted = time.perf_counter()
+
+        def run():
+            started = time.perf_counter()
+            record('io.queue_wait', (started - submitted) * 1000, detail=task.name)
+            try:
+                result = fn(*args, **kwargs)
+            except Exception as e:
+                record(f'io.{task.name}', (time.perf_counter() - started) * 1000, detail=task.detail, error=e)
+                self._results.put((task, on_error, e))
+            else:
+                record(f'io.{task.name}', (time.perf_counter() - started) * 1000, detail=task.detail)
+                self._results.put((task, on_success, result))
+
+        def forget_if_cancelled(future):
+            # A cancelled future never runs, so report it here instead
+            if future.cancelled():
+                self._results.put((task, None, None))
+
+        with self._lock:
+            self._pending.add(task)
+        task.future = self._executor.submit(run)
+        task.future.add_done_callback(forget_if_cancelled)
+        self._notify_busy()
+        return task
+
+    def post(self, callback, *args):
+        """Schedules callback(*args) on the Tk thread from any thread."""
+        self._results.put((None, callback, args))
+
+    def cancel_all(self):
+        """Cancels every pending read and export; writes and subscriptions carry on."""
+        with self._lock:
+            tasks = [task for task in self._pending if task.kind in CANCELLABLE_KINDS]
+        for task in tasks:
+            task.cancel()
+
+    def _notify_busy(self):
+        if self.on_busy_change:
+            self.on_busy_change(self.busy)
+
+    def _poll(self):
+        finished = False
+        while True:
+            try:
+                task, callback, value = self._results.get_nowait()
+            except queue.Empty:
+                break
+
+            if task is None:
+                self._call(callback, *value)
+                continue
+
+            with self._lock:
+                self._pending.discard(task)
+            finished = True
+            if callback and not task.cancelled:
+                # Time spent on the Tk thread handling the result (rendering)
+                started = time.perf_counter()
+                self._call(callback, value)
+                record(f'ui.{task.name} result', (time.perf_counter() - started) * 1000, detail=task.detail)
+
+        if finished:
+            self._notify_busy()
+        self._after_id = self.root.after(POLL_INTERVAL_MS, self._poll)
+
+    def _call(self, callback, *args):
+        try:
+            callback(*args)
+        except Exception as e:
+            # A widget may have been destroyed while the request was in flight
+            print(f"Error in background task callback: {e}")
+
+    def shutdown(self):
+        if self._after_id is not None:
+            self.root.after_cancel(self._after_id)
+            self._after_id = None
+        self.cancel_all()
+        self._executor.shutdown(wait=False)
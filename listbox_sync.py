@@ -0,0 +1,29 @@
+from difflib import SequenceMatcher
+
+
+def sync_listbox(listbox, old_rows, new_rows):
+    """Updates a Tk listbox showing old_rows so it shows new_rows.
+
+    Only the rows that differ are deleted or inserted, so unchanged rows
+    (and their selection) stay put instead of the whole list being redrawn.
+    Returns new_rows as a list, to be passed back as old_rows next time.
+    """
+    new_rows = list(new_rows)
+    if not old_rows:
+        if new_rows:
+            listbox.insert('end', *new_rows)
+        return new_rows
+    if not new_rows:
+        listbox.delete(0, 'end')
+        return new_rows
+
+    matcher = SequenceMatcher(None, old_rows, new_rows, autojunk=False)
+    # Apply from the bottom up so earlier indices stay valid
+    for tag, i1, i2, j1, j2 in reversed(matcher.get_opcodes()):
+        if tag == 'equal':
+            continue
+        if i2 > i1:
+            listbox.delete(i1, i2 - 1)
+        if j2 > j1:
+            listbox.insert(i1, *new_rows[j1:j2])
+    return new_rows
@@ -0,0 +1,73 @@
+from utils.storage import db
+from utils.local_cache import apply_to_cache, apply_update, cache_appointments, cache_patient_index
+
+# Collections whose full snapshot can be written to the local cache in one go
+_CACHE_SNAPSHOT = {
+    'appointments': cache_appointments,
+    'patient_index': cache_patient_index,
+}
+
+
+def _event_updates(event_type, path, data):
+    """Turns a listener event into {relative path: value} updates."""
+    path = path.strip('/')
+    if event_type == 'patch':
+        prefix = f'{path}/' if path else ''
+        return {f'{prefix}{key}': value for key, value in (data or {}).items()}
+    return {path: data}
+
+
+class LiveCollection:
+    """In-memory copy of one Firebase collection, kept current from listen() events.
+
+    apply_event() returns the top-level keys that changed so views can
+    update just those rows.
+    """
+
+    def __init__(self):
+        self.items = {}
+        self.loaded = False
+
+    def apply_event(self, event_type, path, data):
+        changed = set()
+        for rel_path, value in _event_updates(event_type, path, data).items():
+            if not rel_path:
+                # Full snapshot of the collection
+                new_items = dict(value or {})
+                changed |= {key for key in set(self.items) | set(new_items)
+                            if self.items.get(key) != new_items.get(key)}
+                self.items = new_items
+                self.loaded = True
+                continue
+            key = rel_path.split('/', 1)[0]
+            self.items = apply_update(self.items, rel_path, value)
+            changed.add(key)
+        return changed
+
+    def set(self, key, value):
+        """Applies a local write straight away, ahead of the listener echo."""
+        return self.apply_event('put', f'/{key}', value)
+
+    def remove(self, key):
+        return self.apply_event('put', f'/{key}', None)
+
+
+def subscribe(collection, callback):
+    """Starts streaming changes of a top-level collection.
+
+    callback(event_type, path, data) is called on the listener thread, so
+    callers should hand it over to the UI thread. Every event is also
+    mirrored into the local cache. Blocks while the stream connects;
+    returns the registration, whose close() stops listening.
+    """
+    def on_event(event):
+        try:
+            updates = _event_updates(event.event_type, event.path, event.data)
+            if '' in updates and collection in _CACHE_SNAPSHOT:
+                _CACHE_SNAPSHOT[collection](updates.pop('') or {})
+            apply_to_cache({f'{collection}/{path}': value for path, value in updates.items()})
+        except Exception as e:
+            print(f"Error caching {collection} change: {e}")
+        callback(event.event_type, event.path, event.data)
+
+    return db.reference(collection).listen(on_event)
@@ -0,0 +1,541 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+CACHE_DB = os.environ.get("PEARLTRACK_CACHE_DB", os.path.join(BASE_DIR, "database", "cache.db"))
+
+# Seconds between background attempts to flush the outbox
+SYNC_INTERVAL = 5
+# Non-network failures after which an outbox entry is parked as 'failed'
+MAX_SYNC_ATTEMPTS = 5
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS patients (
+    name TEXT PRIMARY KEY,
+    data TEXT NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS patient_index (
+    name TEXT PRIMARY KEY,
+    data TEXT NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS appointments (
+    id TEXT PRIMARY KEY,
+    data TEXT NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS appointments_by_date ON appointments (json_extract(data, '$.date'), id);
+CREATE TABLE IF NOT EXISTS appointment_stats (
+    key TEXT PRIMARY KEY,
+    data TEXT NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS outbox (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    updates TEXT NOT NULL,
+    expect TEXT,
+    status TEXT NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    last_error TEXT,
+    created_at REAL NOT NULL
+);
+"""
+
+_schema_ready = False
+_schema_lock = threading.Lock()
+_sync_lock = threading.Lock()
+_sync_wakeup = threading.Event()
+_sync_thread = None
+_status = {'online': True, 'last_error': None, 'last_sync': None}
+
+
+@contextmanager
+def _connect():
+    """Opens the cache database, creating it and its tables on first use."""
+    global _schema_ready
+    if not _schema_ready:
+        os.makedirs(os.path.dirname(CACHE_DB), exist_ok=True)
+    conn = sqlite3.connect(CACHE_DB, timeout=10)
+    try:
+        if not _schema_ready:
+            with _schema_lock:
+                if not _schema_ready:
+                    conn.executescript(_SCHEMA)
+                    _schema_ready = True
+        with conn:
+            yield conn
+    finally:
+        conn.close()
+
+
+# ---------------------------------------------------------------------------
+# Mirrored data
+# ---------------------------------------------------------------------------
+
+def _put_rows(table, key_column, items, replace_all=False):
+    now = time.time()
+    with _connect() as conn:
+        if replace_all:
+            conn.execute(f"DELETE FROM {table}")
+        conn.executemany(
+            f"INSERT OR REPLACE INTO {table} ({key_column}, data, updated_at) VALUES (?, ?, ?)",
+            [(key, json.dumps(value), now) for key, value in items]
+        )
+
+
+def _delete_row(table, key_column, key):
+    with _connect() as conn:
+        conn.execute(f"DELETE FROM {table} WHERE {key_column} = ?", (key,))
+
+
+def _get_row(table, key_column, key):
+    with _connect() as conn:
+        row = conn.execute(f"SELECT data FROM {table} WHERE {key_column} = ?", (key,)).fetchone()
+    return json.loads(row[0]) if row else None
+
+
+def _get_all_rows(table, key_column):
+    with _connect() as conn:
+        rows = conn.execute(f"SELECT {key_column}, data FROM {table}").fetchall()
+    return {key: json.loads(data) for key, data in rows}
+
+
+def cache_patient(name, data):
+    """Stores the raw Firebase node of one patient."""
+    _put_rows('patients', 'name', [(name, data)])
+
+
+def get_cached_patient(name):
+    return _get_row('patients', 'name', name)
+
+
+def get_cached_patients():
+    """Every cached patient node, {name: data}; only patients opened on this workstation."""
+    return _get_all_rows('patients', 'name')
+
+
+def cache_patient_index(index):
+    """Replaces the cached name index with a fresh copy from Firebase."""
+    _put_rows('patient_index', 'name', index.items(), replace_all=True)
+
+
+def cache_patient_summary(name, summary):
+    _put_rows('patient_index', 'name', [(name, summary)])
+
+
+def get_cached_patient_index():
+    return _get_all_rows('patient_index', 'name')
+
+
+def cache_appointments(appointments):
+    """Replaces the cached appointments with a fresh copy from Firebase."""
+    _put_rows('appointments', 'id', appointments.items(), replace_all=True)
+
+
+def cache_appointment(appt_id, appointment):
+    _put_rows('appointments', 'id', [(appt_id, appointment)])
+
+
+def cache_appointment_page(appointments):
+    """Adds a page of appointments ({id: appointment}) fetched from Firebase."""
+    _put_rows('appointments', 'id', [(appt_id, appt) for appt_id, appt in appointments.items() if appt])
+
+
+def cache_appointments_on(day, appointments):
+    """Replaces one day's cached appointments with a fresh copy of its date bucket."""
+    with _connect() as conn:
+        conn.execute("DELETE FROM appointments WHERE json_extract(data, '$.date') = ?", (day,))
+    cache_appointment_page(appointments)
+
+
+def remove_cached_appointment(appt_id):
+    _delete_row('appointments', 'id', appt_id)
+
+
+def get_cached_appointments():
+    return _get_all_rows('appointments', 'id')
+
+
+def get_cached_appointments_on(day):
+    """One day's cached appointments, selected in SQL so the rest are never decoded."""
+    with _connect() as conn:
+        rows = conn.execute("SELECT id, data FROM appointments WHERE json_extract(data, '$.date') = ?",
+                            (day,)).fetchall()
+    return {key: json.loads(data) for key, data in rows}
+
+
+def get_cached_appointments_from(day, limit):
+    """Up to limit cached appointments from day on, ordered by date then ID, selected in SQL."""
+    with _connect() as conn:
+        rows = conn.execute("SELECT id, data FROM appointments WHERE json_extract(data, '$.date') >= ? "
+                            "ORDER BY json_extract(data, '$.date'), id LIMIT ?", (day, limit)).fetchall()
+    return {key: json.loads(data) for key, data in rows}
+
+
+def cache_appointment_stat(key, value):
+    """Stores one appointment counter node ('total' or 'by_date')."""
+    _put_rows('appointment_stats', 'key', [(key, value)])
+
+
+def get_cached_appointment_stat(key):
+    return _get_row('appointment_stats', 'key', key)
+
+
+# ---------------------------------------------------------------------------
+# Applying multi-path updates to local trees
+# ---------------------------------------------------------------------------
+
+def resolve_server_value(value, current):
+    """Evaluates Firebase server values ({'.sv': ...}) against the current value."""
+    if isinstance(value, dict) and '.sv' in value:
+        server_value = value['.sv']
+        if isinstance(server_value, dict) and 'increment' in server_value:
+            return (current if isinstance(current, (int, float)) else 0) + server_value['increment']
+        if server_value == 'timestamp':
+            return int(time.time() * 1000)
+    return value
+
+
+def apply_update(tree, path, value):
+    """Applies one multi-path update entry to a nested dict and returns the tree.
+
+    A value of None deletes the node, like it does in Firebase.
+    """
+    keys = [key for key in path.split('/') if key]
+    if not keys:
+        return resolve_server_value(value, tree)
+    if not isinstance(tree, dict):
+        tree = {}
+    node = tree
+    for key in keys[:-1]:
+        child = node.get(key)
+        if not isinstance(child, dict):
+            if value is None:
+                return tree
+            child = {str(i): item for i, item in enumerate(child)} if isinstance(child, list) else {}
+            node[key] = child
+        node = child
+    value = resolve_server_value(value, node.get(keys[-1]))
+    if value is None:
+        node.pop(keys[-1], None)
+    else:
+        node[keys[-1]] = value
+    return tree
+
+
+def overlay_pending(base_path, data):
+    """Applies queued (not yet synced) writes under base_path to data read from Firebase.
+
+    Keeps freshly fetched data consistent with what this workstation has
+    already written while offline.
+    """
+    prefix = base_path.strip('/') + '/'
+    for updates in pending_updates():
+        for path, value in updates.items():
+            path = path.strip('/')
+            if path == base_path.strip('/'):
+                data = resolve_server_value(value, data)
+            elif path.startswith(prefix):
+                data = apply_update(data, path[len(prefix):], value)
+    return data
+
+
+_CACHED_COLLECTIONS = {
+    'patients': (get_cached_patient, cache_patient, lambda name: _delete_row('patients', 'name', name)),
+    'patient_index': (lambda name: _get_row('patient_index', 'name', name), cache_patient_summary,
+                      lambda name: _delete_row('patient_index', 'name', name)),
+    'appointments': (lambda appt_id: _get_row('appointments', 'id', appt_id), cache_appointment,
+                     remove_cached_appointment),
+    'appointment_stats': (get_cached_appointment_stat, cache_appointment_stat,
+                          lambda key: _delete_row('appointment_stats', 'key', key)),
+}
+
+
+def apply_to_cache(updates):
+    """Applies a root multi-path update to the mirrored tables, so local reads see it at once."""
+    for path, value in updates.items():
+        keys = [key for key in path.split('/') if key]
+        if len(keys) < 2 or keys[0] not in _CACHED_COLLECTIONS:
+            continue
+        get_row, put_row, delete_row = _CACHED_COLLECTIONS[keys[0]]
+        rest = '/'.join(keys[2:])
+        current = get_row(keys[1])
+        node = apply_update(current, rest, value) if rest else resolve_server_value(value, current)
+        if node is None:
+            delete_row(keys[1])
+        else:
+            put_row(keys[1], node)
+
+
+# ---------------------------------------------------------------------------
+# Outbox and write-behind sync
+# ---------------------------------------------------------------------------
+
+def enqueue_write(updates, expect=None):
+    """Durably queues a root multi-path update for Firebase.
+
+    expect maps small paths to the values this workstation last saw; if
+    any differs on the server at sync time the write is held back as a
+    conflict instead of being applied.
+    """
+    with _connect() as conn:
+        cursor = conn.execute(
+            "INSERT INTO outbox (updates, expect, created_at) VALUES (?, ?, ?)",
+            (json.dumps(updates), json.dumps(expect) if expect else None, time.time())
+        )
+        entry_id = cursor.lastrowid
+    apply_to_cache(updates)
+
+    if _sync_thread is not None and _sync_thread.is_alive():
+        _sync_wakeup.set()
+    else:
+        # No background syncer (scripts, tests): flush right away
+        sync_outbox()
+    return entry_id
+
+
+def pending_updates():
+    with _connect() as conn:
+        rows = conn.execute("SELECT updates FROM outbox WHERE status = 'pending' ORDER BY id").fetchall()
+    return [json.loads(row[0]) for row in rows]
+
+
+def get_outbox(status=None):
+    """Returns outbox entries as dicts, oldest first."""
+    query = "SELECT id, updates, expect, status, attempts, last_error, created_at FROM outbox"
+    params = ()
+    if status:
+        query += " WHERE status = ?"
+        params = (status,)
+    with _connect() as conn:
+        rows = conn.execute(query + " ORDER BY id", params).fetchall()
+    return [
+        {
+            'id': row[0],
+            'updates': json.loads(row[1]),
+            'expect': json.loads(row[2]) if row[2] else None,
+            'status': row[3],
+            'attempts': row[4],
+            'last_error': row[5],
+            'created_at': row[6],
+        }
+        for row in rows
+    ]
+
+
+def get_held_back_writes():
+    """Outbox entries parked as 'conflict' or 'failed', oldest first."""
+    return [entry for entry in get_outbox() if entry['status'] != 'pending']
+
+
+def _remove_outbox_entry(entry_id):
+    with _connect() as conn:
+        conn.execute("DELETE FROM outbox WHERE id = ?", (entry_id,))
+
+
+def discard_outbox_entry(entry_id):
+    """Drops an entry, e.g. a conflict the user chose not to apply; writes held behind it sync next."""
+    _remove_outbox_entry(entry_id)
+    _sync_wakeup.set()
+
+
+def retry_outbox_entry(entry_id):
+    """Re-queues a conflicted or failed entry without its precondition."""
+    with _connect() as conn:
+        row = conn.execute("SELECT updates FROM outbox WHERE id = ?", (entry_id,)).fetchone()
+        conn.execute("UPDATE outbox SET status = 'pending', expect = NULL, attempts = 0 WHERE id = ?",
+                     (entry_id,))
+    if row:
+        apply_to_cache(json.loads(row[0]))  # parking put the cached rows back
+    _sync_wakeup.set()
+
+
+def describe_outbox_entry(entry):
+    """One line for the UI, e.g. 'Delete patients/Ann Wambui'."""
+    writes = [value for value in entry['updates'].values() if not _is_increment(value)]
+    action = "Delete" if writes and all(value is None for value in writes) else "Update"
+    return f"{action} {', '.join(sorted(_entry_records(entry)))}"
+
+
+def _is_network_error(e):
+    try:
+        from firebase_admin import exceptions
+        if isinstance(e, (exceptions.UnavailableError, exceptions.DeadlineExceededError)):
+            return True
+    except ImportError:
+        pass
+    return isinstance(e, OSError)
+
+
+def _is_increment(value):
+    return isinstance(value, dict) and isinstance(value.get('.sv'), dict) and 'increment' in value['.sv']
+
+
+def _record_of(path):
+    """The record a path belongs to: 'patients/<name>' for a patient and its
+    index entry, 'appointments/<id>' for an appointment and its day bucket
+    entry, and the path itself for anything else."""
+    keys = [key for key in path.split('/') if key]
+    if len(keys) >= 2 and keys[0] in ('patients', 'patient_index'):
+        return f'patients/{keys[1]}'
+    if len(keys) >= 2 and keys[0] == 'appointments':
+        return f'appointments/{keys[1]}'
+    if len(keys) >= 3 and keys[0] == 'appointments_by_date':
+        return f'appointments/{keys[2]}'
+    return '/'.join(keys)
+
+
+def _entry_records(entry):
+    """The records an entry writes (e.g. 'patients/Ann Wambui').
+
+    Server increments (billing totals, visit and appointment counters) add
+    up the same in any order, so they do not tie entries together.
+    """
+    paths = [path for path, value in entry['updates'].items() if not _is_increment(value)]
+    return {_record_of(path) for path in paths + list(entry['expect'] or {})}
+
+
+def _already_deleted(entry, changed, current):
+    """True if every changed precondition is inside a node the entry deletes
+    and is gone from the server: another workstation deleted it first."""
+    deleted = [path for path, value in entry['updates'].items() if value is None]
+    return all(current[path] is None and any(path == other or path.startswith(other + '/') for other in deleted)
+               for path in changed)
+
+
+def _overlaps(path, paths):
+    return any(path == other or path.startswith(other + '/') or other.startswith(path + '/') for other in paths)
+
+
+def _refresh_cached_rows(updates):
+    """Re-reads from Firebase the cached rows a parked entry had changed locally.
+
+    apply_to_cache showed the write as done when it was queued; once it is
+    held back the rows go back to the server's copy (plus writes still
+    pending here).
+    """
+    from utils.storage import db
+
+    rows = set()
+    for path in updates:
+        keys = [key for key in path.split('/') if key]
+        if len(keys) >= 2 and keys[0] in _CACHED_COLLECTIONS:
+            rows.add((keys[0], keys[1]))
+    for collection, key in rows:
+        _, put_row, delete_row = _CACHED_COLLECTIONS[collection]
+        row_path = f'{collection}/{key}'
+        node = overlay_pending(row_path, db.reference(row_path).get())
+        if node is None:
+            delete_row(key)
+        else:
+            put_row(key, node)
+
+
+def _park(entry, status, error):
+    """Marks an entry 'conflict' or 'failed' and puts back the cached rows it changed."""
+    with _connect() as conn:
+        conn.execute("UPDATE outbox SET status = ?, last_error = ? WHERE id = ?", (status, error, entry['id']))
+    try:
+        _refresh_cached_rows(entry['updates'])
+    except Exception as e:
+        print(f"Error refreshing cached data after a held-back write: {e}")
+
+
+def sync_outbox():
+    """Pushes queued writes to Firebase in order; returns how many were applied.
+
+    Writes are never reordered: a failed entry stops the sync until it
+    succeeds on a later attempt, and once an entry is parked (conflict, or
+    failed MAX_SYNC_ATTEMPTS times) later entries writing to the same
+    patient or appointment are held back until it is retried or discarded.
+    Parking an entry refreshes the cached rows it had changed. A delete of
+    something another workstation already deleted counts as applied.
+    """
+    from utils.storage import db
+
+    applied = 0
+    with _sync_lock:
+        held = set()  # records written by parked entries
+        for entry in get_outbox():
+            records = _entry_records(entry)
+            if entry['status'] != 'pending':
+                held.update(records)
+                continue
+            if any(_overlaps(record, held) for record in records):
+                held.update(records)  # later writes to these records wait behind this one
+                continue
+            try:
+                current = {path: db.reference(path).get() for path in entry['expect'] or {}}
+                changed = [path for path, seen in (entry['expect'] or {}).items() if current[path] != seen]
+                if not changed:
+                    db.reference().update(entry['updates'])
+                elif _already_deleted(entry, changed, current):
+                    # Its counters were counted down by whoever deleted it, so
+                    # only the cached copies go back to the server's values
+                    _refresh_cached_rows(entry['updates'])
+                else:
+                    _park(entry, 'conflict', f"Changed on server: {', '.join(changed)}")
+                    held.update(records)
+                    continue
+            except Exception as e:
+                _status['last_error'] = str(e)
+                if _is_network_error(e):
+                    _status['online'] = False
+                    break
+                attempts = entry['attempts'] + 1
+                with _connect() as conn:
+                    conn.execute("UPDATE outbox SET attempts = ?, last_error = ? WHERE id = ?",
+                                 (attempts, str(e), entry['id']))
+                if attempts < MAX_SYNC_ATTEMPTS:
+                    break  # retried first on the next sync
+                _park(entry, 'failed', str(e))
+                held.update(records)
+                continue
+
+            _remove_outbox_entry(entry['id'])
+            applied += 1
+            _status['online'] = True
+            _status['last_error'] = None
+            _status['last_sync'] = time.time()
+    return applied
+
+
+def _sync_loop(interval):
+    while True:
+        _sync_wakeup.wait(interval)
+        _sync_wakeup.clear()
+        try:
+            sync_outbox()
+        except Exception as e:
+            print(f"Error syncing local changes: {e}")
+
+
+def start_background_sync(interval=SYNC_INTERVAL):
+    """Starts the daemon thread that flushes the outbox whenever writes are queued."""
+    global _sync_thread
+    if _sync_thread is not None and _sync_thread.is_alive():
+        return _sync_thread
+    _sync_thread = threading.Thread(target=_sync_loop, args=(interval,), name="pearltrack-sync", daemon=True)
+    _sync_thread.start()
+    _sync_wakeup.set()  # flush anything left over from the last session
+    return _sync_thread
+
+
+def sync_status():
+    """Summary for the UI: connectivity plus pending / conflicted / failed write counts."""
+    with _connect() as conn:
+        counts = dict(conn.execute("SELECT status, COUNT(*) FROM outbox GROUP BY status").fetchall())
+    return {
+        'online': _status['online'],
+        'last_error': _status['last_error'],
+        'last_sync': _status['last_sync'],
+        'pending': counts.get('pending', 0),
+        'conflicts': counts.get('conflict', 0),
+        'failed': counts.get('failed', 0),
+    }
+
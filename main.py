@@ -1,12 +1,87 @@
 # main.py
-from firebase_realtime import initialize_firebase
-from dashboard import launch_dashboard
+import argparse
+import os
+import sys
+import tempfile
 
-# Initialize Firebase only once
-initialize_firebase()
 
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="PearlTrack dental filing system")
+    parser.add_argument('--profile', action='store_true',
+                        help="profile the session (cProfile, stack samples, tracemalloc) and write the results on exit")
+    parser.add_argument('--profile-dir', help="where to write the profile (default: profiles/<timestamp>)")
+    parser.add_argument('--replay', action='store_true',
+                        help="profile a scripted session through every screen, then exit (implies --profile)")
+    parser.add_argument('--synthetic-patients', type=int, default=0,
+                        help="fill a local storage backend (PEARLTRACK_STORAGE) with this many synthetic patients")
+    return parser.parse_args(argv)
 
-if __name__ == "__main__":
-    launch_dashboard()
 
+def main(argv=None):
+    args = parse_args(argv)
+    if args.synthetic_patients:
+        # Keep synthetic patients out of this workstation's offline cache
+        os.environ.setdefault("PEARLTRACK_CACHE_DB",
+                              os.path.join(tempfile.mkdtemp(prefix='pearltrack-'), 'cache.db'))
+
+    session = None
+    if args.profile or args.replay:
+        # Started before the app's modules are imported, so startup is profiled too (the part
+        # behind the splash runs on a background thread and shows up in the stack samples)
+        from utils.profiling import ProfileSession
+        session = ProfileSession(args.profile_dir).start()
+
+    import tkinter as tk
+    from tkinter import messagebox
+    from splash import Splash
+    from utils.storage import get_backend, initialize_storage
+
+    backend = get_backend()
+    if backend.name == 'firebase' and args.synthetic_patients:
+        sys.exit("--synthetic-patients needs a local backend, e.g. PEARLTRACK_STORAGE=memory")
+
+    # The splash is up before anything heavy is imported; the rest of
+    # startup runs behind it and the dashboard replaces it on the same root
+    root = tk.Tk()
+    root.withdraw()
+    splash = Splash(root)
 
+    def start(status):
+        # Background thread: no widgets here
+        status("Connecting to the database...")
+        initialize_storage()  # Initializes Firebase once (PEARLTRACK_STORAGE can point at a local emulator instead)
+        if args.synthetic_patients:
+            status(f"Generating {args.synthetic_patients} synthetic patients...")
+            from utils.benchmarks.clinic import ClinicSpec, generate_clinic, load_clinic
+            load_clinic(generate_clinic(ClinicSpec(patients=args.synthetic_patients)))
+        status("Loading patient records...")
+        from dashboard import launch_dashboard
+        return launch_dashboard
+
+    def on_loaded(launch_dashboard):
+        on_ready = None
+        if args.replay:
+            from utils.profiling import start_replay
+            on_ready = lambda app, close: start_replay(app, close, session,
+                                                       allow_writes=backend.name != 'firebase')
+        try:
+            launch_dashboard(on_ready, root=root)
+        except Exception as e:
+            on_failed(e)
+            return
+        splash.close()
+
+    def on_failed(e):
+        splash.close()
+        messagebox.showerror("PearlTrack", f"PearlTrack could not start:\n{e}")
+        root.destroy()
+
+    try:
+        splash.load(start, on_loaded, on_failed)
+        root.mainloop()
+    finally:
+        if session is not None:
+            print(f"Profile written to {session.stop()}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,210 @@
+import json
+import logging
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from functools import wraps
+from itertools import islice
+from logging.handlers import RotatingFileHandler
+
+# Per-operation latency and payload counters. Every storage call and
+# background task is recorded automatically (utils.storage, utils.io_worker);
+# UI handlers are wrapped with @instrumented. Each operation keeps a rolling
+# window of recent latencies for percentiles, cumulative histogram buckets,
+# and its slowest calls with what they were for (e.g. the patient name).
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+# Set to a file path to log every call from startup; the diagnostics screen can also switch it on
+METRICS_LOG_ENV = "PEARLTRACK_METRICS_LOG"
+DEFAULT_LOG_PATH = os.path.join(BASE_DIR, "database", "metrics.log")
+LOG_MAX_BYTES = 1024 * 1024
+LOG_BACKUPS = 3
+
+# Histogram bucket upper bounds in milliseconds; the last bucket is everything slower
+LATENCY_BUCKETS_MS = [1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000]
+# Recent calls per operation that percentiles are computed over
+ROLLING_SAMPLES = 200
+# Slowest calls remembered per operation
+SLOWEST_KEPT = 5
+# Payloads with more children than this are sized from a sample of them, so
+# sizing a whole collection costs no more than sizing a few of its entries
+PAYLOAD_SAMPLE = 20
+
+_operations = {}
+_lock = threading.Lock()
+_logger = logging.getLogger('pearltrack.metrics')
+_logger.propagate = False
+_log_handler = None
+
+
+class OperationStats:
+    def __init__(self, name):
+        self.name = name
+        self.count = 0
+        self.errors = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self.total_bytes = 0
+        self.sized = 0
+        self.buckets = [0] * (len(LATENCY_BUCKETS_MS) + 1)
+        self.recent = deque(maxlen=ROLLING_SAMPLES)
+        self.slowest = []  # (elapsed_ms, detail, wall time), slowest first
+        self.last_error = None
+
+    def add(self, elapsed_ms, size=None, detail=None, error=None):
+        self.count += 1
+        self.total_ms += elapsed_ms
+        self.max_ms = max(self.max_ms, elapsed_ms)
+        self.recent.append(elapsed_ms)
+        bucket = 0
+        while bucket < len(LATENCY_BUCKETS_MS) and elapsed_ms > LATENCY_BUCKETS_MS[bucket]:
+            bucket += 1
+        self.buckets[bucket] += 1
+        if size is not None:
+            self.total_bytes += size
+            self.sized += 1
+        if error is not None:
+            self.errors += 1
+            self.last_error = str(error)
+        if len(self.slowest) < SLOWEST_KEPT or elapsed_ms > self.slowest[-1][0]:
+            self.slowest.append((elapsed_ms, detail, time.time()))
+            self.slowest.sort(key=lambda entry: entry[0], reverse=True)
+            del self.slowest[SLOWEST_KEPT:]
+
+    def percentile(self, q):
+        values = sorted(self.recent)
+        if not values:
+            return 0.0
+        return values[min(len(values) - 1, int(len(values) * q / 100))]
+
+    def summary(self):
+        return {
+            'name': self.name,
+            'count': self.count,
+            'errors': self.errors,
+            'mean_ms': self.total_ms / self.count if self.count else 0.0,
+            'p50_ms': self.percentile(50),
+            'p90_ms': self.percentile(90),
+            'p99_ms': self.percentile(99),
+            'max_ms': self.max_ms,
+            'total_ms': self.total_ms,
+            'mean_bytes': self.total_bytes / self.sized if self.sized else None,
+            'total_bytes': self.total_bytes,
+            'buckets': list(self.buckets),
+            'slowest': list(self.slowest),
+            'last_error': self.last_error,
+        }
+
+
+def _json_size(value):
+    return len(json.dumps(value, separators=(',', ':'), default=str))
+
+
+def payload_size(value):
+    """Approximate wire size of a JSON value in bytes."""
+    if value is None:
+        return 0
+    try:
+        if isinstance(value, dict) and len(value) > PAYLOAD_SAMPLE:
+            sample = dict(islice(value.items(), PAYLOAD_SAMPLE))
+            return _json_size(sample) * len(value) // PAYLOAD_SAMPLE
+        return _json_size(value)
+    except (TypeError, ValueError):
+        return 0
+
+
+def record(operation, elapsed_ms, size=None, detail=None, error=None):
+    """Adds one call of an operation; detail says what it was for, e.g. a patient name."""
+    with _lock:
+        stats = _operations.get(operation)
+        if stats is None:
+            stats = _operations[operation] = OperationStats(operation)
+        stats.add(elapsed_ms, size, detail, error)
+    if _log_handler is not None:
+        _logger.info(json.dumps({'op': operation, 'ms': round(elapsed_ms, 3), 'bytes': size,
+                                 'detail': detail, 'error': str(error) if error is not None else None}))
+
+
+def record_error(operation, error, detail=None):
+    """Counts a failure that was handled (and printed) without timing it."""
+    record(operation, 0.0, detail=detail, error=error)
+
+
+@contextmanager
+def timed(operation, detail=None):
+    started = time.perf_counter()
+    try:
+        yield
+    except Exception as e:
+        record(operation, (time.perf_counter() - started) * 1000, detail=detail, error=e)
+        raise
+    record(operation, (time.perf_counter() - started) * 1000, detail=detail)
+
+
+def instrumented(operation, detail_arg=None):
+    """Decorator that times every call of a function as operation.
+
+    detail_arg is the position of the argument recorded as the call's
+    detail (for methods, 1 is the first argument after self).
+    """
+    def decorate(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            detail = args[detail_arg] if detail_arg is not None and len(args) > detail_arg else None
+            with timed(operation, detail if isinstance(detail, (str, int, float)) else None):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def snapshot():
+    """Summaries of every operation, most total time first."""
+    with _lock:
+        summaries = [stats.summary() for stats in _operations.values()]
+    return sorted(summaries, key=lambda summary: summary['total_ms'], reverse=True)
+
+
+def slowest_calls(limit=20):
+    """[(elapsed_ms, operation, detail, wall time)] across every operation, slowest first."""
+    with _lock:
+        calls = [(ms, stats.name, detail, at) for stats in _operations.values()
+                 for ms, detail, at in stats.slowest]
+    return sorted(calls, key=lambda call: call[0], reverse=True)[:limit]
+
+
+def reset():
+    with _lock:
+        _operations.clear()
+
+
+def enable_log(path=DEFAULT_LOG_PATH):
+    """Also writes every recorded call as a JSON line to a rotating log file."""
+    global _log_handler
+    disable_log()
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    handler = RotatingFileHandler(path, maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUPS, encoding='utf-8')
+    handler.setFormatter(logging.Formatter('%(asctime)s %(message)s'))
+    _logger.addHandler(handler)
+    _logger.setLevel(logging.INFO)
+    _log_handler = handler
+    return path
+
+
+def disable_log():
+    global _log_handler
+    if _log_handler is not None:
+        _logger.removeHandler(_log_handler)
+        _log_handler.close()
+        _log_handler = None
+
+
+def log_path():
+    return _log_handler.baseFilename if _log_handler is not None else None
+
+
+if os.environ.get(METRICS_LOG_ENV):
+    enable_log(os.environ[METRICS_LOG_ENV])
@@ -1,5 +1,29 @@
-from firebase_realtime import initialize_firebase  # Import your Firebase initialization
-from firebase_admin import db
+import threading
+import time
+from datetime import date
+from utils.storage import db, increment
+from utils.push_ids import generate_push_id
+from utils.billing import patient_removal_updates, visit_billing_updates, visit_day
+from utils.local_cache import (
+    cache_patient,
+    cache_patient_index,
+    enqueue_write,
+    get_cached_patient,
+    get_cached_patient_index,
+    overlay_pending,
+)
+
+# Lightweight per-patient summaries, kept next to 'patients' so listing
+# screens never have to download visit records.
+PATIENT_INDEX_PATH = 'patient_index'
+
+# Seconds a loaded patient is reused by the history view, exports and
+# refreshes before it is fetched again. Writes drop it straight away.
+PATIENT_CACHE_TTL = 60
+
+_loaded_patients = {}  # name -> (loaded_at, flattened data)
+_loads_in_flight = {}  # name -> [loads running, writes since the first started], so a load racing a write is not kept
+_loaded_lock = threading.Lock()
 
 def get_all_patients():
     
@@ -11,33 +35,257 @@ def get_patient_file_path(name):
     """Generates a reference path for the patient's data in Firebase."""
     return f'patients/{name}'
 
+def get_patient_records_path(name):
+    """Generates a reference path for the patient's visit records."""
+    return f'patients/{name}/records'
+
+def get_patient_index_path(name):
+    """Generates a reference path for the patient's summary in the name index."""
+    return f'{PATIENT_INDEX_PATH}/{name}'
+
+def _empty_summary(name):
+    return {
+        'name': name,
+        'visits': 0,
+        'last_visit': None,
+        'total_charged': 0,
+        'total_paid': 0,
+        'balance': 0,
+    }
+
+def get_patient_index():
+    """Returns {name: summary} for every patient without loading visit records.
+
+    Falls back to a shallow read of 'patients' (names only) when the index
+    has not been built yet, and to the local cache when Firebase is
+    unreachable.
+    """
+    try:
+        index = db.reference(PATIENT_INDEX_PATH).get()
+        if not index:
+            names = db.reference('patients').get(shallow=True) or {}
+            index = {name: {'name': name} for name in names}
+    except Exception as e:
+        cached = get_cached_patient_index()
+        if not cached:
+            raise
+        print(f"Using cached patient index: {e}")
+        return cached
+
+    index = overlay_pending(PATIENT_INDEX_PATH, index) or {}
+    cache_patient_index(index)
+    return index
+
+def get_patient_names():
+    """Returns the sorted list of patient names from the name index."""
+    return sorted(get_patient_index())
+
+def count_patients():
+    """Number of patients, from a shallow (keys only) read of the name index."""
+    try:
+        names = db.reference(PATIENT_INDEX_PATH).get(shallow=True)
+        if not names:
+            names = db.reference('patients').get(shallow=True)
+        names = overlay_pending(PATIENT_INDEX_PATH, dict(names or {}))
+    except Exception as e:
+        print(f"Using cached patient index: {e}")
+        names = get_cached_patient_index()
+    return len(names or {})
+
+def get_cached_patient_names():
+    """Returns the sorted patient names from the local cache, without any network access."""
+    return sorted(get_cached_patient_index())
+
+def rebuild_patient_index():
+    """Rebuilds the name index from the full 'patients' tree (one-off migration)."""
+    patients = db.reference('patients').get() or {}
+    existing = db.reference(PATIENT_INDEX_PATH).get() or {}
+    index = {}
+    for name, data in patients.items():
+        # Legacy list records carry no dates, so their last visit is kept from the old index
+        last_visit = (existing.get(name) or {}).get('last_visit')
+        index[name] = summarize_patient(name, (data or {}).get('records'), last_visit)
+    db.reference(PATIENT_INDEX_PATH).set(index)
+    return index
+
+def summarize_patient(name, records, last_visit=None):
+    """Builds a patient's name-index summary from its visit records.
+
+    last_visit is the day of the newest push-keyed visit; when no visit
+    carries a date (legacy list records) the last_visit passed in is kept.
+    """
+    summary = _empty_summary(name)
+    for record in ordered_records(records):
+        _add_visit_to_summary(summary, record)
+    if isinstance(records, dict):
+        days = [visit_day(key) for key, record in records.items() if record]
+        last_visit = max((day for day in days if day), default=last_visit)
+    summary['last_visit'] = last_visit
+    return summary
+
+def _add_visit_to_summary(summary, record):
+    summary['visits'] = summary.get('visits', 0) + 1
+    summary['total_charged'] = summary.get('total_charged', 0) + (record.get('amount_charged') or 0)
+    summary['total_paid'] = summary.get('total_paid', 0) + (record.get('amount_paid') or 0)
+    summary['balance'] = summary.get('balance', 0) + (record.get('balance') or 0)
+    return summary
+
+def ordered_records(records):
+    """Returns visit records oldest first, whatever shape they are stored in.
+
+    Older patients keep 'records' as a list (read back from Firebase as a
+    list or as {"0": ..., "1": ...}); newer visits are push-keyed children.
+    Firebase orders integer keys numerically before string keys, and push
+    keys sort chronologically, so this matches the server's key order.
+    """
+    if not records:
+        return []
+    if isinstance(records, list):
+        return [record for record in records if record]
+
+    def key_order(key):
+        return (0, int(key), '') if key.isdigit() else (1, 0, key)
+
+    return [records[key] for key in sorted(records, key=key_order) if records[key]]
+
+def migrate_patient_records(name):
+    """Converts a patient's list-shaped 'records' into push-keyed children.
+
+    Legacy visits get push IDs with synthetic timestamps (their index, in
+    ms after the epoch) so they keep their order and sort before every
+    visit added since. Runs as a transaction, so it is safe to run while
+    other workstations are adding visits. Returns True if anything changed.
+    """
+    migrated = []
+
+    def convert(records):
+        migrated[:] = []
+        if not records or not any(key.isdigit() for key in _record_keys(records)):
+            return records
+        converted = {}
+        for key in _record_keys(records):
+            record = records[int(key)] if isinstance(records, list) else records[key]
+            if not record:
+                continue
+            if key.isdigit():
+                converted[generate_push_id(timestamp_ms=int(key))] = record
+                migrated.append(key)
+            else:
+                converted[key] = record
+        return converted
+
+    db.reference(get_patient_records_path(name)).transaction(convert)
+    invalidate_patient(name)
+    return bool(migrated)
+
+def _record_keys(records):
+    if isinstance(records, list):
+        return [str(i) for i in range(len(records))]
+    return list(records)
+
+def migrate_all_patient_records():
+    """Runs migrate_patient_records for every patient; returns the migrated names."""
+    names = db.reference('patients').get(shallow=True) or {}
+    return [name for name in names if migrate_patient_records(name)]
+
 def create_patient(name):
     """Creates a new patient record in Firebase if it does not exist."""
-    ref = db.reference(get_patient_file_path(name))
-    if ref.get() is None:  # Check if patient already exists
-        ref.set({"name": name, "records": []})
+    # Only the name fields are written, so this is a no-op for existing patients
+    invalidate_patient(name)
+    enqueue_write({
+        f'{get_patient_file_path(name)}/name': name,
+        f'{get_patient_index_path(name)}/name': name,
+    })
+
+def _flatten_patient(data):
+    data = dict(data)
+    # Flatten list- or push-keyed 'records' into a list, oldest first
+    data['records'] = ordered_records(data.get('records'))
+    return data
+
+def get_loaded_patient(name, max_age=PATIENT_CACHE_TTL):
+    """Returns the patient loaded within the last max_age seconds, or None.
+
+    The data is shared between callers and must not be modified.
+    """
+    with _loaded_lock:
+        entry = _loaded_patients.get(name)
+    if entry is None or time.monotonic() - entry[0] > max_age:
+        return None
+    return entry[1]
+
+def invalidate_patient(name):
+    """Forgets a loaded patient so the next load fetches it again."""
+    with _loaded_lock:
+        _loaded_patients.pop(name, None)
+        if name in _loads_in_flight:
+            _loads_in_flight[name][1] += 1
+
+def _start_load(name):
+    """Registers a load; returns the write count to hand to _finish_load."""
+    with _loaded_lock:
+        loads = _loads_in_flight.setdefault(name, [0, 0])
+        loads[0] += 1
+        return loads[1]
+
+def _finish_load(name, data, writes):
+    """Keeps data (None for a failed load) unless the patient was written meanwhile.
+
+    Loads older than PATIENT_CACHE_TTL are dropped here too, so neither
+    table grows with every patient ever opened.
+    """
+    now = time.monotonic()
+    with _loaded_lock:
+        loads = _loads_in_flight[name]
+        if data is not None and loads[1] == writes:
+            _loaded_patients[name] = (now, data)
+        loads[0] -= 1
+        if not loads[0]:
+            del _loads_in_flight[name]
+        for expired in [key for key, (loaded_at, _) in _loaded_patients.items() if now - loaded_at > PATIENT_CACHE_TTL]:
+            del _loaded_patients[expired]
+    return data
+
+def load_patient(name, max_age=None):
+    """Loads patient data from Firebase, falling back to the local cache when offline.
 
-def load_patient(name):
-    """Loads patient data from Firebase."""
+    With max_age, a copy loaded within that many seconds is returned
+    without going to the network.
+    """
+    if max_age is not None:
+        loaded = get_loaded_patient(name, max_age)
+        if loaded is not None:
+            return loaded
+    writes = _start_load(name)
+    loaded = None
     try:
         ref = db.reference(get_patient_file_path(name))
-        data = ref.get()
+        data = overlay_pending(get_patient_file_path(name), ref.get())
         if data is None:
             raise ValueError("No data found for this patient.")
         
-        # Ensure that 'records' exists in the data
-        if 'records' not in data:
-            data['records'] = []
-        
-        return data
+        cache_patient(name, data)
+        loaded = _flatten_patient(data)
+        return loaded
     except Exception as e:
+        cached = get_cached_patient(name)
+        if cached is not None:
+            print(f"Using cached patient data: {e}")
+            return _flatten_patient(cached)
         print(f"Error loading patient data: {e}")
         return {"name": name, "records": []}
+    finally:
+        _finish_load(name, loaded, writes)
+
+def load_cached_patient(name):
+    """Returns the locally cached copy of a patient, or None if it was never loaded."""
+    cached = get_cached_patient(name)
+    return _flatten_patient(cached) if cached is not None else None
 
 def save_patient(name, data):
     """Saves the patient data to Firebase."""
-    ref = db.reference(get_patient_file_path(name))
-    ref.set(data)
+    invalidate_patient(name)
+    enqueue_write({get_patient_file_path(name): data})
 
 def add_patient_visit(name,age,gender,contact, next_of_kin,chief_complain, hpc, pdh, pmh, diagnosis, treatment , management, amount_charged, medicine, amount_paid, balance):
     """Adds a visit record for a patient."""
@@ -64,26 +312,67 @@ def add_patient_visit(name,age,gender,contact, next_of_kin,chief_complain, hpc,
         # Removed 'date' field as per your request
     }
     
-    # Reference to the patient's node in Firebase
-    ref = db.reference(get_patient_file_path(name))
-    
-    # Append the new visit record to the existing records
-    current_data = ref.get() or {"name": name, "records": []}
-    
-    # Ensure 'records' is initialized
-    if 'records' not in current_data:
-        current_data['records'] = []
-    
-    current_data['records'].append(patient_record)
-    
-    # Save the updated patient data back to Firebase
-    ref.set(current_data)
+    # Append the visit as a new push-keyed child and update the name index
+    # in one multi-path write: the payload no longer depends on how many
+    # visits the patient already has, and concurrent writers cannot
+    # overwrite each other's visits. The write is queued locally first and
+    # synced in the background, so it also works offline.
+    visit_id = generate_push_id()
+    visit_date = date.today().isoformat()
+    index_path = get_patient_index_path(name)
+    updates = {
+        f'{get_patient_file_path(name)}/name': name,
+        f'{get_patient_records_path(name)}/{visit_id}': patient_record,
+        f'{index_path}/name': name,
+        f'{index_path}/last_visit': visit_date,
+        f'{index_path}/visits': increment(1),
+        f'{index_path}/total_charged': increment(amount_charged or 0),
+        f'{index_path}/total_paid': increment(amount_paid or 0),
+        f'{index_path}/balance': increment(balance or 0),
+    }
+    # Practice-wide and per-day billing totals move in the same write
+    updates.update(visit_billing_updates(visit_date, amount_charged, amount_paid, balance))
+    invalidate_patient(name)
+    enqueue_write(updates)
     print(f"Patient visit for {name} added successfully.")
+    return visit_id
+
+def _removal_summary(name):
+    """The totals to take out of the practice totals when a patient is deleted.
+
+    Returns (summary, visits in the index). Read live (plus visits still
+    queued here), so a stale or missing cached summary cannot leave
+    billing_totals too high; a patient whose summary has no visit count is
+    summarized from its records. Offline, the cached summary is used, and
+    without one the delete is refused.
+    """
+    index_path = get_patient_index_path(name)
+    try:
+        summary = overlay_pending(index_path, db.reference(index_path).get()) or {}
+        if 'visits' not in summary:
+            records_path = get_patient_records_path(name)
+            records = overlay_pending(records_path, db.reference(records_path).get())
+            return summarize_patient(name, records), None
+    except Exception as e:
+        summary = get_cached_patient_index().get(name) or {}
+        if 'visits' not in summary:
+            raise ValueError(f"{name} cannot be deleted while offline: this workstation has no copy "
+                             f"of the patient's totals ({e})") from e
+    return summary, summary['visits']
 
 def delete_patient(name):
     """Deletes a patient record from Firebase."""
-    ref = db.reference(get_patient_file_path(name))
-    ref.delete()
+    summary, visits = _removal_summary(name)
+    # Hold the delete back as a conflict if another workstation adds visits
+    # before it reaches the server
+    expect = {f'{get_patient_index_path(name)}/visits': visits}
+    updates = {
+        get_patient_file_path(name): None,
+        get_patient_index_path(name): None,
+    }
+    updates.update(patient_removal_updates(summary))
+    invalidate_patient(name)
+    enqueue_write(updates, expect=expect)
 
 
 
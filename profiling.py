@@ -0,0 +1,280 @@
+import cProfile
+import io
+import json
+import os
+import pstats
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+
+# Profiling for `python main.py --profile`. A session runs three recorders
+# at once and writes what they found when the app exits:
+#
+#     profile.pstats      cProfile of the Tk thread (snakeviz, gprof2dot, pstats)
+#     profile.collapsed   sampled stacks of every thread in folded format, one
+#                         "frame;frame;frame count" line per stack, for
+#                         flamegraph.pl or speedscope
+#     profile-top.txt     the heaviest functions by cumulative and own time
+#     allocations.txt     tracemalloc top allocation sites and peak memory
+#     metrics.json        the per-operation timings from utils.metrics
+#     replay.txt          step timings, when a scripted replay was run
+#
+# cProfile only sees the thread that enabled it, so the sampler is what
+# shows time spent on the background I/O threads (network, JSON parsing).
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+PROFILES_DIR = os.path.join(BASE_DIR, "profiles")
+
+# Milliseconds between stack samples
+SAMPLE_INTERVAL_MS = 5
+# Frames kept per allocation traceback
+TRACEMALLOC_FRAMES = 15
+TOP_FUNCTIONS = 60
+TOP_ALLOCATIONS = 40
+
+# Replay: a step is finished once no background task, history chunk or
+# search is pending; it is abandoned after STEP_TIMEOUT seconds
+STEP_POLL_MS = 20
+STEP_TIMEOUT = 60
+REPLAY_SEARCH = "mw"
+
+
+def default_profile_dir():
+    return os.path.join(PROFILES_DIR, time.strftime('%Y%m%d-%H%M%S'))
+
+
+def _frame_label(code):
+    return f"{os.path.basename(code.co_filename)}:{code.co_name}"
+
+
+class StackSampler:
+    """Samples the stacks of every thread at a fixed interval and counts them."""
+
+    def __init__(self, interval_ms=SAMPLE_INTERVAL_MS):
+        self.interval = interval_ms / 1000
+        self.stacks = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="pearltrack-sampler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def _run(self):
+        own = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                stack = []
+                while frame is not None:
+                    stack.append(_frame_label(frame.f_code))
+                    frame = frame.f_back
+                stack.append(names.get(ident, str(ident)).replace(';', '_').replace(' ', '_'))
+                self.stacks[';'.join(reversed(stack))] += 1
+            self.samples += 1
+
+    def write_collapsed(self, path):
+        with open(path, 'w', encoding='utf-8') as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+
+
+class ProfileSession:
+    def __init__(self, directory=None, interval_ms=SAMPLE_INTERVAL_MS):
+        self.directory = directory or default_profile_dir()
+        self.profiler = cProfile.Profile()
+        self.sampler = StackSampler(interval_ms)
+        self.replay_log = []  # (step, seconds or None for notes) from a scripted replay
+        self.started_at = None
+
+    def start(self):
+        os.makedirs(self.directory, exist_ok=True)
+        self.started_at = time.perf_counter()
+        tracemalloc.start(TRACEMALLOC_FRAMES)
+        self.sampler.start()
+        self.profiler.enable()
+        return self
+
+    def path(self, name):
+        return os.path.join(self.directory, name)
+
+    def stop(self):
+        """Stops every recorder and writes the results; returns the directory."""
+        self.profiler.disable()
+        self.sampler.stop()
+        snapshot = tracemalloc.take_snapshot()
+        current, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        elapsed = time.perf_counter() - self.started_at
+
+        self.profiler.dump_stats(self.path('profile.pstats'))
+        self.sampler.write_collapsed(self.path('profile.collapsed'))
+        self._write_top_functions(elapsed)
+        self._write_allocations(snapshot, current, peak)
+        self._write_metrics()
+        if self.replay_log:
+            self._write_replay()
+        return self.directory
+
+    def _write_top_functions(self, elapsed):
+        out = io.StringIO()
+        out.write(f"Session: {elapsed:.2f}s, {self.sampler.samples} stack samples\n\n")
+        stats = pstats.Stats(self.profiler, stream=out).strip_dirs()
+        out.write("=== By cumulative time ===\n")
+        stats.sort_stats('cumulative').print_stats(TOP_FUNCTIONS)
+        out.write("=== By own time ===\n")
+        stats.sort_stats('tottime').print_stats(TOP_FUNCTIONS)
+        with open(self.path('profile-top.txt'), 'w', encoding='utf-8') as f:
+            f.write(out.getvalue())
+
+    def _write_allocations(self, snapshot, current, peak):
+        snapshot = snapshot.filter_traces([
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+        ])
+        with open(self.path('allocations.txt'), 'w', encoding='utf-8') as f:
+            f.write(f"Traced memory at exit: {current / 1024:.0f} KiB, peak {peak / 1024:.0f} KiB\n\n")
+            f.write("=== Top allocation sites (live at exit) ===\n")
+            for stat in snapshot.statistics('lineno')[:TOP_ALLOCATIONS]:
+                f.write(f"{stat.size / 1024:10.1f} KiB {stat.count:8} blocks  {stat.traceback[0]}\n")
+            f.write("\n=== Top allocation tracebacks ===\n")
+            for stat in snapshot.statistics('traceback')[:10]:
+                f.write(f"\n{stat.size / 1024:.1f} KiB in {stat.count} blocks\n")
+                f.write('\n'.join(stat.traceback.format()) + '\n')
+
+    def _write_metrics(self):
+        from utils.metrics import snapshot as metrics_snapshot
+        with open(self.path('metrics.json'), 'w', encoding='utf-8') as f:
+            json.dump(metrics_snapshot(), f, indent=2, default=str)
+
+    def _write_replay(self):
+        with open(self.path('replay.txt'), 'w', encoding='utf-8') as f:
+            for step, seconds in self.replay_log:
+                timing = f"{seconds * 1000:10.1f} ms" if seconds is not None else " " * 13
+                f.write(f"{timing}  {step}\n")
+
+
+def _busy(app):
+    return app.io.busy or app._history_after_id is not None or app._search_after_id is not None
+
+
+def _replay_patient(app):
+    """The patient to open: the one with the most visits if the index is loaded."""
+    index = app.patient_index_model.items if app.patient_index_model.loaded else {}
+    if index:
+        return max(index, key=lambda name: (index[name] or {}).get('visits') or 0)
+    names = app.search_index.search('')
+    return names[0] if names else None
+
+
+def replay_steps(app, session, allow_writes):
+    """The scripted session: every screen, a search, a patient's history, a visit and an export."""
+    from utils.export_pdf import export_patient_history
+    from utils.io_worker import TASK_EXPORT
+
+    patient = {}
+
+    def open_patient():
+        patient['name'] = _replay_patient(app)
+        if patient['name']:
+            app.show_patient_history(patient['name'])
+
+    def add_visit():
+        if not patient.get('name'):
+            return
+        values = {"Patient Name": patient['name'], "Age": "40", "Gender": "Female", "Diagnosis": "Dental caries",
+                  "Treatment": "Composite filling", "Amount Charged": "3500", "Amount Paid": "2000"}
+        for field, entry in app.patient_entries.items():
+            entry.delete(0, 'end')
+            entry.insert(0, values.get(field, ""))
+        app.add_visit_clicked()
+
+    def export():
+        if patient.get('name'):
+            app.io.submit(export_patient_history, patient['name'], session.path('replay-export.pdf'), kind=TASK_EXPORT)
+
+    steps = [
+        ("dashboard", app.show_dashboard),
+        ("appointments", app.show_appointments),
+        ("appointments: next page", app.load_more_appointments),
+        ("patients", app.show_patients),
+    ]
+    for end in range(1, len(REPLAY_SEARCH) + 1):
+        steps.append((f"search '{REPLAY_SEARCH[:end]}'", lambda term=REPLAY_SEARCH[:end]: app.search_var.set(term)))
+    steps += [
+        ("search cleared", lambda: app.search_var.set("")),
+        ("open patient", open_patient),
+        ("older visits", app.load_more_history),
+    ]
+    if allow_writes:
+        steps.append(("add visit", add_visit))
+    steps += [
+        ("export patient PDF", export),
+        ("receivables", app.show_receivables),
+        ("export screen", app.show_export),
+        ("dashboard again", app.show_dashboard),
+    ]
+    return steps
+
+
+def start_replay(app, on_close, session, allow_writes=False):
+    """Runs replay_steps on the Tk loop, each once the previous one has settled, then closes the app.
+
+    Message boxes are answered automatically while it runs. Writes (the
+    added visit) are only made when allow_writes is set, i.e. against a
+    local storage backend.
+    """
+    from tkinter import messagebox
+
+    dialogs = {name: getattr(messagebox, name) for name in ['showinfo', 'showwarning', 'showerror', 'askyesno']}
+
+    def answer(name):
+        def dialog(title, message, **options):
+            session.replay_log.append((f"({name} answered automatically: {message})", None))
+            return False
+        return dialog
+
+    for name in dialogs:
+        setattr(messagebox, name, answer(name))
+
+    steps = list(replay_steps(app, session, allow_writes))
+
+    def finish():
+        for name, dialog in dialogs.items():
+            setattr(messagebox, name, dialog)
+        on_close()
+
+    def run_next():
+        if not steps:
+            finish()
+            return
+        label, action = steps.pop(0)
+        started = time.perf_counter()
+        try:
+            action()
+        except Exception as e:
+            session.replay_log.append((f"{label} failed: {e}", time.perf_counter() - started))
+            app.root.after(STEP_POLL_MS, run_next)
+            return
+        wait_until_settled(label, started)
+
+    def wait_until_settled(label, started):
+        elapsed = time.perf_counter() - started
+        if _busy(app) and elapsed < STEP_TIMEOUT:
+            app.root.after(STEP_POLL_MS, wait_until_settled, label, started)
+            return
+        session.replay_log.append((label if elapsed < STEP_TIMEOUT else f"{label} (timed out)", elapsed))
+        app.root.after(STEP_POLL_MS, run_next)
+
+    app.root.after(STEP_POLL_MS, run_next)
@@ -0,0 +1,66 @@
+import random
+import threading
+import time
+
+# Same alphabet and layout as Firebase push IDs: 8 characters of
+# millisecond timestamp followed by 12 random characters, so keys sort
+# chronologically and can be generated before talking to the server.
+PUSH_CHARS = '-0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZ_abcdefghijklmnopqrstuvwxyz'
+
+_lock = threading.Lock()
+_last_timestamp = None
+_last_random = [0] * 12
+
+
+def generate_push_id(timestamp_ms=None, rng=None):
+    """Generates a Firebase-style push ID locally.
+
+    IDs generated within the same millisecond still sort in creation
+    order, matching what ref.push() would have produced. With rng (a
+    random.Random) the random part comes from it instead, so seeded
+    synthetic data gets the same keys every time.
+    """
+    global _last_timestamp
+    if timestamp_ms is None:
+        timestamp_ms = int(time.time() * 1000)
+
+    if rng is not None:
+        random_part = ''.join(rng.choice(PUSH_CHARS) for _ in range(12))
+        return _timestamp_chars(timestamp_ms) + random_part
+
+    with _lock:
+        if timestamp_ms == _last_timestamp:
+            # Increment the random part so ordering is preserved
+            i = 11
+            while i >= 0 and _last_random[i] == 63:
+                _last_random[i] = 0
+                i -= 1
+            if i >= 0:
+                _last_random[i] += 1
+        else:
+            _last_timestamp = timestamp_ms
+            for i in range(12):
+                _last_random[i] = random.randrange(64)
+        random_part = ''.join(PUSH_CHARS[n] for n in _last_random)
+    return _timestamp_chars(timestamp_ms) + random_part
+
+
+def _timestamp_chars(timestamp_ms):
+    time_chars = []
+    for _ in range(8):
+        time_chars.append(PUSH_CHARS[timestamp_ms % 64])
+        timestamp_ms //= 64
+    return ''.join(reversed(time_chars))
+
+
+def push_id_timestamp(push_id):
+    """Returns the creation time (ms since epoch) encoded in a push ID, or None."""
+    if not push_id or len(push_id) != 20:
+        return None
+    timestamp_ms = 0
+    for char in push_id[:8]:
+        index = PUSH_CHARS.find(char)
+        if index < 0:
+            return None
+        timestamp_ms = timestamp_ms * 64 + index
+    return timestamp_ms
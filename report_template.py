@@ -0,0 +1,294 @@
+from xml.sax.saxutils import escape
+from reportlab.lib import colors
+from reportlab.lib.pagesizes import letter
+from reportlab.lib.styles import ParagraphStyle, getSampleStyleSheet
+from reportlab.lib.utils import simpleSplit
+from reportlab.pdfbase.pdfmetrics import stringWidth
+from reportlab.pdfgen import canvas
+from reportlab.platypus import Flowable, Frame, HRFlowable, LayoutError, Paragraph, Table, TableStyle
+
+# Kinds of summary column and how their cells are formatted
+COLUMN_TEXT = 'text'
+COLUMN_COUNT = 'count'
+COLUMN_MONEY = 'money'
+
+
+class ReportTemplate:
+    """Declares a patient report: fields, labels, currency and page style.
+
+    Nothing is built until compile(), which resolves styles, labels,
+    number formats and column widths once and returns a CompiledReport
+    that renders any number of documents with them.
+    """
+
+    def __init__(self, text_fields, money_fields, trailing_fields=(), summary_columns=(),
+                 title="Patient Record: {name}", summary_title="Patient Summary",
+                 currency="Ksh", page_size=letter, margin=50, font="Helvetica", font_size=11,
+                 summary_rows_per_table=40):
+        self.text_fields = list(text_fields)            # (field, label) rows of wrapped text
+        self.money_fields = list(money_fields)          # (field, label) in one table row
+        self.trailing_fields = list(trailing_fields)    # (field, label) rows after the amounts
+        self.summary_columns = list(summary_columns)    # (field, label, kind)
+        self.title = title
+        self.summary_title = summary_title
+        self.currency = currency
+        self.page_size = page_size
+        self.margin = margin
+        self.font = font
+        self.font_size = font_size
+        self.summary_rows_per_table = summary_rows_per_table
+
+    def compile(self):
+        return CompiledReport(self)
+
+
+class FieldLines(Flowable):
+    """A visit's fields as lines of (bold label, plain value), in two columns.
+
+    Values arrive already wrapped to the value column, so drawing is one
+    text object per column, and the block splits across pages between any
+    two lines.
+    """
+
+    def __init__(self, report, labels, values):
+        super().__init__()
+        self.report = report
+        self.labels = labels    # one per line; '' where a value continues
+        self.values = values
+
+    def wrap(self, available_width, available_height):
+        self.width = self.report.frame_width
+        self.height = len(self.values) * self.report.leading + self.report.field_spacing
+        return self.width, self.height
+
+    def split(self, available_width, available_height):
+        lines = int((available_height - self.report.field_spacing) // self.report.leading)
+        if lines < 1 or lines >= len(self.values):
+            return []
+        return [FieldLines(self.report, self.labels[:lines], self.values[:lines]),
+                FieldLines(self.report, self.labels[lines:], self.values[lines:])]
+
+    def draw(self):
+        report = self.report
+        first_baseline = self.height - report.template.font_size
+        for x, font, lines in [(0, report.bold_font, self.labels),
+                               (report.label_width, report.template.font, self.values)]:
+            text = self.canv.beginText(x, first_baseline)
+            text.setFont(font, report.template.font_size, report.leading)
+            text.textLines(lines, trim=0)
+            self.canv.drawText(text)
+
+
+class AmountsRow(Flowable):
+    """A visit's amounts on one shaded line, one column each."""
+
+    padding = 4
+
+    def __init__(self, report, cells):
+        super().__init__()
+        self.report = report
+        self.cells = cells
+
+    def wrap(self, available_width, available_height):
+        self.width = self.report.frame_width
+        self.height = self.report.template.font_size + 2 * self.padding
+        return self.width, self.height
+
+    def draw(self):
+        report = self.report
+        self.canv.setFillColor(colors.whitesmoke)
+        self.canv.rect(0, 0, self.width, self.height, stroke=0, fill=1)
+        self.canv.setFillColor(colors.black)
+        self.canv.setFont(report.template.font, report.template.font_size)
+        for x, cell in zip(report.money_offsets, self.cells):
+            self.canv.drawString(x, self.padding + 2, cell)
+
+
+class CompiledReport:
+    """A ReportTemplate with everything precomputed; safe to reuse across documents.
+
+    Visit fields are wrapped here with plain string widths and drawn as
+    FieldLines. A Paragraph per field would run reportlab's markup parser
+    for every field of every visit, which dominated the render time of
+    long histories.
+    """
+
+    def __init__(self, template):
+        self.template = template
+        page_width, page_height = template.page_size
+        self.frame_width = page_width - 2 * template.margin
+        self.frame_height = page_height - 2 * template.margin
+
+        base = getSampleStyleSheet()
+        self.title_style = ParagraphStyle('ReportTitle', parent=base['Title'], fontSize=16, leading=20,
+                                          alignment=0, spaceAfter=12)
+
+        # Labels, column widths and number formats are built here, not per visit
+        self.money_format = f"{template.currency}{{:.2f}}"
+        self.text_fields = [(field, f"{label}:") for field, label in template.text_fields]
+        self.trailing_fields = [(field, f"{label}:") for field, label in template.trailing_fields]
+        self.bold_font = f"{template.font}-Bold"
+        self.leading = template.font_size + 3
+        self.field_spacing = 2
+        labels = [label for _, label in self.text_fields + self.trailing_fields]
+        self.label_width = max((stringWidth(label, self.bold_font, template.font_size) for label in labels),
+                               default=0) + 8
+        self.value_width = self.frame_width - self.label_width
+        self.money_fields = [(field, f"{label}: {self.money_format}") for field, label in template.money_fields]
+        self.money_offsets = [i * self.frame_width / len(self.money_fields) for i in range(len(self.money_fields))]
+
+        columns = template.summary_columns
+        self.summary_header = [label for _, label, _ in columns]
+        self.summary_cells = [(field, self._cell_formatter(kind)) for field, _, kind in columns]
+        self.summary_totals = [kind != COLUMN_TEXT for _, _, kind in columns]
+        if columns:
+            name_width = self.frame_width * 0.3
+            other_width = (self.frame_width - name_width) / max(len(columns) - 1, 1)
+            self.summary_widths = [name_width] + [other_width] * (len(columns) - 1)
+        self.summary_style = TableStyle([
+            ('FONT', (0, 0), (-1, -1), template.font, template.font_size - 1),
+            ('FONT', (0, 0), (-1, 0), f"{template.font}-Bold", template.font_size - 1),
+            ('LINEBELOW', (0, 0), (-1, 0), 0.5, colors.grey),
+            ('ALIGN', (1, 0), (-1, -1), 'RIGHT'),
+            ('ROWBACKGROUNDS', (0, 1), (-1, -1), [colors.white, colors.whitesmoke]),
+        ])
+        self.separator = dict(width="100%", thickness=0.5, color=colors.grey, spaceBefore=4, spaceAfter=8)
+
+    def _cell_formatter(self, kind):
+        if kind == COLUMN_MONEY:
+            return lambda value: self.money_format.format(value or 0)
+        if kind == COLUMN_COUNT:
+            return lambda value: str(value or 0)
+        return lambda value: '' if value is None else str(value)
+
+    def _field_lines(self, fields, rec):
+        labels, values = [], []
+        for field, label in fields:
+            lines = simpleSplit(str(rec.get(field, 'N/A')), self.template.font, self.template.font_size,
+                                self.value_width) or ['']
+            labels.extend([label] + [''] * (len(lines) - 1))
+            values.extend(lines)
+        return FieldLines(self, labels, values)
+
+    def visit_flowables(self, rec):
+        """Flowables for one visit: the text fields, the amounts on one line, then the rest."""
+        if self.text_fields:
+            yield self._field_lines(self.text_fields, rec)
+        if self.money_fields:
+            yield AmountsRow(self, [template.format(rec.get(field, 0)) for field, template in self.money_fields])
+        if self.trailing_fields:
+            yield self._field_lines(self.trailing_fields, rec)
+        yield HRFlowable(**self.separator)
+
+    def patient_flowables(self, data, progress=None):
+        """Yields one patient's document a visit at a time; progress(done, total) follows each visit."""
+        records = data["records"]
+        yield Paragraph(escape(self.template.title.format(name=data['name'])), self.title_style)
+        for done, rec in enumerate(records, 1):
+            yield from self.visit_flowables(rec)
+            if progress:
+                progress(done, len(records))
+
+    def summary_flowables(self, summaries):
+        """One row per patient summary, in tables of a fixed size, then a totals row.
+
+        A single table for every patient would be re-measured each time it is
+        split across a page, so rows go out in blocks that each fit on a page.
+        """
+        yield Paragraph(escape(self.template.summary_title), self.title_style)
+        totals = [0] * len(self.summary_cells)
+        block = [self.summary_header]
+        for summary in summaries:
+            block.append([fmt(summary.get(field)) for field, fmt in self.summary_cells])
+            for i, (field, _) in enumerate(self.summary_cells):
+                if self.summary_totals[i]:
+                    totals[i] += summary.get(field) or 0
+            if len(block) > self.template.summary_rows_per_table:
+                yield self._summary_table(block)
+                block = [self.summary_header]
+        totals_row = [fmt(total) if is_total else '' for total, is_total, (_, fmt)
+                      in zip(totals, self.summary_totals, self.summary_cells)]
+        totals_row[0] = "Total"
+        block.append(totals_row)
+        yield self._summary_table(block)
+
+    def _summary_table(self, rows):
+        table = Table(rows, colWidths=self.summary_widths, repeatRows=1)
+        table.setStyle(self.summary_style)
+        return table
+
+    def table_flowables(self, sections):
+        """Titled tables for (title, header, rows) sections, styled like the summary."""
+        per_table = self.template.summary_rows_per_table
+        for title, header, rows in sections:
+            yield Paragraph(escape(title), self.title_style)
+            widths = [self.frame_width / len(header)] * len(header)
+            for start in range(0, max(len(rows), 1), per_table):
+                table = Table([header] + rows[start:start + per_table], colWidths=widths, repeatRows=1)
+                table.setStyle(self.summary_style)
+                yield table
+
+    def new_frame(self):
+        margin = self.template.margin
+        return Frame(margin, margin, self.frame_width, self.frame_height,
+                     leftPadding=0, rightPadding=0, topPadding=0, bottomPadding=0)
+
+    def flow(self, c, flowables):
+        """Lays flowables onto the canvas as they are generated, starting pages as frames fill.
+
+        Unlike SimpleDocTemplate.build(), which needs the whole story up front,
+        only the flowable being placed is held in memory, so documents with
+        thousands of visits render in flat memory. Paragraphs and tables that
+        do not fit are split across pages.
+        """
+        frame = self.new_frame()
+        page_empty = True
+        for flowable in flowables:
+            pending = [flowable]
+            while pending:
+                head = pending.pop(0)
+                if frame.add(head, c):
+                    page_empty = False
+                    continue
+                parts = frame.split(head, c)
+                if parts and frame.add(parts[0], c):
+                    pending[:0] = parts[1:]
+                elif page_empty:
+                    raise LayoutError(f"{head.__class__.__name__} is too large to fit on a page")
+                else:
+                    pending.insert(0, head)
+                c.showPage()
+                frame = self.new_frame()
+                page_empty = True
+
+    def render_patient(self, data, file_path, progress=None):
+        c = canvas.Canvas(file_path, pagesize=self.template.page_size)
+        self.flow(c, self.patient_flowables(data, progress))
+        c.save()
+        return file_path
+
+    def render_patients(self, patients, file_path):
+        """Writes several patients into one PDF, each starting on a new page.
+
+        patients may be a generator, so patients are loaded only as they are
+        rendered.
+        """
+        c = canvas.Canvas(file_path, pagesize=self.template.page_size)
+        for i, data in enumerate(patients):
+            if i:
+                c.showPage()
+            self.flow(c, self.patient_flowables(data))
+        c.save()
+        return file_path
+
+    def render_tables(self, sections, file_path):
+        c = canvas.Canvas(file_path, pagesize=self.template.page_size)
+        self.flow(c, self.table_flowables(sections))
+        c.save()
+        return file_path
+
+    def render_summary(self, summaries, file_path):
+        c = canvas.Canvas(file_path, pagesize=self.template.page_size)
+        self.flow(c, self.summary_flowables(summaries))
+        c.save()
+        return file_path
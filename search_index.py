@@ -0,0 +1,124 @@
+import heapq
+from bisect import bisect_left, insort
+
+# Substring lookups go through n-grams up to this length; longer search
+# terms intersect their trigrams and verify the survivors.
+MAX_GRAM = 3
+
+# Ranking buckets, best first
+RANK_EXACT = 0
+RANK_PREFIX = 1
+RANK_WORD_PREFIX = 2
+RANK_SUBSTRING = 3
+
+
+def _grams(text):
+    """Yields every distinct n-gram of text with 1 <= n <= MAX_GRAM."""
+    seen = set()
+    for n in range(1, MAX_GRAM + 1):
+        for i in range(len(text) - n + 1):
+            gram = text[i:i + n]
+            if gram not in seen:
+                seen.add(gram)
+                yield gram
+
+
+class PatientSearchIndex:
+    """In-memory patient name index for the search box.
+
+    Built once from the patient names and then kept up to date with add()
+    and remove(), so answering a keystroke never touches Firebase.
+    """
+
+    def __init__(self, names=()):
+        self.build(names)
+
+    def build(self, names):
+        """Replaces the index contents with the given names."""
+        self._names = set()
+        self._words = []   # sorted (word, name) pairs for prefix lookups
+        self._grams = {}   # n-gram -> set of names containing it
+        for name in names:
+            self.add(name)
+
+    def __len__(self):
+        return len(self._names)
+
+    def __contains__(self, name):
+        return name in self._names
+
+    def add(self, name):
+        """Adds a single patient name to the index."""
+        if not name or name in self._names:
+            return
+        self._names.add(name)
+        lowered = name.lower()
+        for word in set(lowered.split()):
+            insort(self._words, (word, name))
+        for gram in _grams(lowered):
+            self._grams.setdefault(gram, set()).add(name)
+
+    def remove(self, name):
+        """Removes a single patient name from the index."""
+        if name not in self._names:
+            return
+        self._names.discard(name)
+        lowered = name.lower()
+        for word in set(lowered.split()):
+            i = bisect_left(self._words, (word, name))
+            if i < len(self._words) and self._words[i] == (word, name):
+                del self._words[i]
+        for gram in _grams(lowered):
+            bucket = self._grams.get(gram)
+            if bucket is not None:
+                bucket.discard(name)
+                if not bucket:
+                    del self._grams[gram]
+
+    def _word_prefix_matches(self, term):
+        matches = set()
+        i = bisect_left(self._words, (term, ''))
+        while i < len(self._words) and self._words[i][0].startswith(term):
+            matches.add(self._words[i][1])
+            i += 1
+        return matches
+
+    def _substring_matches(self, term):
+        if len(term) <= MAX_GRAM:
+            return set(self._grams.get(term, ()))
+
+        candidates = None
+        for i in range(len(term) - MAX_GRAM + 1):
+            bucket = self._grams.get(term[i:i + MAX_GRAM])
+            if not bucket:
+                return set()
+            candidates = set(bucket) if candidates is None else candidates & bucket
+        return {name for name in candidates if term in name.lower()}
+
+    def search(self, term, limit=None):
+        """Returns patient names matching term, best matches first.
+
+        Exact matches rank above name prefixes, then word prefixes (e.g. a
+        surname), then any other substring; ties sort alphabetically.
+        """
+        term = term.strip().lower()
+        if not term:
+            results = sorted(self._names, key=str.lower)
+            return results[:limit] if limit else results
+
+        word_prefixes = self._word_prefix_matches(term)
+        ranked = []
+        for name in self._substring_matches(term):
+            lowered = name.lower()
+            if lowered == term:
+                rank = RANK_EXACT
+            elif lowered.startswith(term):
+                rank = RANK_PREFIX
+            elif name in word_prefixes:
+                rank = RANK_WORD_PREFIX
+            else:
+                rank = RANK_SUBSTRING
+            ranked.append((rank, lowered.find(term), lowered, name))
+
+        ranked = heapq.nsmallest(limit, ranked) if limit else sorted(ranked)
+        return [entry[3] for entry in ranked]
@@ -0,0 +1,73 @@
+import queue
+import threading
+import tkinter as tk
+
+# A borderless window shown while the app starts. The slow part of startup
+# (importing the data layer and connecting to Firebase) runs on a background
+# thread so the splash keeps painting; the dashboard is then built on the Tk
+# thread, which is the only one allowed to touch widgets.
+
+SPLASH_WIDTH = 360
+SPLASH_HEIGHT = 200
+# How often the Tk loop checks whether the background work has finished
+POLL_MS = 20
+
+
+class Splash:
+    def __init__(self, root):
+        self.root = root
+        self.window = tk.Toplevel(root)
+        self.window.overrideredirect(True)  # No title bar or borders
+        self.window.configure(bg='#0ea5e9')
+
+        tk.Label(self.window, text="🦷", font=('Arial', 40), bg='#0ea5e9', fg='white').pack(pady=(30, 5))
+        tk.Label(self.window, text="PearlTrack", font=('Segoe UI', 18, 'bold'),
+                 bg='#0ea5e9', fg='white').pack()
+        self.status_label = tk.Label(self.window, text="Starting...", font=('Segoe UI', 9),
+                                     bg='#0ea5e9', fg='#e0f2fe')
+        self.status_label.pack(pady=(10, 0))
+
+        x = (self.window.winfo_screenwidth() - SPLASH_WIDTH) // 2
+        y = (self.window.winfo_screenheight() - SPLASH_HEIGHT) // 2
+        self.window.geometry(f'{SPLASH_WIDTH}x{SPLASH_HEIGHT}+{x}+{y}')
+        self.window.update()  # Paint now, before the main loop starts
+
+    def set_status(self, text):
+        self.status_label.configure(text=text)
+
+    def load(self, work, on_done, on_error):
+        """Runs work(status) on a background thread, then on_done(result) or on_error(e) on the Tk thread.
+
+        status(text) may be called from work to update the splash.
+        """
+        results = queue.Queue()
+
+        def status(text):
+            results.put(('status', text))
+
+        def run():
+            try:
+                results.put(('done', work(status)))
+            except Exception as e:
+                results.put(('error', e))
+
+        def poll():
+            try:
+                while True:
+                    kind, value = results.get_nowait()
+                    if kind == 'status':
+                        self.set_status(value)
+                    elif kind == 'done':
+                        on_done(value)
+                        return
+                    else:
+                        on_error(value)
+                        return
+            except queue.Empty:
+                self.root.after(POLL_MS, poll)
+
+        threading.Thread(target=run, name="pearltrack-startup", daemon=True).start()
+        self.root.after(POLL_MS, poll)
+
+    def close(self):
+        self.window.destroy()
@@ -0,0 +1,567 @@
+import copy
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict, namedtuple
+from utils.local_cache import apply_update
+from utils.metrics import payload_size, record
+from utils.push_ids import generate_push_id
+
+# The data layer talks to `db` from this module instead of firebase_admin.db.
+# db.reference(path) is served by the configured backend:
+#
+#     firebase          the Realtime Database (default)
+#     memory            an in-process tree, empty at start
+#     json:<file>       the in-process tree, saved to a JSON file on every write
+#     sqlite:<file>     one SQLite row per second-level node
+#
+# The backend is chosen with the PEARLTRACK_STORAGE environment variable or
+# use_backend(). The local backends implement the subset of the Firebase
+# reference API this app uses: get (also shallow), set, update (multi-path,
+# with server increments), push, delete, transaction, listen and
+# order_by_child / order_by_key / order_by_value with start_at / end_at /
+# equal_to / limit_to_first / limit_to_last.
+STORAGE_ENV = "PEARLTRACK_STORAGE"
+
+Event = namedtuple('Event', ['event_type', 'path', 'data'])
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def _keys(path):
+    return tuple(key for key in (path or '').split('/') if key)
+
+
+def _normalize(value):
+    """Copies a value the way Firebase would store it: JSON types only, no nulls or empty objects."""
+    if isinstance(value, dict):
+        value = {str(key): _normalize(child) for key, child in value.items()}
+        value = {key: child for key, child in value.items() if child is not None}
+        return value or None
+    if isinstance(value, (list, tuple)):
+        return _normalize({str(i): child for i, child in enumerate(value)})
+    if value is None or isinstance(value, (str, bool, int, float)):
+        return value
+    raise TypeError(f"Value of type {type(value).__name__} cannot be stored")
+
+
+def _order_rank(value):
+    """Firebase sort order: nulls, false, true, numbers, strings, then objects."""
+    if value is None:
+        return (0, 0)
+    if isinstance(value, bool):
+        return (1, value)
+    if isinstance(value, (int, float)):
+        return (2, value)
+    if isinstance(value, str):
+        return (3, value)
+    return (4, 0)
+
+
+def _key_rank(key):
+    """Keys that look like 32-bit integers sort numerically, ahead of the rest."""
+    if key.lstrip('-').isdigit() and -2**31 <= int(key) < 2**31:
+        return (0, int(key), '')
+    return (1, 0, key)
+
+
+def _prune(tree, keys):
+    """Removes objects left empty along keys, as Firebase does; returns the tree or None."""
+    if not isinstance(tree, dict):
+        return tree
+    if keys and keys[0] in tree:
+        child = _prune(tree[keys[0]], keys[1:])
+        if child is None:
+            del tree[keys[0]]
+        else:
+            tree[keys[0]] = child
+    return tree or None
+
+
+def _child_value(value, path):
+    for key in _keys(path):
+        if not isinstance(value, dict):
+            return None
+        value = value.get(key)
+    return value
+
+
+def _apply_query(value, query):
+    if value is None:
+        return None
+    if not isinstance(value, dict):
+        value = {str(i): child for i, child in enumerate(value)} if isinstance(value, list) else {}
+
+    # rank() is what start_at / end_at / equal_to compare against; ties sort by key
+    kind, child_path = query.get('order', ('key', None))
+    if kind == 'key':
+        rank, bound = lambda item: _key_rank(item[0]), _key_rank
+    elif kind == 'value':
+        rank, bound = lambda item: _order_rank(item[1]), _order_rank
+    else:
+        rank, bound = lambda item: _order_rank(_child_value(item[1], child_path)), _order_rank
+    items = sorted(value.items(), key=lambda item: (rank(item), _key_rank(item[0])))
+
+    if 'equal_to' in query:
+        items = [item for item in items if rank(item) == bound(query['equal_to'])]
+    if 'start_at' in query:
+        items = [item for item in items if rank(item) >= bound(query['start_at'])]
+    if 'end_at' in query:
+        items = [item for item in items if rank(item) <= bound(query['end_at'])]
+    if 'limit_to_first' in query:
+        items = items[:query['limit_to_first']]
+    if 'limit_to_last' in query:
+        items = items[-query['limit_to_last']:] if query['limit_to_last'] else []
+    return OrderedDict(items)
+
+
+class ListenerRegistration:
+    def __init__(self, backend, listener):
+        self._backend = backend
+        self._listener = listener
+
+    def close(self):
+        self._backend.remove_listener(self._listener)
+
+
+class Reference:
+    """A location in a local backend, mirroring firebase_admin.db.Reference and Query."""
+
+    def __init__(self, backend, keys, query=None):
+        self._backend = backend
+        self._keys = tuple(keys)
+        self._query = query or {}
+
+    @property
+    def key(self):
+        return self._keys[-1] if self._keys else None
+
+    @property
+    def path(self):
+        return '/' + '/'.join(self._keys)
+
+    def child(self, path):
+        return Reference(self._backend, self._keys + _keys(path))
+
+    def get(self, shallow=False):
+        value = self._backend.read(self._keys)
+        if self._query:
+            value = _apply_query(value, self._query)
+        if shallow and isinstance(value, dict):
+            return {key: True for key in value}
+        return value
+
+    def set(self, value):
+        self._backend.write({self._keys: value})
+
+    def update(self, value):
+        if not value:
+            raise ValueError("Update must be a non-empty dict")
+        self._backend.write({self._keys + _keys(path): child for path, child in value.items()})
+
+    def push(self, value=''):
+        ref = self.child(generate_push_id())
+        if value != '':
+            ref.set(value)
+        return ref
+
+    def delete(self):
+        self._backend.write({self._keys: None})
+
+    def transaction(self, transaction_update):
+        return self._backend.transaction(self._keys, transaction_update)
+
+    def listen(self, callback):
+        return self._backend.listen(self._keys, callback)
+
+    def _with(self, **query):
+        return Reference(self._backend, self._keys, dict(self._query, **query))
+
+    def order_by_child(self, path):
+        return self._with(order=('child', path))
+
+    def order_by_key(self):
+        return self._with(order=('key', None))
+
+    def order_by_value(self):
+        return self._with(order=('value', None))
+
+    def start_at(self, start):
+        return self._with(start_at=start)
+
+    def end_at(self, end):
+        return self._with(end_at=end)
+
+    def equal_to(self, value):
+        return self._with(equal_to=value)
+
+    def limit_to_first(self, limit):
+        return self._with(limit_to_first=limit)
+
+    def limit_to_last(self, limit):
+        return self._with(limit_to_last=limit)
+
+
+class LocalBackend:
+    """Base for backends kept on this machine.
+
+    Subclasses store a JSON tree and provide _read(keys) and
+    _write(updates), where updates maps key tuples to normalized values
+    (None deletes). Locking, server values, transactions and listeners
+    are handled here.
+    """
+
+    name = None
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._listeners = []
+
+    def initialize(self):
+        pass  # nothing to connect to
+
+    def reference(self, path=None):
+        return Reference(self, _keys(path))
+
+    def read(self, keys):
+        with self._lock:
+            return copy.deepcopy(self._read(tuple(keys)))
+
+    def _resolve(self, updates):
+        """Evaluates server values against the current data and normalizes the rest."""
+        resolved = {}
+        for keys, value in updates.items():
+            if isinstance(value, dict) and '.sv' in value:
+                value = apply_update(self._read(keys), '', value)
+            resolved[keys] = _normalize(value)
+        return resolved
+
+    def write(self, updates):
+        with self._lock:
+            self._write(self._resolve(updates))
+        self._notify(list(updates))
+
+    def transaction(self, keys, transaction_update):
+        keys = tuple(keys)
+        with self._lock:
+            value = transaction_update(copy.deepcopy(self._read(keys)))
+            self._write({keys: _normalize(value)})
+        self._notify([keys])
+        return value
+
+    def listen(self, keys, callback):
+        listener = (tuple(keys), callback)
+        with self._lock:
+            self._listeners.append(listener)
+            data = copy.deepcopy(self._read(listener[0]))
+        self._dispatch(callback, Event('put', '/', data))
+        return ListenerRegistration(self, listener)
+
+    def remove_listener(self, listener):
+        with self._lock:
+            if listener in self._listeners:
+                self._listeners.remove(listener)
+
+    def _notify(self, written):
+        with self._lock:
+            listeners = list(self._listeners)
+        for keys, callback in listeners:
+            for path in written:
+                if path[:len(keys)] == keys:
+                    relative = path[len(keys):]
+                    self._dispatch(callback, Event('put', '/' + '/'.join(relative), self.read(path)))
+                elif keys[:len(path)] == path:
+                    self._dispatch(callback, Event('put', '/', self.read(keys)))
+
+    def _dispatch(self, callback, event):
+        try:
+            callback(event)
+        except Exception as e:
+            print(f"Error in storage listener: {e}")
+
+
+class MemoryBackend(LocalBackend):
+    """The whole tree in a dict; fast, and gone when the process exits."""
+
+    name = 'memory'
+
+    def __init__(self, data=None):
+        super().__init__()
+        self._data = _normalize(data)
+
+    def _read(self, keys):
+        value = self._data
+        for key in keys:
+            if not isinstance(value, dict):
+                return None
+            value = value.get(key)
+        return value
+
+    def _write(self, updates):
+        for keys, value in updates.items():
+            self._data = _prune(apply_update(self._data, '/'.join(keys), copy.deepcopy(value)), keys)
+
+
+class JsonFileBackend(MemoryBackend):
+    """The in-memory tree, loaded from and saved to a JSON file (an emulator for development)."""
+
+    name = 'json'
+
+    def __init__(self, file_path):
+        self.file_path = file_path
+        data = None
+        if os.path.exists(file_path):
+            with open(file_path, encoding='utf-8') as f:
+                data = json.load(f)
+        super().__init__(data)
+
+    def _write(self, updates):
+        super()._write(updates)
+        tmp_path = f"{self.file_path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self._data, f)
+        os.replace(tmp_path, self.file_path)
+
+
+class SqliteBackend(LocalBackend):
+    """The tree in SQLite, one row per second-level node (e.g. one patient or appointment).
+
+    Reading or writing one patient touches one row; reading a whole
+    collection reads its rows.
+    """
+
+    name = 'sqlite'
+
+    _SCHEMA = """
+    CREATE TABLE IF NOT EXISTS nodes (
+        collection TEXT NOT NULL,
+        key TEXT NOT NULL,
+        data TEXT NOT NULL,
+        PRIMARY KEY (collection, key)
+    );
+    """
+
+    def __init__(self, file_path):
+        super().__init__()
+        self.file_path = file_path
+        directory = os.path.dirname(file_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(file_path, check_same_thread=False)
+        self._conn.executescript(self._SCHEMA)
+
+    def _rows(self, collection=None):
+        if collection is None:
+            return self._conn.execute("SELECT collection, key, data FROM nodes").fetchall()
+        return self._conn.execute("SELECT collection, key, data FROM nodes WHERE collection = ?",
+                                  (collection,)).fetchall()
+
+    def _tree(self, rows):
+        tree = {}
+        for collection, key, data in rows:
+            value = json.loads(data)
+            if key:
+                tree.setdefault(collection, {})[key] = value
+            else:
+                tree[collection] = value  # a collection that is a plain value
+        return tree
+
+    def _read(self, keys):
+        if not keys:
+            return self._tree(self._rows()) or None
+        if len(keys) == 1:
+            return self._tree(self._rows(keys[0])).get(keys[0])
+        row = self._conn.execute("SELECT data FROM nodes WHERE collection = ? AND key = ?",
+                                 keys[:2]).fetchone()
+        value = json.loads(row[0]) if row else None
+        for key in keys[2:]:
+            if not isinstance(value, dict):
+                return None
+            value = value.get(key)
+        return value
+
+    def _put(self, collection, key, value):
+        if value is None:
+            self._conn.execute("DELETE FROM nodes WHERE collection = ? AND key = ?", (collection, key))
+        else:
+            self._conn.execute("INSERT OR REPLACE INTO nodes (collection, key, data) VALUES (?, ?, ?)",
+                               (collection, key, json.dumps(value)))
+
+    def _replace_collection(self, collection, value):
+        self._conn.execute("DELETE FROM nodes WHERE collection = ?", (collection,))
+        if isinstance(value, dict):
+            for key, child in value.items():
+                self._put(collection, key, child)
+        elif value is not None:
+            self._put(collection, '', value)
+
+    def _write(self, updates):
+        with self._conn:
+            for keys, value in updates.items():
+                if not keys:
+                    self._conn.execute("DELETE FROM nodes")
+                    for collection, child in (value or {}).items():
+                        self._replace_collection(collection, child)
+                elif len(keys) == 1:
+                    self._replace_collection(keys[0], value)
+                else:
+                    node = value
+                    if len(keys) > 2:
+                        node = _prune(apply_update(self._read(keys[:2]), '/'.join(keys[2:]), value), keys[2:])
+                    # A plain value stored at the collection itself is replaced by children
+                    self._conn.execute("DELETE FROM nodes WHERE collection = ? AND key = ''", (keys[0],))
+                    self._put(keys[0], keys[1], node)
+
+
+class FirebaseBackend:
+    """The Firebase Realtime Database, through firebase_admin.
+
+    The SDK is imported and the app initialized on first use (or by an
+    early initialize() on a background thread), exactly once per process.
+    """
+
+    name = 'firebase'
+
+    def __init__(self):
+        self._initialized = False
+        self._init_lock = threading.Lock()
+
+    def initialize(self):
+        if self._initialized:
+            return
+        with self._init_lock:
+            if not self._initialized:
+                from firebase_realtime import initialize_firebase
+                initialize_firebase()
+                self._initialized = True
+
+    def reference(self, path=None):
+        self.initialize()
+        from firebase_admin import db as firebase_db
+        return firebase_db.reference(path or '/')
+
+
+def backend_from_spec(spec):
+    """Creates a backend from a PEARLTRACK_STORAGE value such as 'sqlite:data/pearltrack.db'."""
+    kind, _, target = (spec or 'firebase').partition(':')
+    if kind == 'firebase':
+        return FirebaseBackend()
+    if kind == 'memory':
+        return MemoryBackend()
+    if kind == 'json':
+        return JsonFileBackend(target or 'pearltrack.json')
+    if kind == 'sqlite':
+        return SqliteBackend(target or 'pearltrack.db')
+    raise ValueError(f"Unknown storage backend: {spec}")
+
+
+def get_backend():
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                _backend = backend_from_spec(os.environ.get(STORAGE_ENV))
+    return _backend
+
+
+def use_backend(backend):
+    """Switches every module to another backend (a backend object or a spec string)."""
+    global _backend
+    if isinstance(backend, str):
+        backend = backend_from_spec(backend)
+    with _backend_lock:
+        _backend = backend
+    return backend
+
+
+class MeteredReference:
+    """Wraps a backend reference or query so every call is timed and its payload counted.
+
+    Calls are recorded as 'db.<method> <collection>' with the next path
+    segment (usually the patient name or ID) as the detail.
+    """
+
+    _QUERY_METHODS = {'order_by_child', 'order_by_key', 'order_by_value', 'start_at', 'end_at',
+                      'equal_to', 'limit_to_first', 'limit_to_last'}
+
+    def __init__(self, ref, keys):
+        self._ref = ref
+        self._keys = tuple(keys)
+
+    @property
+    def key(self):
+        return self._ref.key
+
+    @property
+    def path(self):
+        return self._ref.path
+
+    def _call(self, method, sent, *args, **kwargs):
+        operation = f"db.{method} {self._keys[0] if self._keys else '/'}"
+        detail = self._keys[1] if len(self._keys) > 1 else None
+        started = time.perf_counter()
+        try:
+            result = getattr(self._ref, method)(*args, **kwargs)
+        except Exception as e:
+            record(operation, (time.perf_counter() - started) * 1000, detail=detail, error=e)
+            raise
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        size = payload_size(sent) if sent is not None else payload_size(result) if method == 'get' else None
+        record(operation, elapsed_ms, size, detail)
+        return result
+
+    def child(self, path):
+        return MeteredReference(self._ref.child(path), self._keys + _keys(path))
+
+    def get(self, *args, **kwargs):
+        return self._call('get', None, *args, **kwargs)
+
+    def set(self, value):
+        return self._call('set', value, value)
+
+    def update(self, value):
+        return self._call('update', value, value)
+
+    def push(self, value=''):
+        ref = self._call('push', value or None, value)
+        return MeteredReference(ref, self._keys + (ref.key,))
+
+    def delete(self):
+        return self._call('delete', None)
+
+    def transaction(self, transaction_update):
+        return self._call('transaction', None, transaction_update)
+
+    def listen(self, callback):
+        return self._call('listen', None, callback)
+
+    def __getattr__(self, name):
+        if name in self._QUERY_METHODS:
+            method = getattr(self._ref, name)
+            return lambda *args, **kwargs: MeteredReference(method(*args, **kwargs), self._keys)
+        return getattr(self._ref, name)
+
+
+def increment(amount):
+    """Server-side increment, applied atomically by Firebase and by the local backends."""
+    return {'.sv': {'increment': amount}}
+
+
+def initialize_storage():
+    """Connects the configured backend (initializes Firebase); safe to call any number of times."""
+    backend = get_backend()
+    backend.initialize()
+    return backend
+
+
+class _Database:
+    """Stands in for firebase_admin.db: reference() goes to the configured backend."""
+
+    def reference(self, path=None):
+        return MeteredReference(get_backend().reference(path), _keys(path))
+
+
+db = _Database()
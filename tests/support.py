@@ -0,0 +1,34 @@
+import os
+import sys
+import tempfile
+import unittest
+from unittest import mock
+
+# Run from the directory that contains utils/:
+#     python -m unittest discover -s utils/tests
+# Data goes to the in-memory storage backend and a throwaway cache.
+os.environ.setdefault("PEARLTRACK_STORAGE", "memory")
+os.environ.setdefault("PEARLTRACK_CACHE_DB", os.path.join(tempfile.mkdtemp(prefix='pearltrack-test-'), 'cache.db'))
+
+# main.py runs from the package directory, so the app's own modules
+# (dashboard, splash) are imported top-level and the data layer as utils.*
+PACKAGE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if PACKAGE_DIR not in sys.path:
+    sys.path.insert(1, PACKAGE_DIR)
+
+from utils import local_cache, patients
+from utils.storage import MemoryBackend, use_backend
+
+
+class StorageTestCase(unittest.TestCase):
+    """Each test gets an empty in-memory database and an empty local cache."""
+
+    def setUp(self):
+        self.backend = use_backend(MemoryBackend())
+        cache_db = os.path.join(tempfile.mkdtemp(prefix='pearltrack-test-'), 'cache.db')
+        for patcher in (mock.patch.object(local_cache, 'CACHE_DB', cache_db),
+                        mock.patch.object(local_cache, '_schema_ready', False),
+                        mock.patch.dict(local_cache._status),
+                        mock.patch.dict(patients._loaded_patients, clear=True)):
+            patcher.start()
+            self.addCleanup(patcher.stop)
@@ -0,0 +1,149 @@
+import unittest
+from datetime import date, timedelta
+from unittest import mock
+
+from support import StorageTestCase
+
+from utils import appointments
+from utils.appointment_window import AppointmentWindow
+from utils.appointments import (
+    add_appointment,
+    count_appointments,
+    count_appointments_by_date,
+    delete_appointment,
+    get_appointments,
+    get_cached_appointment_page,
+    get_earlier_appointments,
+)
+from utils.storage import db
+
+PAGE_SIZE = 4
+
+
+def day(offset):
+    return (date.today() + timedelta(days=offset)).isoformat()
+
+
+class AppointmentPagingTest(StorageTestCase):
+    """Pages through the schedule the way the Appointments screen does."""
+
+    def setUp(self):
+        super().setUp()
+        # Three appointments a day, a week either side of today; pages of
+        # four split most days, so the cursors' tie-breaking is exercised
+        self.ids = {}
+        for offset in range(-7, 8):
+            for hour in ('09:00', '11:00', '14:00'):
+                appt_id = add_appointment(f"Patient {offset} {hour}", '0712345678', 'Check-up', day(offset), hour)
+                self.ids[appt_id] = day(offset)
+
+    def expected(self, first_day=None):
+        return [appt_id for date_, appt_id in sorted((date_, appt_id) for appt_id, date_ in self.ids.items())
+                if first_day is None or date_ >= first_day]
+
+    def page_forward(self, window):
+        pages = 0
+        while not window.exhausted:
+            window.add_page(*get_appointments(limit=PAGE_SIZE, cursor=window.next_cursor))
+            pages += 1
+        return pages
+
+    def page_back(self, window):
+        pages = 0
+        while not window.earlier_exhausted:
+            window.add_earlier_page(*get_earlier_appointments(window.start_date, limit=PAGE_SIZE,
+                                                              cursor=window.earlier_cursor))
+            pages += 1
+        return pages
+
+    def test_pages_forward_from_today(self):
+        window = AppointmentWindow(day(0))
+        first_rows, _ = get_appointments(limit=PAGE_SIZE)
+        self.assertEqual([row[4] for row in first_rows], [day(0)] * 3 + [day(1)])
+
+        self.assertEqual(self.page_forward(window), 6)
+        self.assertEqual([row[0] for row in window.rows()], self.expected(day(0)))
+
+    def test_earlier_pages_reach_the_oldest_appointment(self):
+        window = AppointmentWindow(day(0))
+        self.page_forward(window)
+        self.assertFalse(window.covers(day(-1)))
+
+        self.assertEqual(self.page_back(window), 6)
+        self.assertTrue(window.earlier_exhausted)
+        self.assertTrue(window.covers(day(-7)))
+        self.assertEqual([row[0] for row in window.rows()], self.expected())
+
+    def test_each_earlier_page_comes_just_before_the_window(self):
+        window = AppointmentWindow(day(0))
+        window.add_page(*get_appointments(limit=PAGE_SIZE))
+        rows, earlier_cursor = get_earlier_appointments(day(0), limit=PAGE_SIZE)
+        window.add_earlier_page(rows, earlier_cursor)
+
+        self.assertEqual([row[4] for row in rows], [day(-2)] + [day(-1)] * 3)
+        self.assertEqual(window.start_date, day(-2))
+        # The rest of day -2 is still to come, and is not shown as loaded
+        self.assertEqual([row[0] for row in window.rows()][:5], self.expected(day(-2))[2:7])
+
+    def test_row_at_maps_a_listbox_index_to_its_appointment(self):
+        window = AppointmentWindow(day(0))
+        self.page_forward(window)
+        window.remove(window.row_at(1)[0])
+        window.add_earlier_page(*get_earlier_appointments(day(0), limit=PAGE_SIZE))
+
+        self.assertEqual([window.row_at(i) for i in range(len(window))], window.rows())
+
+    def test_live_changes_outside_the_window_are_ignored(self):
+        window = AppointmentWindow(day(0))
+        window.add_page(*get_appointments(limit=PAGE_SIZE))
+
+        window.put(('past', "Past", '', '', day(-1), '09:00'))
+        window.put(('later', "Later", '', '', day(5), '09:00'))
+        window.put(('today', "Today", '', '', day(0), '08:00'))
+        ids = [row[0] for row in window.rows()]
+        self.assertNotIn('past', ids)
+        self.assertNotIn('later', ids)
+        self.assertIn('today', ids)
+
+    def test_the_cached_first_page_matches_the_live_one(self):
+        rows, _ = get_appointments(limit=PAGE_SIZE)
+        self.assertEqual(get_cached_appointment_page(day(0), PAGE_SIZE), rows)
+        self.assertEqual([row[0] for row in get_cached_appointment_page(day(7), PAGE_SIZE)], self.expected(day(7)))
+
+    def test_pages_come_from_the_cache_when_offline(self):
+        window = AppointmentWindow(day(0))
+        self.page_forward(window)
+        online_rows = window.rows()
+
+        with mock.patch.object(appointments.db, 'reference', side_effect=OSError("offline")):
+            window.reset(day(0))
+            self.page_forward(window)
+        self.assertEqual(window.rows(), online_rows)
+
+
+class AppointmentCounterTest(StorageTestCase):
+    def test_deletes_count_down_once(self):
+        first = add_appointment("Ann", '0712345678', 'Check-up', day(1), '09:00')
+        add_appointment("Bob", '0712345678', 'Check-up', day(1), '10:00')
+
+        delete_appointment(first)
+        delete_appointment(first)  # already gone
+        self.assertEqual(count_appointments(), 1)
+        self.assertEqual(count_appointments_by_date(), {day(1): 1})
+
+    def test_an_undated_appointment_counts_down_the_total(self):
+        add_appointment("Ann", '0712345678', 'Check-up', day(1), '09:00')
+        db.reference().update({
+            'appointments/legacy': {'patient_name': "Old", 'contact': '', 'reason': '', 'time': '09:00'},
+            'appointment_stats/total': {'.sv': {'increment': 1}},
+        })
+        self.assertEqual(count_appointments(), 2)
+
+        delete_appointment('legacy')
+        self.assertIsNone(db.reference('appointments/legacy').get())
+        self.assertEqual(count_appointments(), 1)
+        self.assertEqual(count_appointments_by_date(), {day(1): 1})
+
+
+if __name__ == "__main__":
+    unittest.main()
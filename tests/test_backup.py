@@ -0,0 +1,117 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from support import StorageTestCase
+
+from utils import backup
+from utils.appointments import add_appointment
+from utils.patients import add_patient_visit
+from utils.storage import MemoryBackend, db, use_backend
+
+# Everything import_snapshot writes or rebuilds
+RESTORED_PATHS = ['patients', 'patient_index', 'appointments', 'appointments_by_date', 'appointment_stats',
+                  'billing_totals', 'billing_daily']
+
+
+class Interrupted(Exception):
+    pass
+
+
+def interrupt_after(count):
+    """A progress callback that stops an export or import after count steps."""
+    steps = []
+
+    def progress(message):
+        steps.append(message)
+        if len(steps) == count:
+            raise Interrupted(message)
+    return progress
+
+
+def quiet(message):
+    pass
+
+
+class BackupRoundTripTest(StorageTestCase):
+    def setUp(self):
+        super().setUp()
+        for i in range(7):
+            for charged in range(1000, 1000 + 500 * (i % 3 + 1), 500):
+                add_patient_visit(f"Patient {i}", '34', 'Female', '0712345678', 'Kin', 'Toothache', '3 days',
+                                  'Regular', 'Nil', 'Dental caries', 'Composite filling', 'Review',
+                                  charged, 'Ibuprofen 400mg', charged - 200, 0)
+        for i in range(5):
+            add_appointment(f"Patient {i}", '0712345678', 'Check-up', f'2024-03-0{i % 3 + 1}', '09:00')
+        self.original = {path: db.reference(path).get() for path in RESTORED_PATHS}
+        self.path = os.path.join(tempfile.mkdtemp(prefix='pearltrack-test-'), 'backup.ptsnap.gz')
+
+    def restore(self, **options):
+        use_backend(MemoryBackend())
+        return backup.import_snapshot(self.path, batch_size=3, progress=quiet, **options)
+
+    def assert_restored(self):
+        for path in RESTORED_PATHS:
+            self.assertEqual(db.reference(path).get(), self.original[path], path)
+
+    def test_export_then_import_restores_the_database(self):
+        counts = backup.export_snapshot(self.path, page_size=2, progress=quiet)
+        self.assertEqual(counts, {'patients': 7, 'visits': 13, 'appointments': 5})
+
+        self.restore()
+        self.assert_restored()
+        self.assertFalse(os.path.exists(f"{self.path}.progress"))
+
+    def test_an_interrupted_export_resumes(self):
+        with self.assertRaises(Interrupted):
+            backup.export_snapshot(self.path, page_size=2, progress=interrupt_after(2))
+        self.assertTrue(os.path.exists(f"{self.path}.progress"))
+
+        counts = backup.export_snapshot(self.path, page_size=2, resume=True, progress=quiet)
+        self.assertEqual(counts, {'patients': 7, 'visits': 13, 'appointments': 5})
+        self.restore()
+        self.assert_restored()
+
+    def test_an_interrupted_import_resumes(self):
+        backup.export_snapshot(self.path, page_size=2, progress=quiet)
+        use_backend(MemoryBackend())
+        with self.assertRaises(Interrupted):
+            backup.import_snapshot(self.path, batch_size=3, progress=interrupt_after(3))
+
+        # The three batches already written are skipped
+        with mock.patch.object(backup, '_update_in_batches', wraps=backup._update_in_batches) as update:
+            self.assertEqual(backup.import_snapshot(self.path, batch_size=3, resume=True, progress=quiet), 11)
+        self.assertEqual(update.call_count, 8)
+        self.assert_restored()
+
+    def test_a_snapshot_cut_short_reads_up_to_the_last_whole_batch(self):
+        backup.export_snapshot(self.path, page_size=2, progress=quiet)
+        whole = list(backup.read_snapshot(self.path))
+        with open(self.path, 'rb') as f:
+            data = f.read()
+        with open(self.path, 'wb') as f:
+            f.write(data[:len(data) * 2 // 3])
+
+        lines = []
+        with self.assertRaises(EOFError):
+            for line in backup.read_snapshot(self.path):
+                lines.append(line)
+        self.assertTrue(lines)
+        self.assertEqual(lines, whole[:len(lines)])
+
+    def test_columns_round_trip_leaving_out_empty_cells(self):
+        rows = [{'name': "Ann", 'age': '34'}, {'name': "Bob", 'contact': '0712'}]
+        columns = backup.to_columns(rows)
+        self.assertEqual(columns, {'age': ['34', None], 'contact': [None, '0712'], 'name': ["Ann", "Bob"]})
+        self.assertEqual(backup.from_columns(columns), rows)
+
+    def test_rejects_files_that_are_not_snapshots(self):
+        with open(self.path, 'wb') as f:
+            backup._write_line(f, {'format': 'something-else'})
+        with self.assertRaises(ValueError):
+            list(backup.read_snapshot(self.path))
+
+
+if __name__ == "__main__":
+    unittest.main()
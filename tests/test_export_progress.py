@@ -0,0 +1,73 @@
+import os
+import tempfile
+import time
+import types
+import unittest
+from unittest import mock
+
+from support import StorageTestCase
+
+import dashboard
+from utils import export_pdf
+from utils.io_worker import IOWorker
+from utils.patients import add_patient_visit
+
+
+class FakeRoot:
+    """Stands in for the Tk root: after() callbacks run when the test drains them."""
+
+    def __init__(self):
+        self.pending = []
+
+    def after(self, ms, callback, *args):
+        self.pending.append((callback, args))
+        return len(self.pending)
+
+    def after_cancel(self, after_id):
+        pass
+
+    def drain(self):
+        pending, self.pending = self.pending, []
+        for callback, args in pending:
+            callback(*args)
+
+
+class FakeLabel:
+    def __init__(self):
+        self.texts = []
+
+    def config(self, **options):
+        self.texts.append(options.get('text'))
+
+
+class SinglePatientExportTest(StorageTestCase):
+    def test_export_reports_progress_and_finishes(self):
+        name = "Progress Patient"
+        for charged in (1000, 2500, 3500):
+            add_patient_visit(name, '34', 'Female', '0712345678', 'Kin', 'Toothache', '3 days', 'Regular',
+                              'Nil', 'Dental caries', 'Composite filling', 'Review in 2 weeks',
+                              charged, 'Ibuprofen 400mg', charged, 0)
+
+        root = FakeRoot()
+        app = types.SimpleNamespace(root=root, io=IOWorker(root), loading_label=FakeLabel())
+        file_path = os.path.join(tempfile.mkdtemp(prefix='pearltrack-test-'), 'export.pdf')
+
+        with mock.patch.object(export_pdf, 'choose_export_path', return_value=file_path), \
+                mock.patch.object(dashboard.messagebox, 'showinfo') as showinfo, \
+                mock.patch.object(dashboard.messagebox, 'showerror') as showerror:
+            dashboard.ModernPearlTrack.export_single_patient(app, name)
+            deadline = time.time() + 30
+            while not (showinfo.called or showerror.called) and time.time() < deadline:
+                root.drain()
+                time.sleep(0.01)
+        app.io.shutdown()
+
+        showerror.assert_not_called()
+        showinfo.assert_called_once()
+        self.assertTrue(os.path.getsize(file_path) > 0)
+        # The last visit always reaches the header
+        self.assertIn(f"📄 Exporting {name}: 3 of 3 visits", app.loading_label.texts)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,65 @@
+import random
+import unittest
+
+from utils.listbox_sync import sync_listbox
+
+
+class FakeListbox:
+    """Stands in for a Tk listbox and records every insert and delete."""
+
+    def __init__(self, rows=()):
+        self.rows = list(rows)
+        self.calls = []
+
+    def _index(self, index):
+        return len(self.rows) if index == 'end' else index
+
+    def insert(self, index, *rows):
+        self.calls.append(('insert', index, rows))
+        i = self._index(index)
+        self.rows[i:i] = rows
+
+    def delete(self, first, last=None):
+        self.calls.append(('delete', first, last))
+        first = self._index(first)
+        last = first if last is None else min(self._index(last), len(self.rows) - 1)
+        del self.rows[first:last + 1]
+
+
+class SyncListboxTest(unittest.TestCase):
+    def sync(self, old_rows, new_rows):
+        listbox = FakeListbox(old_rows)
+        result = sync_listbox(listbox, old_rows, new_rows)
+        self.assertEqual(listbox.rows, list(new_rows))
+        self.assertEqual(result, list(new_rows))
+        return listbox.calls
+
+    def test_fills_an_empty_listbox_in_one_insert(self):
+        self.assertEqual(self.sync([], ['a', 'b']), [('insert', 'end', ('a', 'b'))])
+
+    def test_clears_in_one_delete(self):
+        self.assertEqual(self.sync(['a', 'b'], []), [('delete', 0, 'end')])
+
+    def test_unchanged_rows_are_left_alone(self):
+        self.assertEqual(self.sync(['a', 'b', 'c'], ['a', 'b', 'c']), [])
+
+    def test_only_the_changed_row_is_replaced(self):
+        self.assertEqual(self.sync(['a', 'b', 'c', 'd'], ['a', 'B', 'c', 'd']),
+                         [('delete', 1, 1), ('insert', 1, ('B',))])
+
+    def test_insert_and_delete_in_the_middle(self):
+        self.assertEqual(self.sync(['a', 'b', 'c'], ['a', 'x', 'b', 'c']), [('insert', 1, ('x',))])
+        self.assertEqual(self.sync(['a', 'b', 'c', 'd'], ['a', 'd']), [('delete', 1, 2)])
+
+    def test_several_changes_are_applied_from_the_bottom_up(self):
+        rng = random.Random(7)
+        for _ in range(200):
+            old_rows = [f"row {rng.randrange(30)}" for _ in range(rng.randrange(1, 15))]
+            new_rows = [row for row in old_rows if rng.random() > 0.3]
+            for _ in range(rng.randrange(4)):
+                new_rows.insert(rng.randrange(len(new_rows) + 1), f"new {rng.randrange(30)}")
+            self.sync(old_rows, new_rows)
+
+
+if __name__ == "__main__":
+    unittest.main()
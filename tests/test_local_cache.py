@@ -0,0 +1,157 @@
+import unittest
+from unittest import mock
+
+from support import StorageTestCase
+
+from utils import local_cache
+from utils.appointments import add_appointment, count_appointments, delete_appointment
+from utils.local_cache import (
+    MAX_SYNC_ATTEMPTS,
+    describe_outbox_entry,
+    get_cached_appointment_stat,
+    get_cached_patient,
+    get_cached_patient_index,
+    get_held_back_writes,
+    get_outbox,
+    sync_status,
+)
+from utils.patients import add_patient_visit, delete_patient
+from utils.storage import db
+
+ANN = "Ann Wambui"
+BOB = "Bob Otieno"
+
+
+def add_visit(name, charged=1000):
+    add_patient_visit(name, '34', 'Female', '0712345678', 'Kin', 'Toothache', '3 days', 'Regular',
+                      'Nil', 'Dental caries', 'Composite filling', 'Review in 2 weeks',
+                      charged, 'Ibuprofen 400mg', charged, 0)
+
+
+class OutboxTest(StorageTestCase):
+    def setUp(self):
+        super().setUp()
+        add_visit(ANN)
+        add_visit(BOB)
+
+    def queue(self, write, *args):
+        """Queues a write without syncing it, as if the sync thread had not got to it yet."""
+        with mock.patch.object(local_cache, 'sync_outbox'):
+            write(*args)
+
+    def add_visit_elsewhere(self, name):
+        """Another workstation adds a visit to name."""
+        visits = db.reference(f'patient_index/{name}/visits').get()
+        db.reference().update({
+            f'patients/{name}/records/-elsewhere': {'amount_charged': 500, 'amount_paid': 500, 'balance': 0},
+            f'patient_index/{name}/visits': visits + 1,
+        })
+
+    def test_a_conflict_only_holds_back_writes_to_the_same_patient(self):
+        local_cache._status['last_error'] = "an earlier failure"
+        self.queue(delete_patient, ANN)
+        self.queue(add_visit, BOB, 2000)
+        self.add_visit_elsewhere(ANN)
+
+        self.assertEqual(local_cache.sync_outbox(), 1)
+
+        # Bob's visit went through, although both entries change the billing totals
+        self.assertEqual(db.reference(f'patient_index/{BOB}/visits').get(), 2)
+        self.assertEqual(db.reference('billing_totals/charged').get(), 1000 + 1000 + 2000)
+        # Ann's delete is parked and the server still has her
+        self.assertIsNotNone(db.reference(f'patients/{ANN}').get())
+        status = sync_status()
+        self.assertEqual((status['pending'], status['conflicts'], status['failed']), (0, 1, 0))
+        self.assertIsNone(status['last_error'])
+        # The cache shows her again, with the other workstation's visit
+        self.assertEqual(get_cached_patient_index()[ANN]['visits'], 2)
+        self.assertIn('-elsewhere', get_cached_patient(ANN)['records'])
+        self.assertEqual([describe_outbox_entry(entry) for entry in get_held_back_writes()],
+                         [f"Delete patients/{ANN}"])
+
+    def test_deleting_a_patient_already_deleted_elsewhere_counts_as_applied(self):
+        self.queue(delete_patient, ANN)
+        charged = db.reference('billing_totals/charged').get()
+        # Another workstation deletes her first and takes her out of the totals
+        db.reference().update({f'patients/{ANN}': None, f'patient_index/{ANN}': None,
+                               'billing_totals/charged': charged - 1000})
+
+        self.assertEqual(local_cache.sync_outbox(), 1)
+        self.assertEqual(db.reference('billing_totals/charged').get(), charged - 1000)
+        self.assertEqual((sync_status()['pending'], sync_status()['conflicts']), (0, 0))
+        # Later writes for her are not held back
+        add_visit(ANN)
+        self.assertEqual(db.reference(f'patient_index/{ANN}/visits').get(), 1)
+
+    def test_later_writes_to_a_parked_patient_wait_for_it(self):
+        self.queue(delete_patient, ANN)
+        self.queue(add_visit, ANN, 3000)
+        self.add_visit_elsewhere(ANN)
+
+        self.assertEqual(local_cache.sync_outbox(), 0)
+        self.assertEqual([entry['status'] for entry in get_outbox()], ['conflict', 'pending'])
+
+        local_cache.discard_outbox_entry(get_outbox('conflict')[0]['id'])
+        self.assertEqual(local_cache.sync_outbox(), 1)
+        self.assertEqual(db.reference(f'patient_index/{ANN}/visits').get(), 3)
+
+    def test_retrying_a_conflict_applies_it_without_the_check(self):
+        self.queue(delete_patient, ANN)
+        self.add_visit_elsewhere(ANN)
+        local_cache.sync_outbox()
+        self.assertIn(ANN, get_cached_patient_index())
+
+        local_cache.retry_outbox_entry(get_outbox('conflict')[0]['id'])
+        self.assertNotIn(ANN, get_cached_patient_index())
+        self.assertEqual(local_cache.sync_outbox(), 1)
+        self.assertIsNone(db.reference(f'patients/{ANN}').get())
+        self.assertEqual(sync_status()['conflicts'], 0)
+
+    def test_deleting_an_appointment_already_deleted_elsewhere_counts_as_applied(self):
+        appt_id = add_appointment(ANN, '0712345678', 'Check-up', '2024-03-02', '09:00')
+        self.queue(delete_appointment, appt_id, '2024-03-02')
+        # Another workstation deletes it first and counts it down
+        db.reference().update({f'appointments/{appt_id}': None, f'appointments_by_date/2024-03-02/{appt_id}': None,
+                               'appointment_stats/total': 0, 'appointment_stats/by_date/2024-03-02': 0})
+
+        self.assertEqual(local_cache.sync_outbox(), 1)
+        self.assertEqual(count_appointments(), 0)
+        self.assertEqual(get_cached_appointment_stat('total'), 0)
+        self.assertEqual(sync_status()['conflicts'], 0)
+
+        later = add_appointment(BOB, '0712345678', 'Check-up', '2024-03-02', '10:00')
+        self.assertIsNotNone(db.reference(f'appointments/{later}').get())
+        self.assertEqual(sync_status()['pending'], 0)
+
+    def test_a_conflict_on_one_appointment_does_not_hold_back_its_day(self):
+        appt_id = add_appointment(ANN, '0712345678', 'Check-up', '2024-03-02', '09:00')
+        self.queue(delete_appointment, appt_id, '2024-03-02')
+        # Another workstation moves it to another day
+        db.reference(f'appointments/{appt_id}/date').set('2024-03-09')
+
+        later = add_appointment(BOB, '0712345678', 'Check-up', '2024-03-02', '10:00')
+        self.assertIsNotNone(db.reference(f'appointments_by_date/2024-03-02/{later}').get())
+        status = sync_status()
+        self.assertEqual((status['pending'], status['conflicts']), (0, 1))
+
+    def test_a_write_failing_every_attempt_is_parked(self):
+        with mock.patch.object(self.backend, 'write', side_effect=ValueError("rejected")):
+            add_visit("Carol Njeri")
+            self.assertEqual(sync_status()['pending'], 1)
+            self.assertEqual(sync_status()['last_error'], "rejected")
+            self.assertIsNotNone(get_cached_patient("Carol Njeri"))
+            for _ in range(MAX_SYNC_ATTEMPTS - 1):
+                local_cache.sync_outbox()
+
+        self.assertEqual(sync_status()['failed'], 1)
+        # The server never had Carol, so neither does the cache any more
+        self.assertIsNone(get_cached_patient("Carol Njeri"))
+        self.assertNotIn("Carol Njeri", get_cached_patient_index())
+        # Other patients keep syncing
+        add_visit(BOB)
+        self.assertEqual(db.reference(f'patient_index/{BOB}/visits').get(), 2)
+        self.assertEqual(sync_status()['pending'], 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,49 @@
+import unittest
+
+from utils.search_index import PatientSearchIndex
+
+NAMES = ["Hannah Kamau", "Joanne Ann", "Annabel Otieno", "Ann Wambui", "Ann", "Brian Mwangi"]
+
+
+class PatientSearchIndexTest(unittest.TestCase):
+    def setUp(self):
+        self.index = PatientSearchIndex(NAMES)
+
+    def test_ranks_exact_then_prefix_then_word_prefix_then_substring(self):
+        self.assertEqual(self.index.search("ann"),
+                         ["Ann", "Ann Wambui", "Annabel Otieno", "Joanne Ann", "Hannah Kamau"])
+
+    def test_search_ignores_case_and_surrounding_spaces(self):
+        self.assertEqual(self.index.search("  ANN wAM "), ["Ann Wambui"])
+
+    def test_terms_longer_than_a_gram_are_verified(self):
+        # Candidates come from the term's trigrams, then the whole term is checked
+        self.assertEqual(self.index.search("wambui"), ["Ann Wambui"])
+        self.assertEqual(self.index.search("mwangi"), ["Brian Mwangi"])
+        self.assertEqual(self.index.search("annx"), [])
+
+    def test_limit_keeps_the_best_matches(self):
+        self.assertEqual(self.index.search("ann", limit=2), ["Ann", "Ann Wambui"])
+
+    def test_empty_term_lists_every_name_alphabetically(self):
+        self.assertEqual(self.index.search(""), sorted(NAMES, key=str.lower))
+        self.assertEqual(self.index.search(" ", limit=1), ["Ann"])
+
+    def test_add_and_remove_keep_the_index_current(self):
+        self.index.remove("Ann Wambui")
+        self.index.add("Wambui Njeri")
+        self.index.add("Wambui Njeri")
+
+        self.assertNotIn("Ann Wambui", self.index)
+        self.assertEqual(len(self.index), len(NAMES))
+        self.assertEqual(self.index.search("wambui"), ["Wambui Njeri"])
+        self.assertEqual(self.index.search("ann w"), [])
+
+    def test_removing_the_last_name_with_a_gram_drops_the_gram(self):
+        self.index.remove("Brian Mwangi")
+        self.assertEqual(self.index.search("wang"), [])
+        self.assertNotIn("wan", self.index._grams)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,123 @@
+import os
+import tempfile
+import unittest
+
+from utils.storage import JsonFileBackend, MemoryBackend, SqliteBackend, backend_from_spec
+
+APPOINTMENTS = {
+    'a1': {'patient_name': "Ann", 'date': '2024-03-02', 'time': '09:00'},
+    'a2': {'patient_name': "Bob", 'date': '2024-03-01', 'time': '10:00'},
+    'a3': {'patient_name': "Carol", 'date': '2024-03-02', 'time': '11:00'},
+    'a4': {'patient_name': "Dan", 'date': '2024-03-04', 'time': '08:00'},
+    'a5': {'patient_name': "Eve", 'time': '12:00'},
+}
+
+
+class BackendQueriesMixin:
+    """The Firebase reference behaviour the data layer relies on, checked against each local backend."""
+
+    def make_backend(self):
+        raise NotImplementedError
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp(prefix='pearltrack-test-')
+        self.backend = self.make_backend()
+        self.backend.reference('appointments').set(APPOINTMENTS)
+
+    def ref(self, path=None):
+        return self.backend.reference(path)
+
+    def test_order_by_child_with_range_and_limits(self):
+        by_date = self.ref('appointments').order_by_child('date')
+        # Missing children sort first; ties sort by key
+        self.assertEqual(list(by_date.get()), ['a5', 'a2', 'a1', 'a3', 'a4'])
+        self.assertEqual(list(by_date.start_at('2024-03-02').get()), ['a1', 'a3', 'a4'])
+        self.assertEqual(list(by_date.start_at('2024-03-02').limit_to_first(2).get()), ['a1', 'a3'])
+        self.assertEqual(list(by_date.end_at('2024-03-02').limit_to_last(2).get()), ['a1', 'a3'])
+        self.assertEqual(list(by_date.start_at('2024-03-01').end_at('2024-03-01').get()), ['a2'])
+        self.assertEqual(list(by_date.equal_to('2024-03-02').get()), ['a1', 'a3'])
+        self.assertEqual(by_date.start_at('2025-01-01').get(), {})
+
+    def test_order_by_key_and_value(self):
+        self.ref('counts').set({'10': 3, '9': 1, 'b': 2, 'a': 5})
+        self.assertEqual(list(self.ref('counts').order_by_key().get()), ['9', '10', 'a', 'b'])
+        self.assertEqual(list(self.ref('counts').order_by_key().start_at('a').get()), ['a', 'b'])
+        self.assertEqual(list(self.ref('counts').order_by_value().limit_to_last(2).get()), ['10', 'a'])
+
+    def test_shallow_get_lists_keys_only(self):
+        self.assertEqual(self.ref('appointments').get(shallow=True), {key: True for key in APPOINTMENTS})
+        self.assertEqual(self.ref('appointments/a1/date').get(shallow=True), '2024-03-02')
+
+    def test_multi_path_update_with_increments(self):
+        self.ref().update({
+            'appointment_stats/total': {'.sv': {'increment': 5}},
+            'appointment_stats/by_date/2024-03-02': {'.sv': {'increment': 2}},
+            'appointments/a6': {'patient_name': "Fay", 'date': '2024-03-05'},
+        })
+        self.ref().update({'appointment_stats/total': {'.sv': {'increment': -1}}})
+        self.assertEqual(self.ref('appointment_stats').get(), {'total': 4, 'by_date': {'2024-03-02': 2}})
+        self.assertEqual(self.ref('appointments/a6/patient_name').get(), "Fay")
+        self.assertEqual(self.ref('appointments/a1/patient_name').get(), "Ann")
+
+    def test_deletes_prune_empty_parents(self):
+        self.ref('patients/Ann/records/v1').set({'amount_charged': 100})
+        self.ref().update({'patients/Ann/records/v1': None, 'appointments/a5': None})
+        self.assertIsNone(self.ref('patients').get())
+        self.assertNotIn('a5', self.ref('appointments').get())
+        self.ref('appointments').delete()
+        self.assertIsNone(self.ref().get())
+
+    def test_lists_are_stored_as_objects(self):
+        self.ref('patients/Ann/records').set([{'amount_charged': 100}, None, {'amount_charged': 300}])
+        self.assertEqual(self.ref('patients/Ann/records').get(),
+                         {'0': {'amount_charged': 100}, '2': {'amount_charged': 300}})
+
+    def test_transaction_and_listen(self):
+        events = []
+        registration = self.ref('appointment_stats').listen(events.append)
+        self.assertEqual(self.ref('appointment_stats/total').transaction(lambda total: (total or 0) + 1), 1)
+        self.ref('appointment_stats/total').transaction(lambda total: (total or 0) + 1)
+        registration.close()
+        self.ref('appointment_stats/total').set(10)
+
+        self.assertEqual([(event.path, event.data) for event in events], [('/', None), ('/total', 1), ('/total', 2)])
+
+    def test_push_keys_sort_in_creation_order(self):
+        keys = [self.ref('patients/Ann/records').push({'n': i}).key for i in range(20)]
+        self.assertEqual(list(self.ref('patients/Ann/records').order_by_key().get()), keys)
+
+
+class MemoryBackendTest(BackendQueriesMixin, unittest.TestCase):
+    def make_backend(self):
+        return MemoryBackend()
+
+
+class JsonFileBackendTest(BackendQueriesMixin, unittest.TestCase):
+    def make_backend(self):
+        return JsonFileBackend(os.path.join(self.directory, 'pearltrack.json'))
+
+    def test_data_survives_reopening(self):
+        self.ref('appointment_stats/total').set(5)
+        reopened = JsonFileBackend(os.path.join(self.directory, 'pearltrack.json'))
+        self.assertEqual(reopened.reference('appointment_stats/total').get(), 5)
+        self.assertEqual(reopened.reference('appointments').get(), APPOINTMENTS)
+
+
+class SqliteBackendTest(BackendQueriesMixin, unittest.TestCase):
+    def make_backend(self):
+        return backend_from_spec(f"sqlite:{os.path.join(self.directory, 'pearltrack.db')}")
+
+    def test_data_survives_reopening(self):
+        self.ref('appointment_stats/total').set(5)
+        reopened = SqliteBackend(os.path.join(self.directory, 'pearltrack.db'))
+        self.assertEqual(reopened.reference('appointment_stats/total').get(), 5)
+        self.assertEqual(reopened.reference('appointments').get(), APPOINTMENTS)
+
+    def test_a_plain_value_at_the_top_is_replaced_by_children(self):
+        self.ref('settings').set("old")
+        self.ref('settings/theme').set("dark")
+        self.assertEqual(self.ref('settings').get(), {'theme': "dark"})
+
+
+if __name__ == "__main__":
+    unittest.main()